@@ -0,0 +1,224 @@
+"""A persistent cache of analysis by position, so positions analysed once (say
+the popular ones of an opening) come back straight away next time, in this
+process or any later one:
+
+    python analysis.py --db analysis.sqlite --depth 4 "FEN" ...
+
+Results are kept in SQLite by position key, with the most recently used ones
+also in memory. The database is capped at a number of positions, the least
+recently used going first, and a result only replaces one from a search at
+least as deep."""
+
+import argparse
+import sqlite3
+import sys
+from array import array
+from collections import OrderedDict, namedtuple
+
+from chess import Game, Move, move_to_uci, position_key
+from engine import MATE, MAX_DEPTH, Search, TranspositionTable
+
+# best_move is None and depth MAX_DEPTH for positions with no legal moves,
+# whose status is "checkmate" or "stalemate" (None while the game goes on)
+Analysis = namedtuple(
+    "Analysis", ["key", "best_move", "score", "depth", "legal_moves", "status"]
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis (
+    key INTEGER PRIMARY KEY,
+    best_move INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    legal_moves BLOB NOT NULL,
+    status TEXT,
+    used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS analysis_used ON analysis (used);
+"""
+
+# keep a result unless the new one is from a search at least as deep
+UPSERT = """
+INSERT INTO analysis VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    best_move = excluded.best_move,
+    score = excluded.score,
+    depth = excluded.depth,
+    legal_moves = excluded.legal_moves,
+    status = excluded.status,
+    used = excluded.used
+WHERE excluded.depth >= analysis.depth
+"""
+
+
+def _signed(key):
+    # SQLite integers are signed 64 bit
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+def _unsigned(key):
+    return key + (1 << 64) if key < 0 else key
+
+
+class AnalysisCache:
+    """Analysis results in the SQLite database at path, at most max_positions of
+    them, with the memory_positions most recently used also kept in memory.
+    Searches for analyse() share tt."""
+
+    def __init__(
+        self, path=":memory:", max_positions=1 << 20, memory_positions=4096, tt=None
+    ):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        self.max_positions = max_positions
+        self.memory_positions = memory_positions
+        self.memory = OrderedDict()
+        self.tt = tt if tt is not None else TranspositionTable()
+        # a clock for recency, ticking on every use
+        self.clock = self.db.execute("SELECT MAX(used) FROM analysis").fetchone()[0]
+        self.clock = (self.clock or 0) + 1
+        self.count = self.db.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+        # keys used from memory since the database last heard about it
+        self.touched = {}
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def tick(self):
+        self.clock += 1
+        return self.clock
+
+    def get(self, key):
+        """The Analysis of the position with this key, or None"""
+        if (analysis := self.memory.get(key)) is not None:
+            self.memory.move_to_end(key)
+            self.touched[key] = self.tick()
+            if len(self.touched) >= self.memory_positions:
+                self.flush()
+            return analysis
+        row = self.db.execute(
+            "SELECT best_move, score, depth, legal_moves, status FROM analysis "
+            "WHERE key = ?",
+            (_signed(key),),
+        ).fetchone()
+        if row is None:
+            return None
+        best_move, score, depth, legal_moves, status = row
+        moves = array("H")
+        moves.frombytes(legal_moves)
+        analysis = Analysis(
+            key,
+            Move(best_move) if best_move else None,
+            score,
+            depth,
+            tuple(map(Move, moves)),
+            status,
+        )
+        self.touched[key] = self.tick()
+        self.remember(analysis)
+        return analysis
+
+    def put(self, analysis):
+        """Store analysis unless the position has a deeper result already"""
+        known = self.get(analysis.key)
+        if known is not None and known.depth > analysis.depth:
+            return known
+        self.db.execute(
+            UPSERT,
+            (
+                _signed(analysis.key),
+                analysis.best_move or 0,
+                analysis.score,
+                analysis.depth,
+                array("H", analysis.legal_moves).tobytes(),
+                analysis.status,
+                self.tick(),
+            ),
+        )
+        self.touched.pop(analysis.key, None)
+        if known is None:
+            self.count += 1
+            if self.count > self.max_positions:
+                self.evict()
+        self.db.commit()
+        self.remember(analysis)
+        return analysis
+
+    def remember(self, analysis):
+        self.memory[analysis.key] = analysis
+        self.memory.move_to_end(analysis.key)
+        while len(self.memory) > self.memory_positions:
+            self.memory.popitem(last=False)
+
+    def flush(self):
+        """Tell the database about positions used from memory, so they count as
+        recently used when evicting"""
+        if self.touched:
+            self.db.executemany(
+                "UPDATE analysis SET used = ? WHERE key = ?",
+                [(used, _signed(key)) for key, used in self.touched.items()],
+            )
+            self.db.commit()
+            self.touched.clear()
+
+    def evict(self):
+        """Drop the least recently used positions down to below the cap, with
+        some room to spare so that evicting doesn't happen on every put"""
+        self.flush()
+        excess = self.count - self.max_positions + self.max_positions // 16
+        evicted = self.db.execute(
+            "DELETE FROM analysis WHERE key IN "
+            "(SELECT key FROM analysis ORDER BY used LIMIT ?) RETURNING key",
+            (excess,),
+        ).fetchall()
+        for (key,) in evicted:
+            self.memory.pop(_unsigned(key), None)
+        self.count -= len(evicted)
+
+    def analyse(self, game, depth):
+        """Analysis of game's position to at least depth, from the cache if it
+        has it and otherwise searched and stored"""
+        key = position_key(game.snapshot())
+        if (analysis := self.get(key)) is not None and analysis.depth >= depth:
+            return analysis
+        moves = game.legal_moves
+        if not moves:
+            # same outcomes as Game.game_over, but the game's forfeit flag
+            # isn't part of the position
+            if game.whose_turn.king.in_check:
+                analysis = Analysis(key, None, -MATE, MAX_DEPTH, (), "checkmate")
+            else:
+                analysis = Analysis(key, None, 0, MAX_DEPTH, (), "stalemate")
+        else:
+            info = Search(game, depth=depth, tt=self.tt).run()
+            best = info.lines[0]
+            analysis = Analysis(key, best.move, best.score, depth, tuple(moves), None)
+        return self.put(analysis)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("fen", nargs="+")
+    parser.add_argument("--db", default="analysis.sqlite")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--max-positions", type=int, default=1 << 20)
+    args = parser.parse_args(argv)
+    cache = AnalysisCache(args.db, args.max_positions)
+    try:
+        for fen in args.fen:
+            analysis = cache.analyse(Game.from_fen(fen), args.depth)
+            if analysis.status:
+                print(f"{fen}: {analysis.status}")
+            else:
+                print(
+                    f"{fen}: {move_to_uci(analysis.best_move)} score {analysis.score} "
+                    f"depth {analysis.depth}, {len(analysis.legal_moves)} legal moves"
+                )
+    finally:
+        cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
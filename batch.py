@@ -0,0 +1,55 @@
+from multiprocessing import Pool
+
+from chess import Game, move_to_uci
+
+# batches smaller than this are evaluated in-process, where starting workers
+# would cost more than it saves
+PARALLEL_THRESHOLD = 256
+
+# one Game per process, set up again for every position it evaluates
+_game = None
+
+
+def evaluate(game):
+    """Legal moves (in UCI notation), check and game-over status of game's position"""
+    moves = game.legal_moves
+    in_check = game.whose_turn.king.in_check
+    status = None
+    if not moves:
+        status = "checkmate" if in_check else "stalemate"
+    return {
+        "fen": game.fen,
+        "legal_moves": [move_to_uci(m) for m in moves],
+        "in_check": in_check,
+        "game_over": status,
+    }
+
+
+def _evaluate_fens(fens):
+    global _game
+    if _game is None:
+        _game = Game()
+    results = []
+    for fen in fens:
+        _game.set_fen(fen)
+        results.append(evaluate(_game))
+    return results
+
+
+def evaluate_positions(positions, processes=None, chunksize=64, pool=None):
+    """Evaluate many positions, given as FEN strings or Games, returning a list of
+    evaluate() results in the same order.
+
+    Rather than building a Game per position, each process sets up every position
+    it's given on a single Game. Batches of at least PARALLEL_THRESHOLD positions
+    are split into chunks of chunksize and spread over a pool of processes
+    (os.cpu_count() by default, processes=1 to stay in-process). Services handling
+    many batches should pass a long-lived multiprocessing pool to reuse instead."""
+    fens = [p if isinstance(p, str) else p.fen for p in positions]
+    if processes == 1 or len(fens) < PARALLEL_THRESHOLD:
+        return _evaluate_fens(fens)
+    chunks = [fens[i : i + chunksize] for i in range(0, len(fens), chunksize)]
+    if pool is not None:
+        return [r for chunk in pool.map(_evaluate_fens, chunks) for r in chunk]
+    with Pool(processes) as pool:
+        return [r for chunk in pool.map(_evaluate_fens, chunks) for r in chunk]
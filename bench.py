@@ -0,0 +1,159 @@
+"""Replay benchmark: times move generation, game-over checks and moves for every
+ply of a corpus of PGN games (the bundled famous games by default), and compares
+the results with a saved baseline so that slowdowns fail the run."""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+from chess import Game, translate_algebraic
+from pgn import read_games
+
+OPERATIONS = ["move_generation", "game_over", "make_move"]
+BUNDLED_GAMES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.pgn")))
+
+
+def corpus_games(paths):
+    for path in paths:
+        yield from read_games(path)
+
+
+def replay_timed(moves, timings):
+    """Replay one game's moves, appending the seconds taken by each operation at
+    every ply to the lists in timings. Returns the number of plies played."""
+    game = Game()
+    for move in moves:
+        player = game.whose_turn
+        start = perf_counter()
+        player.legal_moves_all
+        timings["move_generation"].append(perf_counter() - start)
+        start = perf_counter()
+        game.game_over
+        timings["game_over"].append(perf_counter() - start)
+        start = perf_counter()
+        player.make_move(**translate_algebraic(move))
+        timings["make_move"].append(perf_counter() - start)
+        game.turn += 1
+    return len(moves)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(paths, repeat=3):
+    """Benchmark replaying every game in the PGN files at paths. The whole corpus
+    is replayed repeat times and the timings of the fastest run are kept."""
+    games = [game.moves for game in corpus_games(paths)]
+    best = None
+    for _ in range(repeat):
+        timings = {operation: [] for operation in OPERATIONS}
+        plies = 0
+        start = perf_counter()
+        for moves in games:
+            plies += replay_timed(moves, timings)
+        seconds = perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = seconds, timings
+    seconds, timings = best
+    # measuring memory slows everything down, so it gets a run of its own
+    tracemalloc.start()
+    for moves in games:
+        replay_timed(moves, {operation: [] for operation in OPERATIONS})
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "games": len(games),
+        "plies": plies,
+        "seconds": seconds,
+        "plies_per_second": plies / seconds,
+        "peak_memory_bytes": peak_memory,
+        "operations": {
+            operation: {
+                "p50_ms": percentile(times, 0.5) * 1000,
+                "p99_ms": percentile(times, 0.99) * 1000,
+                "total_ms": sum(times) * 1000,
+            }
+            for operation, times in timings.items()
+        },
+    }
+
+
+def compare(result, baseline, tolerance=0.1):
+    """List the ways result is more than tolerance (a fraction) worse than
+    baseline: lower plies/sec, higher p50/p99 latency or higher peak memory"""
+    regressions = []
+
+    def check(name, value, reference, higher_is_better=False):
+        if higher_is_better:
+            worse = value < reference * (1 - tolerance)
+        else:
+            worse = value > reference * (1 + tolerance)
+        if worse:
+            regressions.append(f"{name}: {value:.4g} vs baseline {reference:.4g}")
+
+    check(
+        "plies_per_second",
+        result["plies_per_second"],
+        baseline["plies_per_second"],
+        higher_is_better=True,
+    )
+    check(
+        "peak_memory_bytes", result["peak_memory_bytes"], baseline["peak_memory_bytes"]
+    )
+    for operation, stats in result["operations"].items():
+        for stat in ["p50_ms", "p99_ms"]:
+            check(
+                f"{operation} {stat}",
+                stats[stat],
+                baseline["operations"][operation][stat],
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "pgn", nargs="*", help="PGN files to replay (default: bundled games)"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with results saved by --save")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="fraction a measurement may be worse than the baseline (default 0.1)",
+    )
+    args = parser.parse_args(argv)
+    result = run(args.pgn or BUNDLED_GAMES, args.repeat)
+    print(
+        f"{result['games']} games, {result['plies']} plies: "
+        f"{result['plies_per_second']:.1f} plies/sec, "
+        f"peak memory {result['peak_memory_bytes'] / 1024:.0f} KiB"
+    )
+    for operation, stats in result["operations"].items():
+        print(
+            f"  {operation:<16} p50 {stats['p50_ms']:.3f} ms  p99 {stats['p99_ms']:.3f} ms"
+        )
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
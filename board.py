@@ -1,3 +1,5 @@
+from square import FILES, SQUARE_AT, SQUARES
+
 BLACK = {
     "king": "♔",
     "queen": "♕",
@@ -22,7 +24,7 @@ BLACK_SETUP = ["e8", "d8", "a8", "h8", "b8", "g8", "c8", "f8"] + [
 ]
 COLOR = {"white": WHITE, "black": BLACK}
 OPPOSITE_COLOR = {"white": BLACK, "black": WHITE}
-ALGEBRAIC_X = "abcdefgh"
+ALGEBRAIC_X = FILES
 
 
 class Board:
@@ -30,10 +32,10 @@ class Board:
         self.pieces = {}  # store board state by piece
         self.board = {}  # store board state by square
         self.removed = []
-        for y in range(8):
-            for x in range(8):
-                square = ALGEBRAIC_X[x] + str(y + 1)
-                self.board[square] = None
+        # threatened_squares for the current position, until a piece moves
+        self._threatened = None
+        for square in SQUARES:
+            self.board[square.name] = None
 
     def add_piece(self, piece, coord):
         assert coord in self.board
@@ -43,6 +45,7 @@ class Board:
             self.removed.remove(piece)
         self.pieces[piece] = coord
         self.board[coord] = piece
+        self._threatened = None
 
     def remove_piece(self, piece):
         assert piece in self.pieces
@@ -50,6 +53,7 @@ class Board:
         self.board[square] = None
         del self.pieces[piece]
         self.removed.append(piece)
+        self._threatened = None
 
     def move_piece(self, piece, coord):
         assert piece in self.pieces
@@ -59,15 +63,22 @@ class Board:
         self.board[self.pieces[piece]] = None  # remove link to piece from old square
         self.pieces[piece] = coord
         self.board[coord] = piece
+        self._threatened = None
 
     @property
     def threatened_squares(self):
-        # threatened squares are named for the side being threatened
-        threatened = {"black": set(), "white": set()}
-        for piece in self.pieces:
-            for move in piece.can_take:
-                threatened["black" if piece.color == "white" else "white"].add(move)
-        return threatened
+        """Squares attacked by each side, named for the side being threatened.
+        Worked out once per position: adding, moving or removing a piece starts
+        over."""
+        if self._threatened is None:
+            threatened = {"black": set(), "white": set()}
+            for piece in self.pieces:
+                for move in piece.can_take:
+                    threatened["black" if piece.color == "white" else "white"].add(move)
+            self._threatened = {
+                color: frozenset(squares) for color, squares in threatened.items()
+            }
+        return self._threatened
 
     def __str__(self):
         black_on_white = "\u001b[47m\u001b[30m"  # ]]
@@ -77,7 +88,7 @@ class Board:
             string += str(y + 1) + " --"
             for x in range(8):
                 string += black_on_white if (x + y) % 2 == 0 else ""
-                square = "abcdefgh"[x] + str(y + 1)
+                square = SQUARE_AT[x][y].name
                 if self.board[square]:
                     string += self.board[square].board_display((x + y) % 2 == 0) + " "
                 else:
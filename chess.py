@@ -1,20 +1,221 @@
+from collections import namedtuple
+from hashlib import blake2b
+
 from piece import *
+from square import FILE_INDEX, RANK_INDEX, SQUARE_AT, SQUARES, Square, square
+import profiling
+import render
+from profiling import profiled
 
 
 class Game:
-    def __init__(self):
-        self.board = Board(self)
+    def __init__(self, setup=True):
+        # setup=False leaves the board empty for restore() or set_fen() to fill
+        self.board = Board(self, setup)
         self.turn = 0
         self.forfeit = False
+        self.profiler = None
+        self.history = []
+        # players moved by the computer, by color: anything with a
+        # choose_move(game) method, such as an engine.EnginePlayer
+        self.engines = {}
+        # a journal.Journal recording every move made, if the game is being saved
+        self.journal = None
+        # draws the board between turns: anything with a draw(board) method, such
+        # as a render.TerminalRenderer, or None to print it in full
+        self.renderer = None
+
+    def enable_profiling(self, per_turn=False):
+        """Start counting calls to and time spent in move generation hot paths.
+        Returns the Profiler collecting the counters for this game."""
+        return profiling.enable(self, per_turn)
+
+    def disable_profiling(self):
+        return profiling.disable(self)
 
     @property
     def whose_turn(self):
         return self.board.players["white" if self.turn % 2 == 0 else "black"]
 
+    @classmethod
+    def from_fen(cls, fen):
+        game = cls()
+        game.set_fen(fen)
+        return game
+
+    def set_fen(self, fen):
+        """Set up the position described by a FEN string (or the first four fields
+        of an EPD line), reusing this game's pieces rather than building new ones"""
+        fields = fen.split()
+        ranks = fields[0].split("/") if fields else []
+        if len(fields) < 4 or len(ranks) != 8 or fields[1] not in ("w", "b"):
+            raise ValueError(f"invalid FEN {fen}")
+        placement = {}
+        for y, rank in zip(reversed(range(8)), ranks):
+            x = 0
+            for char in rank:
+                if char in "12345678":
+                    x += int(char)
+                elif char in FEN_PIECES and x < 8:
+                    placement[(x, y)] = FEN_PIECES[char]
+                    x += 1
+                else:
+                    raise ValueError(f"invalid character {char} in FEN {fen}")
+            if x != 8:
+                raise ValueError(f"invalid rank {rank} in FEN {fen}")
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+        turn = 2 * (fullmove - 1) + (1 if fields[1] == "b" else 0)
+        en_passant = None if fields[3] == "-" else algebraic_to_coord(fields[3])
+        self._set_up(placement, turn, fields[2].replace("-", ""), en_passant)
+
+    def _set_up(self, placement, turn, castling_rights, en_passant):
+        self.turn = turn
+        self.forfeit = False
+        self.board.set_position(placement, castling_rights)
+        if en_passant:
+            x, y = en_passant
+            pawn = self.board[x, 3 if y == 2 else 4]
+            if y not in (2, 5) or pawn is None or pawn.type != "pawn":
+                raise ValueError(f"invalid en passant square {en_passant}")
+            pawn.double_step = self.turn - 1
+
+    def snapshot(self):
+        """Capture the current position as an immutable Snapshot, cheap to store,
+        hash, compare and send to other processes"""
+        placement = bytearray(EMPTY_PLACEMENT)
+        for player in self.board.players.values():
+            for piece in player.pieces:
+                if piece.pos:
+                    x, y = piece.pos
+                    placement[y * 8 + x] = SNAPSHOT_CODES[player.color, piece.type]
+        return Snapshot(
+            bytes(placement), self.turn, self.castling_rights, self.en_passant
+        )
+
+    def restore(self, snapshot):
+        """Return to the position captured by snapshot, reusing this game's pieces"""
+        placement = {
+            SQUARES[i]: SNAPSHOT_PIECES[code]
+            for i, code in enumerate(snapshot.placement)
+            if code != EMPTY_CODE
+        }
+        self._set_up(
+            placement, snapshot.turn, snapshot.castling_rights, snapshot.en_passant
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        # pieces are only made for what the position has on the board
+        game = cls(setup=False)
+        game.restore(snapshot)
+        return game
+
+    @property
+    def fen(self):
+        """FEN string for the current position. The halfmove clock isn't tracked,
+        so that field is always 0."""
+        rows = []
+        for y in reversed(range(8)):
+            row, empty = "", 0
+            for x in range(8):
+                piece = self.board[x][y]
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row, empty = row + str(empty), 0
+                row += FEN_LETTERS[piece.player.color, piece.type]
+            rows.append(row + (str(empty) if empty else ""))
+        en_passant = self.en_passant
+        return " ".join(
+            [
+                "/".join(rows),
+                "w" if self.turn % 2 == 0 else "b",
+                self.castling_rights or "-",
+                coord_to_algebraic(en_passant) if en_passant else "-",
+                "0",
+                str(self.turn // 2 + 1),
+            ]
+        )
+
+    @property
+    def legal_moves(self):
+        """All legal moves of the player whose turn it is, as Moves. Castling is
+        given as the king's two square move."""
+        player = self.whose_turn
+        moves = []
+        for piece, coords in player.legal_moves_all.items():
+            x, y = piece.pos
+            start = y * 8 + x
+            promotes = piece.type == "pawn"
+            for x, y in coords:
+                move = start | (y * 8 + x) << 6
+                if promotes and y in (0, 7):
+                    moves.extend(Move(move | code << 12) for code in (1, 2, 3, 4))
+                else:
+                    moves.append(Move(move))
+        for side in player.king.can_castle:
+            x, y = player.king.pos
+            moves.append(
+                Move(y * 8 + x | (y * 8 + (2 if side == "queenside" else 6)) << 6)
+            )
+        return moves
+
+    def play_move(self, move):
+        """Play a Move (or (start, coord, promotion) tuple) as listed by
+        legal_moves, checking that it is legal first"""
+        self.moved(self.whose_turn.make_move(move))
+
+    def moved(self, move):
+        """Pass the turn after a Move was made, recording it in the journal if
+        the game has one"""
+        self.turn += 1
+        if self.journal is not None:
+            self.journal.append(move)
+
+    def push(self, move):
+        """Play a move from legal_moves without checking it, remembering the
+        position before it so pop() can take it back"""
+        self.history.append(self.snapshot())
+        start, coord, promotion = move
+        self.whose_turn.move(self.board[start], coord, promotion)
+        self.turn += 1
+
+    def pop(self):
+        """Take back the last move played with push()"""
+        self.restore(self.history.pop())
+
+    @property
+    def castling_rights(self):
+        """Remaining castling rights in FEN order, e.g. "KQkq" ("" if none)"""
+        rights = ""
+        for color, sides in (("white", "KQ"), ("black", "kq")):
+            player = self.board.players[color]
+            if player.king.moved or not player.king.pos:
+                continue
+            for side, rook in zip(sides, (player["krook"], player["qrook"])):
+                if not rook.moved and rook.pos:
+                    rights += side
+        return rights
+
+    @property
+    def en_passant(self):
+        """The square a pawn skipped over with a double step last turn, or None"""
+        for piece in self.whose_turn.other_player.pieces:
+            if (
+                piece.type == "pawn"
+                and piece.pos
+                and piece.double_step is not None
+                and piece.double_step == self.turn - 1
+            ):
+                x, y = piece.pos
+                return (x, y - 1 if piece.player.color == "white" else y + 1)
+        return None
+
     @property
     def game_over(self):
         player = self.whose_turn
-        if not player.legal_moves_all:
+        if not player.has_legal_move:
             if player.king.in_check:
                 return "checkmate"
             else:
@@ -28,11 +229,19 @@ class Game:
             raise RuntimeError("play_turn called after game is over")
         if coord:
             # automatic turn play via function call for testing purposes
-            player.make_move(**translate_algebraic(coord))
-            self.turn += 1
+            self.moved(player.make_move(**translate_algebraic(coord)))
             return
-        print()
-        print(self.board)
+        if player.color in self.engines:
+            engine = self.engines[player.color]
+            move = engine.choose_move(self)
+            if getattr(engine, "flagged", False):
+                # out of time: losing on time counts as a forfeit
+                self.forfeit = True
+                return
+            print(f"{player} plays {move_to_uci(move)}")
+            self.play_move(move)
+            return
+        self.show_board()
         print(f"Turn {((self.turn) // 2) + 1}")
         if player.king.in_check:
             print(str(player) + "is in check!")
@@ -43,19 +252,24 @@ class Game:
                 if play == "F":
                     self.forfeit = True
                     break
-                player.make_move(**translate_algebraic(play))
-                self.turn += 1
+                self.moved(player.make_move(**translate_algebraic(play)))
                 break
             except (AssertionError, ValueError) as e:
                 print(e)
 
+    def show_board(self):
+        if self.renderer is not None:
+            self.renderer.draw(self.board)
+        else:
+            print()
+            print(self.board)
+
     def play_game(self):
         print("Welcome to Chess!")
         while True:
             if self.game_over:
                 player = self.whose_turn
-                print()
-                print(self.board)
+                self.show_board()
                 if self.game_over == "checkmate":
                     print(f"Checkmate! {player.other_player} wins!")
                 elif self.game_over == "forfeit":
@@ -66,6 +280,55 @@ class Game:
             self.play_turn()
 
 
+def replay(moves, game=None):
+    """Play a sequence of algebraic moves, yielding the game in every position
+    along the way, starting with the one before the first move"""
+    game = game or Game()
+    yield game
+    for move in moves:
+        game.play_turn(move)
+        yield game
+
+
+def coord_to_algebraic(coord):
+    x, y = coord
+    return SQUARE_AT[x][y].name
+
+
+def algebraic_to_coord(name):
+    """The Square with an algebraic name such as "e4" """
+    return square(name)
+
+
+def position_key(snapshot):
+    """64 bit hash of the position in a snapshot, ignoring the move number. Unlike
+    hash() it is the same in every process."""
+    placement, turn, castling_rights, en_passant = snapshot
+    state = f"{turn % 2}{castling_rights}{en_passant or ''}".encode()
+    return int.from_bytes(blake2b(placement + state, digest_size=8).digest(), "little")
+
+
+def move_to_uci(move):
+    """Format a Move in UCI long algebraic notation, e.g. e7e8q"""
+    start, coord, promotion = move
+    return (
+        coord_to_algebraic(start)
+        + coord_to_algebraic(coord)
+        + (PROMOTION_LETTERS[promotion] if promotion else "")
+    )
+
+
+def uci_to_move(uci):
+    """Parse a move in UCI long algebraic notation into a Move"""
+    if len(uci) not in (4, 5) or (len(uci) == 5 and uci[4] not in PROMOTION_PIECES):
+        raise ValueError(f"invalid move {uci}")
+    promotion = PROMOTION_PIECES[uci[4]] if len(uci) == 5 else None
+    start, coord = algebraic_to_coord(uci[:2]), algebraic_to_coord(uci[2:4])
+    if start == coord:
+        raise ValueError(f"invalid move {uci}")
+    return Move.of(start, coord, promotion)
+
+
 def translate_algebraic(alg_coord):
     translated = {
         entry: None
@@ -78,8 +341,13 @@ def translate_algebraic(alg_coord):
             translated["castle_side"] = "kingside"
         return translated
     pieces = {"K": King, "Q": Queen, "R": Rook, "B": Bishop, "N": Knight}
-    xs = "abcdefgh"
-    ys = "12345678"
+    xs, ys = FILE_INDEX, RANK_INDEX
+
+    def piece_type(letter):
+        if letter not in pieces:
+            raise ValueError(f"invalid piece {letter} in coordinate {alg_coord}")
+        return pieces[letter]
+
     if len(alg_coord) == 2:
         translated["piece_type"] = Pawn
         coord = alg_coord
@@ -94,32 +362,37 @@ def translate_algebraic(alg_coord):
         elif alg_coord[0] in xs:
             translated["piece_type"] = Pawn
             coord = alg_coord[1:]
-            translated["file"] = xs.index(alg_coord[0])
+            translated["file"] = xs[alg_coord[0]]
         elif alg_coord[0] in ys:
             translated["piece_type"] = Pawn
-            translated["rank"] = ys.index(alg_coord[0])
+            translated["rank"] = ys[alg_coord[0]]
             coord = alg_coord[1:]
         else:
             raise ValueError(
                 f"invalid character {alg_coord[0]} in coordinate {alg_coord}"
             )
+    elif len(alg_coord) == 4 and alg_coord[0] in xs and alg_coord[-1] in pieces:
+        # pawn capture with promotion, e.g. ed8Q
+        translated["piece_type"] = Pawn
+        translated["file"] = xs[alg_coord[0]]
+        translated["promotion"] = pieces[alg_coord[-1]]
+        coord = alg_coord[1:3]
     elif len(alg_coord) == 4:
-        translated["piece_type"] = pieces[alg_coord[0]]
+        translated["piece_type"] = piece_type(alg_coord[0])
         if alg_coord[1] in xs:
-            translated["file"] = xs.index(alg_coord[1])
+            translated["file"] = xs[alg_coord[1]]
         elif alg_coord[1] in ys:
-            translated["rank"] = ys.index(alg_coord[1])
+            translated["rank"] = ys[alg_coord[1]]
         else:
             raise ValueError(
                 f"invalid character {alg_coord[1]} in coordinate {alg_coord}"
             )
         coord = alg_coord[2:]
     elif len(alg_coord) == 5:
-        translated["piece_type"] = pieces[alg_coord[0]]
+        translated["piece_type"] = piece_type(alg_coord[0])
         if alg_coord[1] in xs and alg_coord[2] in ys:
-            translated["file"], translated["rank"] = xs.index(alg_coord[1]), ys.index(
-                alg_coord[2]
-            )
+            translated["file"] = xs[alg_coord[1]]
+            translated["rank"] = ys[alg_coord[2]]
         else:
             raise ValueError(
                 f"invalid characters {alg_coord[1:3]} in coordinate {alg_coord}"
@@ -128,19 +401,19 @@ def translate_algebraic(alg_coord):
     else:
         raise ValueError(f"invalid coordinate {alg_coord}")
     if coord:
-        translated["coord"] = xs.index(coord[0]), ys.index(coord[1])
+        translated["coord"] = square(coord)
     return translated
 
 
 class Board:
-    def __init__(self, game):
+    def __init__(self, game, setup=True):
         self.game = game
-        self.board = []
-        for x in range(8):
-            self.board.append([])
-            for y in range(8):
-                self.board[x].append(None)
-        self.players = {color: Player(self, color) for color in ["white", "black"]}
+        self.board = [[None] * 8 for x in range(8)]
+        # pieces whose cached potential moves depend on each square
+        self.dependents = [[set() for y in range(8)] for x in range(8)]
+        self.players = {
+            color: Player(self, color, setup) for color in ["white", "black"]
+        }
 
     def add_piece(self, piece, coord):
         assert piece.pos is None, "attempted to add a piece already on the board"
@@ -150,7 +423,8 @@ class Board:
         self[coord] = piece
         if piece in piece.player.removed:
             piece.player.removed.remove(piece)
-        piece.pos = coord
+        x, y = coord
+        piece.pos = SQUARE_AT[x][y]
 
     def move_piece(self, piece, coord):
         assert piece.pos, "attempted to move a piece not on the board"
@@ -160,7 +434,8 @@ class Board:
         self[coord] = piece
         old_pos = piece.pos
         self[old_pos] = None
-        piece.pos = coord
+        x, y = coord
+        piece.pos = SQUARE_AT[x][y]
 
     def remove_piece(self, piece):
         if isinstance(piece, tuple):
@@ -171,6 +446,7 @@ class Board:
         piece.pos = None
         piece.player.removed.append(piece)
 
+    @profiled("Board.test_move", lambda board: board.game)
     def test_move(self, piece, coord):
         """Preview a move and return whether it results in self-check"""
         player = piece.player
@@ -180,7 +456,7 @@ class Board:
             and abs(piece.pos[0] - coord[0]) != 0
             and self[coord] == None
         ):
-            other_coord = (coord[0], piece.pos[1])
+            other_coord = SQUARE_AT[coord[0]][piece.pos[1]]
             other = self[other_coord]
             self.remove_piece(other)
         else:
@@ -193,9 +469,23 @@ class Board:
             self.add_piece(other, other_coord)
         return valid
 
+    def set_position(self, placement, castling_rights=""):
+        """Replace the position on the board with placement, a dict of coords to
+        (color, piece type) pairs, reusing the players' Piece objects"""
+        for column in self.board:
+            column[:] = EMPTY_COLUMN
+        for column in self.dependents:
+            for dependents in column:
+                dependents.clear()
+        by_color = {"white": {}, "black": {}}
+        for coord, (color, piece_type) in placement.items():
+            by_color[color][coord] = piece_type
+        for color, player in self.players.items():
+            player.set_pieces(by_color[color], castling_rights)
+
     def checkered_square(self, coord):
         x, y = coord
-        return (x + y) % 2 == 0
+        return SQUARE_AT[x][y].color == "black"
 
     def __getitem__(self, i):
         if isinstance(i, int):
@@ -204,7 +494,8 @@ class Board:
             x, y = i
             return self.board[x][y]
         if isinstance(i, str):
-            return self.board["abcdefgh".index(i[0])]["12345678".index(i[1])]
+            x, y = square(i)
+            return self.board[x][y]
 
     def __setitem__(self, i, item):
         if isinstance(i, int):
@@ -212,25 +503,15 @@ class Board:
         elif isinstance(i, tuple):
             x, y = i
             self.board[x][y] = item
+            if dependents := self.dependents[x][y]:
+                for piece in dependents:
+                    piece._moves = None
+                dependents.clear()
         else:
             raise IndexError(f"invalid format to access board: {i}")
 
     def __str__(self):
-        black_on_white = "\u001b[47m\u001b[30m"  # ]]
-        reset = "\u001b[0m"  # ]
-        string = ""
-        for y in reversed(range(8)):
-            string += str(y + 1) + " --"
-            for x in range(8):
-                string += black_on_white if (x + y) % 2 == 0 else ""
-                if self.board[x][y]:
-                    string += str(self.board[x][y]) + " "
-                else:
-                    string += "  "
-                string += reset if (x + y) % 2 == 0 else ""
-            string += "\n" if y > 0 else "\n  *  " + " ".join("|" * 8)
-        string += "\n" + " " * 5 + " ".join(list("abcdefgh"))
-        return string
+        return render.text(self)
 
 
 SETUP = {
@@ -258,19 +539,99 @@ SETUP = {
     | {f"pawn_{i}": (Pawn, (i, 6)) for i in range(8)},
 }
 
+STARTPOS = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+PIECE_TYPES = {p.type: p for p in [King, Queen, Rook, Bishop, Knight, Pawn]}
+PROMOTIONS = [Queen, Rook, Bishop, Knight]
+PROMOTION_LETTERS = {Queen: "q", Rook: "r", Bishop: "b", Knight: "n"}
+PROMOTION_PIECES = {letter: piece for piece, letter in PROMOTION_LETTERS.items()}
+FEN_LETTERS = {
+    (color, piece_type): letter.upper() if color == "white" else letter
+    for color in ["white", "black"]
+    for piece_type, letter in [
+        ("king", "k"),
+        ("queen", "q"),
+        ("rook", "r"),
+        ("bishop", "b"),
+        ("knight", "n"),
+        ("pawn", "p"),
+    ]
+}
+FEN_PIECES = {letter: piece for piece, letter in FEN_LETTERS.items()}
+
+# a Snapshot's placement has a byte per square (index y * 8 + x) holding the
+# piece's FEN letter, or "." for an empty square
+Snapshot = namedtuple(
+    "Snapshot", ["placement", "turn", "castling_rights", "en_passant"]
+)
+SNAPSHOT_CODES = {piece: ord(letter) for piece, letter in FEN_LETTERS.items()}
+SNAPSHOT_PIECES = {code: piece for piece, code in SNAPSHOT_CODES.items()}
+EMPTY_CODE = ord(".")
+EMPTY_PLACEMENT = bytes([EMPTY_CODE] * 64)
+EMPTY_COLUMN = [None] * 8
+# promotions as stored in the top bits of a Move, 0 meaning no promotion
+PROMOTION_CODES = {piece: i for i, piece in enumerate(PROMOTIONS, 1)}
+CODE_PROMOTIONS = [None] + PROMOTIONS
+
+
+class Move(int):
+    """A move packed into 16 bits: the start square (y * 8 + x) in bits 0-5, the
+    destination square in bits 6-11 and the promotion in bits 12-14. Castling (the
+    king's two square move) and en passant are recognised from the board, so no
+    other flags are needed, and no move is ever 0.
+
+    Moves are ints, so cheap to store, hash and compare, and unpack into
+    (start, coord, promotion) like the tuples other code may pass instead."""
+
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, start, coord, promotion=None):
+        (x1, y1), (x2, y2) = start, coord
+        return cls(
+            y1 * 8 + x1 | (y2 * 8 + x2) << 6 | PROMOTION_CODES.get(promotion, 0) << 12
+        )
+
+    @property
+    def start(self):
+        return SQUARES[self & 63]
+
+    @property
+    def coord(self):
+        return SQUARES[self >> 6 & 63]
+
+    @property
+    def promotion(self):
+        return CODE_PROMOTIONS[self >> 12]
+
+    def __iter__(self):
+        return iter(
+            (
+                SQUARES[self & 63],
+                SQUARES[self >> 6 & 63],
+                CODE_PROMOTIONS[self >> 12],
+            )
+        )
+
+    def __repr__(self):
+        return f"Move({move_to_uci(self)})"
+
 
 class Player:
-    def __init__(self, board, color):
+    def __init__(self, board, color, setup=True):
+        """Set out the player's pieces on their starting squares. Without setup
+        only the king and rooks, which castling looks up by name, are made, off
+        the board, for set_pieces to place."""
         self.board = board
         self.color = color
         self.pieces = []
         self.pieces_dict = {}
         self.removed = []
-        setup = SETUP[self.color]
-        for entry in setup:
-            p, coord = setup[entry]
+        for entry, (p, coord) in SETUP[self.color].items():
+            if not setup and entry not in ("king", "qrook", "krook"):
+                continue
             piece = p(self)
-            self.board.add_piece(piece, coord)
+            if setup:
+                self.board.add_piece(piece, coord)
             self.pieces.append(piece)
             self.pieces_dict[entry] = piece
             if isinstance(piece, King):
@@ -283,15 +644,62 @@ class Player:
         elif self.color == "black":
             return self.board.players["white"]
 
-    def make_move(self, piece_type, coord, file, rank, promotion, castle_side):
+    @profiled("Player.make_move", lambda player: player.board.game)
+    def make_move(
+        self,
+        move=None,
+        piece_type=None,
+        coord=None,
+        file=None,
+        rank=None,
+        promotion=None,
+        castle_side=None,
+    ):
+        """Make a move given as a Move, which is checked to be legal with a single
+        self-check test and no search for the piece making it, or as the fields
+        of a translate_algebraic move. Returns the Move made."""
+        if move is None:
+            start, coord, promotion = self.resolve_move(
+                piece_type, coord, file, rank, promotion, castle_side
+            )
+            self.move(self.board[start], coord, promotion)
+            return Move.of(start, coord, promotion)
+        start, coord, promotion = move
+        piece = self.board[start]
+        if piece is None or piece.player is not self:
+            raise ValueError(f"{self} has no piece on {coord_to_algebraic(start)}")
+        if promotion and (piece.type != "pawn" or coord[1] not in (0, 7)):
+            raise ValueError("Promotion specified when inappropriate")
+        if castle_side := self.castle_side(piece, coord):
+            if castle_side not in piece.can_castle:
+                raise ValueError(f"Cannot castle to {coord_to_algebraic(coord)}.")
+        else:
+            target = self.board[coord]
+            if (
+                coord not in piece.potential_moves
+                or (target is not None and target.player is self)
+                or not self.board.test_move(piece, coord)
+            ):
+                raise ValueError(f"{piece} can't move to {coord_to_algebraic(coord)}")
+        self.move(piece, coord, promotion)
+        return Move.of(start, coord, promotion)
+
+    def resolve_move(self, piece_type, coord, file, rank, promotion, castle_side):
+        """The Move described by the fields of a translate_algebraic move, which
+        must be legal and unambiguous"""
         if castle_side:
             if castle_side in self.king.can_castle:
-                self.castle(castle_side)
-                return
+                x, y = self.king.pos
+                return Move.of((x, y), (2 if castle_side == "queenside" else 6, y))
             raise ValueError(f"Cannot castle {castle_side}.")
         can_move = []
+        evasions = self.evasions
         for p in self.pieces:
-            if isinstance(p, piece_type) and p.pos and coord in p.legal_moves:
+            if (
+                isinstance(p, piece_type)
+                and p.pos
+                and coord in p.legal_moves_within(evasions)
+            ):
                 if file is not None and rank is not None:
                     if p.pos == (file, rank):
                         can_move.append(p)
@@ -304,38 +712,111 @@ class Player:
                 else:
                     can_move.append(p)
         if len(can_move) == 1:
-            piece = can_move[0]
-            if piece.type == "pawn":
-                # if double stepping, remember which turn it happened
-                if piece.moved == False and abs(piece.pos[1] - coord[1]) == 2:
-                    piece.double_step = self.board.game.turn
-                # if x axis changes, means diagonal step
-                elif abs(piece.pos[0] - coord[0]) != 0:
-                    # if square being moved to is empty, must be en passant
-                    if self.board[coord] is None:
-                        # remove pawn being taken en passant
-                        self.board.remove_piece((coord[0], piece.pos[1]))
-                # if pawn moving to last row, check if promotion is specified and promote if so
-                if coord[1] == (7 if piece.player.color == "white" else 0):
-                    if not promotion:
-                        raise ValueError("please specify promotion")
-                    self.promote(piece, coord, promotion)
-                    return
-                # promotion shouldn't be specified unless moving to last row
-                elif promotion:
-                    raise ValueError("Promotion specified when inappropriate")
-            self.board.move_piece(piece, coord)
-            piece.moved = True
+            return Move.of(can_move[0].pos, coord, promotion)
         elif len(can_move) > 1:
             raise ValueError(f"multiple pieces can make that move: {can_move}")
         else:
-            if rank or file:
+            if rank is not None or file is not None:
+                where = []
+                if file is not None:
+                    where.append("file " + "abcdefgh"[file])
+                if rank is not None:
+                    where.append("rank " + "12345678"[rank])
                 raise ValueError(
-                    f"No {piece_type.type}s on {('file ' + 'abcdefg'[file]) if file else ''}"
-                    + f"{('rank ' + '12345678'[rank]) if rank else ''} can move to {coord}"
+                    f"No {piece_type.type}s on {' '.join(where)} can move to {coord}"
                 )
             raise ValueError(f"No {piece_type.type}s can move to {coord}")
 
+    def set_pieces(self, placement, castling_rights=""):
+        """Put this player's pieces on the (cleared) squares given by placement, a
+        dict of coords to piece types. Existing pieces are reused, including removed
+        ones, before new ones are created; the rest end up in self.removed."""
+        home, pawn_rank = (0, 1) if self.color == "white" else (7, 6)
+        rights = {"K": "krook", "Q": "qrook"}
+        if self.color == "black":
+            rights = {"k": "krook", "q": "qrook"}
+        spare = {}
+        for piece in self.pieces:
+            piece.pos = None
+            piece._moves = None
+            piece.moved = True
+            if piece.type == "pawn":
+                piece.double_step = None
+            spare.setdefault(piece.type, []).append(piece)
+        # castling looks the king and rooks up by name, so they go on their squares
+        placed = {}
+        for coord, piece_type in placement.items():
+            if piece_type == "king":
+                if self.king in placed.values():
+                    raise ValueError(f"{self} has more than one king")
+                placed[coord] = self.king
+        for right, name in rights.items():
+            if right in castling_rights:
+                coord = (0 if name == "qrook" else 7, home)
+                if placement.get(coord) != "rook" or placed.get((4, home)) is None:
+                    raise ValueError(f"{self} can't have castling right {right}")
+                placed[coord] = self[name]
+                self[name].moved = False
+                self.king.moved = False
+        for piece in placed.values():
+            spare[piece.type].remove(piece)
+        grid = self.board.board
+        for coord, piece_type in placement.items():
+            piece = placed.get(coord)
+            if piece is None:
+                if spare.get(piece_type):
+                    piece = spare[piece_type].pop()
+                else:
+                    piece = PIECE_TYPES[piece_type](self)
+                    self.pieces.append(piece)
+                if piece_type == "pawn":
+                    piece.moved = coord[1] != pawn_rank
+            x, y = coord
+            grid[x][y] = piece
+            piece.pos = SQUARE_AT[x][y]
+        self.removed = [p for p in self.pieces if p.pos is None]
+
+    def castle_side(self, piece, coord):
+        """ "queenside" or "kingside" if moving piece to coord castles (the king
+        moving two squares along its home rank from its home square), else None"""
+        if piece.type != "king":
+            return None
+        home = 0 if self.color == "white" else 7
+        if piece.pos != (4, home) or coord[1] != home:
+            return None
+        return {2: "queenside", 6: "kingside"}.get(coord[0])
+
+    def move(self, piece, coord, promotion=None):
+        """Move one of this player's pieces to coord, which must be a legal move for
+        it. A king moving two squares along its home rank from its home square
+        castles."""
+        if castle_side := self.castle_side(piece, coord):
+            self.castle(castle_side)
+            return
+        if promotion and piece.type != "pawn":
+            raise ValueError("Promotion specified when inappropriate")
+        if piece.type == "pawn":
+            # if double stepping, remember which turn it happened
+            if piece.moved == False and abs(piece.pos[1] - coord[1]) == 2:
+                piece.double_step = self.board.game.turn
+            # if x axis changes, means diagonal step
+            elif abs(piece.pos[0] - coord[0]) != 0:
+                # if square being moved to is empty, must be en passant
+                if self.board[coord] is None:
+                    # remove pawn being taken en passant
+                    self.board.remove_piece((coord[0], piece.pos[1]))
+            # if pawn moving to last row, check if promotion is specified and promote if so
+            if coord[1] == (7 if piece.player.color == "white" else 0):
+                if not promotion:
+                    raise ValueError("please specify promotion")
+                self.promote(piece, coord, promotion)
+                return
+            # promotion shouldn't be specified unless moving to last row
+            elif promotion:
+                raise ValueError("Promotion specified when inappropriate")
+        self.board.move_piece(piece, coord)
+        piece.moved = True
+
     def castle(self, castle_side):
         assert castle_side in ["queenside", "kingside"]
         rank = self.king.pos[1]
@@ -362,6 +843,7 @@ class Player:
         self.pieces.append(self.board[coord])
         self.pieces_dict[self.board[coord]] = coord
 
+    @profiled("Player.threatens_all", lambda player: player.board.game)
     @property
     def threatens_all(self):
         squares = set()
@@ -369,14 +851,121 @@ class Player:
             squares.update(piece.threatens)
         return squares
 
+    @property
+    def has_legal_move(self):
+        """Whether the player has any legal move, stopping at the first one found.
+
+        Cheap sufficient conditions are tried before testing moves for self-check:
+        when not in check, a king move to an unthreatened square is legal, and so
+        is any move (other than en passant) of a piece that isn't lined up with its
+        own king, since it can't be pinned."""
+        king = self.king
+        if not king.pos:
+            return bool(self.legal_moves_all)
+        board = self.board
+        kx, ky = king.pos
+        threatened = self.other_player.threatens_all
+        in_check = (kx, ky) in threatened
+        evasions = self.evasions if in_check else None
+        if not in_check:
+            for coord in king.potential_moves:
+                target = board[coord]
+                if coord not in threatened and (
+                    target is None or target.player is not self
+                ):
+                    return True
+        for piece in self.pieces:
+            if not piece.pos or piece is king or evasions == set():
+                continue
+            x, y = piece.pos
+            pinnable = in_check or x == kx or y == ky or abs(x - kx) == abs(y - ky)
+            for coord in piece.potential_moves:
+                target = board[coord]
+                if target is not None and target.player is self:
+                    continue
+                if evasions is not None and coord not in evasions:
+                    continue
+                en_passant = piece.type == "pawn" and target is None and coord[0] != x
+                if not pinnable and not en_passant:
+                    return True
+                if board.test_move(piece, coord):
+                    return True
+        # out of check, the king can only have moved to unthreatened squares
+        if in_check:
+            return bool(king.legal_moves)
+        return False
+
     @property
     def legal_moves_all(self):
         legal = {}
+        evasions = self.evasions
         for piece in self.pieces:
-            if moves := piece.legal_moves:
+            if piece.pos and (moves := piece.legal_moves_within(evasions)):
                 legal[piece] = moves
         return legal
 
+    @property
+    def checkers(self):
+        """The other player's pieces giving check, found by looking out from the
+        king rather than through everything the other player threatens"""
+        king = self.king
+        if not king.pos:
+            return []
+        grid = self.board.board
+        checkers = []
+        for x, y in king.pos.knight_jumps:
+            piece = grid[x][y]
+            if piece is not None and piece.player is not self:
+                if piece.type == "knight":
+                    checkers.append(piece)
+        kx, ky = king.pos
+        # where the other player's pawns would have to be to threaten the king
+        for x, y in PAWN_THREATS[self.color][kx][ky]:
+            piece = grid[x][y]
+            if piece is not None and piece.player is not self:
+                if piece.type == "pawn":
+                    checkers.append(piece)
+        for (dx, dy), ray in king.pos.rays.items():
+            line = "rook" if dx == 0 or dy == 0 else "bishop"
+            for x, y in ray:
+                piece = grid[x][y]
+                if piece is None:
+                    continue
+                if piece.player is not self and piece.type in ("queen", line):
+                    checkers.append(piece)
+                break
+        return checkers
+
+    @property
+    def evasions(self):
+        """None when not in check. In check, the squares pieces other than the
+        king can move to that might get out of it: the checking piece's square,
+        the squares between it and the king when it checks along a line, and the
+        square behind it when it is a pawn that can be taken en passant. In
+        double check it is empty, as only the king can move."""
+        king = self.king
+        if not king.pos:
+            return None
+        checkers = self.checkers
+        if not checkers:
+            return None
+        if len(checkers) > 1:
+            return set()
+        checker = checkers[0]
+        (kx, ky), (cx, cy) = king.pos, checker.pos
+        evasions = {checker.pos}
+        if checker.type in ("queen", "rook", "bishop"):
+            direction = ((cx > kx) - (cx < kx), (cy > ky) - (cy < ky))
+            for coord in king.pos.rays[direction]:
+                if coord == checker.pos:
+                    break
+                evasions.add(coord)
+        elif checker.type == "pawn" and checker.double_step == self.board.game.turn - 1:
+            evasions.add(
+                SQUARE_AT[cx][cy - 1 if checker.player.color == "white" else cy + 1]
+            )
+        return evasions
+
     def __getitem__(self, item):
         return self.pieces_dict[item]
 
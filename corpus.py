@@ -0,0 +1,131 @@
+"""Replays a corpus of PGN games through a trie of their moves, so the plies games
+share (most of the opening, in a large database) are only played once. The trie
+is walked depth first with push and pop on a single Game, calling back for each
+game where it ends and, for chosen plies, for every game passing through:
+
+    python corpus.py games.pgn"""
+
+import argparse
+import sys
+from time import perf_counter
+
+from chess import STARTPOS, Game
+from pgn import read_games, san_to_move
+
+
+class Node:
+    """A position in the trie: the moves played from it, the games ending in it
+    and how many games pass through it"""
+
+    __slots__ = ["children", "games", "count"]
+
+    def __init__(self):
+        self.children = {}
+        self.games = []
+        self.count = 0
+
+    def all_games(self):
+        """Every game passing through this node"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield from node.games
+            stack.extend(node.children.values())
+
+
+class MoveTrie:
+    """The moves of many games, merged where they are the same, with a root for
+    each starting position"""
+
+    def __init__(self, games=()):
+        self.roots = {}
+        self.games = 0
+        self.plies = 0
+        for game in games:
+            self.add(game)
+
+    def add(self, pgn_game):
+        node = self.roots.setdefault(pgn_game.headers.get("FEN", STARTPOS), Node())
+        node.count += 1
+        for san in pgn_game.moves:
+            node = node.children.setdefault(san, Node())
+            node.count += 1
+        node.games.append(pgn_game)
+        self.games += 1
+        self.plies += len(pgn_game.moves)
+
+    @property
+    def nodes(self):
+        """Plies in the trie, which is how many a walk plays"""
+        return sum(_count_nodes(root) - 1 for root in self.roots.values())
+
+    def walk(self, on_game=None, on_ply=None, plies=(), game=None):
+        """Play through every game, calling on_game(game, pgn_game) for each one
+        once its last move is on the board, and on_ply(game, ply, pgn_games) at
+        every position ply half moves into the games, for each ply in plies,
+        with a list of the games through it. A move that can't be played skips
+        the games with it. Returns counts of the games walked and skipped and the
+        plies played."""
+        game = game or Game()
+        plies = set(plies)
+        stats = {"games": 0, "skipped": 0, "plies": 0}
+
+        def visit(node, ply):
+            if on_ply and ply in plies:
+                on_ply(game, ply, list(node.all_games()))
+            for pgn_game in node.games:
+                stats["games"] += 1
+                if on_game:
+                    on_game(game, pgn_game)
+
+        for fen, root in self.roots.items():
+            game.set_fen(fen)
+            game.history.clear()
+            visit(root, 0)
+            stack = [iter(root.children.items())]
+            while stack:
+                child = next(stack[-1], None)
+                if child is None:
+                    stack.pop()
+                    if stack:
+                        game.pop()
+                    continue
+                san, node = child
+                try:
+                    move = san_to_move(game, san)
+                except (AssertionError, ValueError):
+                    stats["skipped"] += node.count
+                    continue
+                game.push(move)
+                stats["plies"] += 1
+                visit(node, len(stack))
+                stack.append(iter(node.children.items()))
+        return stats
+
+
+def _count_nodes(root):
+    count, stack = 0, [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children.values())
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("pgn", nargs="+")
+    args = parser.parse_args(argv)
+    trie = MoveTrie(game for path in args.pgn for game in read_games(path))
+    start = perf_counter()
+    stats = trie.walk()
+    seconds = perf_counter() - start
+    print(
+        f"{stats['games']} games ({stats['skipped']} skipped): {stats['plies']} plies "
+        f"played for {trie.plies} in the games, in {seconds:.2f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
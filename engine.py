@@ -0,0 +1,759 @@
+import asyncio
+import random
+import struct
+import threading
+from collections import namedtuple
+from time import perf_counter
+
+from chess import Game, Move, position_key
+from square import DIAGONAL, ORTHOGONAL, SQUARE_AT
+
+PIECE_VALUES = {
+    "pawn": 100,
+    "knight": 320,
+    "bishop": 330,
+    "rook": 500,
+    "queen": 900,
+    "king": 0,
+}
+
+# bonuses by square for white pieces, laid out as seen from white's side (a8 first)
+# and mirrored for black
+# fmt: off
+PIECE_SQUARE_TABLES = {
+    "pawn": [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    "knight": [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    "bishop": [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    "rook": [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    "queen": [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    "king": [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+# fmt: on
+
+MATE = 100000
+MAX_DEPTH = 64
+# how many nodes are searched between checks of the time limit and stop requests.
+# A node takes long enough that checking often costs little and keeps searches
+# from overrunning their deadline.
+CHECK_EVERY = 16
+
+# seconds kept back from the clock on every move for communication and slack
+MOVE_OVERHEAD = 0.02
+# moves the clock is assumed to have to last when the time control doesn't say
+MOVES_TO_GO = 30
+# the hard deadline is at most this many times the planned time for a move
+MAX_EXTENSION = 4
+# planned time is multiplied by these when in check or the best move changes
+CHECK_EXTENSION = 1.3
+UNSTABLE_EXTENSION = 1.5
+
+# transposition table bound types
+EXACT, LOWER, UPPER = 1, 2, 3
+
+# kings only take part in an exchange last, so they count as priceless
+KING_VALUE = 10 * MATE
+
+Line = namedtuple("Line", ["move", "score", "pv"])
+Info = namedtuple("Info", ["depth", "lines", "nodes", "seconds"])
+
+
+def evaluate(game):
+    """Static evaluation of game's position in centipawns, from the point of view
+    of the player whose turn it is"""
+    score = 0
+    for color, player in game.board.players.items():
+        sign = 1 if color == "white" else -1
+        for piece in player.pieces:
+            if piece.pos:
+                x, y = piece.pos
+                square = (7 - y) * 8 + x if sign == 1 else y * 8 + x
+                score += sign * (
+                    PIECE_VALUES[piece.type] + PIECE_SQUARE_TABLES[piece.type][square]
+                )
+    return score if game.turn % 2 == 0 else -score
+
+
+def exchange_value(piece_type):
+    return KING_VALUE if piece_type == "king" else PIECE_VALUES[piece_type]
+
+
+def _attacks_along(piece, dx, dy, distance):
+    """Whether piece, distance squares from a square in direction (dx, dy) of
+    it, attacks that square along the line, were nothing in between"""
+    piece_type = piece.type
+    if dx and dy:
+        if piece_type in ("bishop", "queen"):
+            return True
+        if distance != 1:
+            return False
+        if piece_type == "pawn":
+            # pawns attack forward, so they sit behind the square they attack
+            return dy == (-1 if piece.player.color == "white" else 1)
+    elif piece_type in ("rook", "queen"):
+        return True
+    return piece_type == "king" and distance == 1
+
+
+def attack_lanes(game, coord):
+    """Every piece of either color attacking coord, as lanes of pieces that
+    attack it in turn: the first of a lane attacks it now and the ones behind
+    (x-rays) as soon as those in front have moved onto it"""
+    grid = game.board.board
+    tx, ty = coord
+    target = SQUARE_AT[tx][ty]
+    lanes = []
+    for direction in ORTHOGONAL + DIAGONAL:
+        dx, dy = direction
+        lane = []
+        for distance, (x, y) in enumerate(target.rays[direction], 1):
+            piece = grid[x][y]
+            if piece is not None:
+                if not _attacks_along(piece, dx, dy, distance):
+                    break
+                lane.append(piece)
+        if lane:
+            lanes.append(lane)
+    for x, y in target.knight_jumps:
+        piece = grid[x][y]
+        if piece is not None and piece.type == "knight":
+            lanes.append([piece])
+    return lanes
+
+
+def attackers(game, coord, color):
+    """Pieces of color that can capture on coord right now, ignoring pins"""
+    return [
+        lane[0] for lane in attack_lanes(game, coord) if lane[0].player.color == color
+    ]
+
+
+def see(game, move):
+    """Static exchange evaluation: the material (in centipawns) the player to
+    move wins with move when both sides keep recapturing on its square with
+    their least valuable attacker, x-rays included, and stop once carrying on
+    would lose. Nothing is moved on the board; pins are ignored."""
+    start, coord, promotion = move
+    grid = game.board.board
+    piece = grid[start[0]][start[1]]
+    victim = grid[coord[0]][coord[1]]
+    if victim is not None:
+        gain = PIECE_VALUES[victim.type]
+    elif piece.type == "pawn" and start[0] != coord[0]:
+        gain = PIECE_VALUES["pawn"]  # en passant
+    else:
+        gain = 0
+    on_square = exchange_value(piece.type)
+    if promotion is not None:
+        gain += PIECE_VALUES[promotion.type] - PIECE_VALUES["pawn"]
+        on_square = PIECE_VALUES[promotion.type]
+    lanes = attack_lanes(game, coord)
+    for lane in lanes:
+        if piece in lane:
+            lane.remove(piece)
+    gains = [gain]
+    color = "black" if piece.player.color == "white" else "white"
+    while True:
+        fronts = [lane for lane in lanes if lane and lane[0].player.color == color]
+        if not fronts:
+            break
+        lane = min(fronts, key=lambda lane: exchange_value(lane[0].type))
+        attacker = lane[0]
+        if attacker.type == "king" and any(
+            lane and lane[0].player.color != color for lane in lanes
+        ):
+            # the king can't capture onto a square that is still defended
+            break
+        lane.pop(0)
+        gains.append(on_square - gains[-1])
+        on_square = exchange_value(attacker.type)
+        color = "black" if color == "white" else "white"
+    # either side can stop capturing when carrying on would lose material
+    for i in reversed(range(1, len(gains))):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+
+def hanging_pieces(game, color):
+    """Pieces of color that the other player can win material by capturing"""
+    other = "black" if color == "white" else "white"
+    hanging = []
+    for piece in game.board.players[color].pieces:
+        if piece.pos is None or piece.type == "king":
+            continue
+        for attacker in attackers(game, piece.pos, other):
+            if see(game, (attacker.pos, piece.pos, None)) > 0:
+                hanging.append(piece)
+                break
+    return hanging
+
+
+def is_mate_score(score):
+    return abs(score) > MATE - MAX_DEPTH - 1
+
+
+class TranspositionTable:
+    """Fixed size table of search results by position_key, with the newest, deepest
+    result kept when two positions share a slot.
+
+    The table can live in any writable buffer, such as a shared memory block that
+    several searching processes use at once. Each 16 byte entry stores its key
+    XORed with its data, so an entry torn by racing writes fails the key check
+    on read instead of being trusted."""
+
+    ENTRY = struct.Struct("<QQ")
+
+    def __init__(self, size=1 << 22, buffer=None):
+        self.buffer = memoryview(buffer if buffer is not None else bytearray(size))
+        self.entries = len(self.buffer) // self.ENTRY.size
+
+    def probe(self, key):
+        """(depth, bound, score, move) stored for key, or None"""
+        check, data = self.ENTRY.unpack_from(
+            self.buffer, key % self.entries * self.ENTRY.size
+        )
+        if not data or check ^ data != key:
+            return None
+        return (
+            data >> 48 & 0xFF,
+            data >> 56,
+            (data & 0xFFFFFFFF) - (1 << 31),
+            Move(data >> 32 & 0xFFFF) or None,
+        )
+
+    def store(self, key, depth, bound, score, move):
+        offset = key % self.entries * self.ENTRY.size
+        check, old = self.ENTRY.unpack_from(self.buffer, offset)
+        if old and check ^ old != key and old >> 48 & 0xFF > depth:
+            return
+        data = score + (1 << 31) | (move or 0) << 32 | depth << 48 | bound << 56
+        self.ENTRY.pack_into(self.buffer, offset, key ^ data, data)
+
+    def clear(self):
+        self.buffer[:] = bytes(len(self.buffer))
+
+    def close(self):
+        """Release the buffer, e.g. before closing the shared memory holding it"""
+        self.buffer.release()
+
+
+def score_to_tt(score, ply):
+    # mate scores count plies from the root, but in the table they're stored
+    # relative to the position so they can be reused at any ply
+    if is_mate_score(score):
+        return score + ply if score > 0 else score - ply
+    return score
+
+
+def score_from_tt(score, ply):
+    if is_mate_score(score):
+        return score - ply if score > 0 else score + ply
+    return score
+
+
+class TimeManager:
+    """Budget for searching one move, from a clock (seconds left), the increment
+    added after each move and the moves until the next time control, a fixed
+    movetime, or a pure node budget, which makes searches deterministic.
+
+    Iterative deepening starts no new depth once the planned time is used up,
+    and the planned time is extended when in check or when the best move
+    changes between depths, but never beyond the hard deadline, where the search
+    is stopped even mid-depth. report() tells how the budget was used."""
+
+    def __init__(
+        self,
+        clock=None,
+        increment=0,
+        moves_to_go=None,
+        movetime=None,
+        nodes=None,
+        overhead=MOVE_OVERHEAD,
+    ):
+        self.nodes = nodes
+        self.optimum = self.maximum = movetime
+        if clock is not None:
+            available = max(clock - overhead, 0)
+            optimum = min(
+                available / (moves_to_go or MOVES_TO_GO) + increment * 0.8,
+                available * 0.5,
+            )
+            maximum = min(optimum * MAX_EXTENSION, available * 0.8)
+            if movetime is not None:
+                optimum, maximum = min(optimum, movetime), min(maximum, movetime)
+            self.optimum, self.maximum = optimum, maximum
+        self.planned = self.optimum
+        self.extensions = []
+        self.best_move_changes = 0
+        self.best_move = None
+        self.depth = 0
+        self.nodes_searched = 0
+        self.started = self.finished = None
+
+    def start(self, in_check=False):
+        self.started = perf_counter()
+        if in_check:
+            self.extend("check", CHECK_EXTENSION)
+
+    @property
+    def deadline(self):
+        """perf_counter() time at which the search must stop, or None"""
+        return self.started + self.maximum if self.maximum is not None else None
+
+    @property
+    def elapsed(self):
+        return (self.finished or perf_counter()) - self.started
+
+    def extend(self, reason, factor):
+        if self.planned is not None:
+            self.planned = min(self.planned * factor, self.maximum)
+            self.extensions.append(reason)
+
+    def completed(self, info):
+        """Record a completed depth, returning whether to search another one"""
+        move = info.lines[0].move
+        if self.best_move is not None and move != self.best_move:
+            self.best_move_changes += 1
+            self.extend("unstable best move", UNSTABLE_EXTENSION)
+        self.best_move, self.depth, self.nodes_searched = move, info.depth, info.nodes
+        return self.planned is None or self.elapsed < self.planned
+
+    def stop(self, nodes):
+        self.finished = perf_counter()
+        self.nodes_searched = nodes
+
+    def report(self):
+        return {
+            "optimum": self.optimum,
+            "maximum": self.maximum,
+            "planned": self.planned,
+            "used": self.elapsed,
+            "node_budget": self.nodes,
+            "nodes": self.nodes_searched,
+            "depth": self.depth,
+            "best_move_changes": self.best_move_changes,
+            "extensions": self.extensions,
+        }
+
+
+class SearchStopped(Exception):
+    """Raised inside a search to unwind it when a limit is hit or stop() is called"""
+
+
+class Search:
+    """Iterative deepening alpha-beta search of a game's current position.
+
+    The search runs on its own copy of the position, so the game can keep being
+    used meanwhile. Each completed depth produces an Info with the best multipv
+    root moves, their scores (in centipawns for the player to move) and lines.
+    Any of depth, movetime (seconds), nodes and a TimeManager limit the search;
+    with none of them it runs until stop() is called. If a limit is reached
+    before the first depth is done, the best root move scored so far is given
+    as an Info of depth 0.
+
+    Results are kept in tt, a TranspositionTable which can be shared with other
+    searches. A seed shuffles the initial root move order, so that several
+    searches sharing a table explore the tree differently."""
+
+    def __init__(
+        self,
+        game,
+        depth=None,
+        movetime=None,
+        nodes=None,
+        multipv=1,
+        tt=None,
+        seed=None,
+        time_manager=None,
+    ):
+        self.game = Game.from_snapshot(game.snapshot())
+        self.depth = min(depth or MAX_DEPTH, MAX_DEPTH)
+        self.movetime = movetime
+        self.max_nodes = nodes
+        self.multipv = multipv
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.seed = seed
+        self.time_manager = time_manager
+        self.root_lines = []
+        self.nodes = 0
+        self.stopped = False
+        self.info = None
+
+    def stop(self):
+        """Ask the search to stop as soon as possible. Safe to call from any thread."""
+        self.stopped = True
+
+    def iterate(self):
+        """Search one depth deeper at a time, yielding an Info as each completes"""
+        self.start = perf_counter()
+        self.deadline = self.start + self.movetime if self.movetime else None
+        self.hard_deadline = None
+        self.nodes = 0
+        self.info = None
+        root_moves = self.game.legal_moves
+        if not root_moves:
+            return
+        if self.seed is not None:
+            random.Random(self.seed).shuffle(root_moves)
+        manager = self.time_manager
+        if manager is not None:
+            manager.start(self.game.whose_turn.king.in_check)
+            self.hard_deadline = manager.deadline
+            if manager.nodes:
+                self.max_nodes = min(self.max_nodes or manager.nodes, manager.nodes)
+        try:
+            yield from self.deepen(root_moves)
+        finally:
+            if manager is not None:
+                manager.stop(self.nodes)
+
+    def deepen(self, root_moves):
+        for depth in range(1, self.depth + 1):
+            try:
+                lines = self.search_root(root_moves, depth)
+            except SearchStopped:
+                if self.info is None:
+                    # stopped during the first depth: keep the best move so far
+                    lines = self.root_lines or [Line(root_moves[0], 0, root_moves[:1])]
+                    self.info = Info(
+                        0,
+                        lines[: self.multipv],
+                        self.nodes,
+                        perf_counter() - self.start,
+                    )
+                    yield self.info
+                return
+            # search the best moves first next time round
+            order = {line.move: i for i, line in enumerate(lines)}
+            root_moves.sort(key=lambda m: order.get(m, len(order)))
+            self.info = Info(
+                depth, lines[: self.multipv], self.nodes, perf_counter() - self.start
+            )
+            yield self.info
+            if is_mate_score(lines[0].score) or self.stopped:
+                return
+            if self.time_manager and not self.time_manager.completed(self.info):
+                return
+
+    def run(self):
+        """Search until a limit is reached, returning the last complete Info"""
+        for _ in self.iterate():
+            pass
+        return self.info
+
+    async def analyse(self):
+        """Asynchronously yield an Info for each completed depth. The search runs on
+        a background thread; it is stopped if the generator is closed or the task
+        iterating it is cancelled."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # the loop was closed after the consumer went away
+                self.stop()
+
+        def produce():
+            try:
+                for info in self.iterate():
+                    put(info)
+            finally:
+                put(None)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while (info := await queue.get()) is not None:
+                yield info
+        finally:
+            self.stop()
+
+    def search_root(self, root_moves, depth):
+        """Score every root move, exactly for the best multipv of them and as an
+        upper bound for the rest. Returns Lines sorted best first."""
+        game = self.game
+        lines = self.root_lines = []
+        for move in root_moves:
+            # only moves that could still make it into the top multipv need an
+            # exact score, so the rest are searched against the current cutoff
+            alpha = -MATE - 1
+            if len(lines) >= self.multipv:
+                alpha = lines[self.multipv - 1].score
+            game.push(move)
+            try:
+                score, pv = self.negamax(depth - 1, -MATE - 1, -alpha, 1)
+            finally:
+                game.pop()
+            lines.append(Line(move, -score, [move] + pv))
+            lines.sort(key=lambda line: -line.score)
+        return lines
+
+    def negamax(self, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            self.check_limits()
+        game = self.game
+        if depth == 0:
+            return self.quiesce(alpha, beta, ply)
+        key = position_key(game.snapshot())
+        tt_move = None
+        if entry := self.tt.probe(key):
+            tt_depth, bound, score, tt_move = entry
+            score = score_from_tt(score, ply)
+            if tt_depth >= depth and (
+                bound == EXACT
+                or (bound == LOWER and score >= beta)
+                or (bound == UPPER and score <= alpha)
+            ):
+                return score, [tt_move] if tt_move else []
+        moves = game.legal_moves
+        if not moves:
+            if game.whose_turn.king.in_check:
+                return -MATE + ply, []
+            return 0, []
+        original_alpha = alpha
+        best_pv = []
+        for move in self.order_moves(moves, tt_move):
+            game.push(move)
+            try:
+                score, pv = self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game.pop()
+            score = -score
+            if score > alpha:
+                alpha = score
+                best_pv = [move] + pv
+                if alpha >= beta:
+                    break
+        if alpha >= beta:
+            bound = LOWER
+        elif alpha > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        best = best_pv[0] if best_pv else None
+        self.tt.store(key, depth, bound, score_to_tt(alpha, ply), best)
+        return alpha, best_pv
+
+    def quiesce(self, alpha, beta, ply):
+        """Search captures and promotions only, so that positions are evaluated
+        once they are quiet. The player to move may stand pat on the static
+        evaluation instead, unless in check, when every evasion is searched, and
+        captures losing material by static exchange evaluation are skipped.
+        Checkmate and stalemate are scored as in negamax."""
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            self.check_limits()
+        game = self.game
+        player = game.whose_turn
+        if player.checkers:
+            moves = game.legal_moves
+            if not moves:
+                return -MATE + ply, []
+            candidates = self.order_moves(moves)
+        else:
+            if not player.has_legal_move:
+                return 0, []
+            stand_pat = evaluate(game)
+            if stand_pat >= beta:
+                return stand_pat, []
+            alpha = max(alpha, stand_pat)
+            captures = []
+            for move in self.captures(player):
+                gain = see(game, move)
+                if gain >= 0:
+                    captures.append((gain, move))
+            captures.sort(key=lambda capture: -capture[0])
+            candidates = [move for _, move in captures]
+        best_pv = []
+        for move in candidates:
+            game.push(move)
+            try:
+                score, pv = self.quiesce(-beta, -alpha, ply + 1)
+            finally:
+                game.pop()
+            score = -score
+            if score > alpha:
+                alpha = score
+                best_pv = [move] + pv
+                if alpha >= beta:
+                    break
+        return alpha, best_pv
+
+    def captures(self, player):
+        """The player's legal captures and promotions as Moves, testing only those
+        for self-check rather than generating every legal move"""
+        board = player.board
+        moves = []
+        for piece in player.pieces:
+            if not piece.pos:
+                continue
+            x, y = piece.pos
+            start = y * 8 + x
+            pawn = piece.type == "pawn"
+            for coord in piece.potential_moves:
+                target = board[coord]
+                if target is None:
+                    # en passant and promotions are the pawn's only other gains
+                    if not pawn or (coord[0] == x and coord[1] not in (0, 7)):
+                        continue
+                elif target.player is player:
+                    continue
+                if not board.test_move(piece, coord):
+                    continue
+                move = start | coord.index << 6
+                if pawn and coord[1] in (0, 7):
+                    moves.extend(Move(move | code << 12) for code in (1, 2, 3, 4))
+                else:
+                    moves.append(Move(move))
+        return moves
+
+    def order_moves(self, moves, first=None):
+        """The table's best move first, then captures of the most valuable pieces
+        by the least valuable ones, quiet moves, and last captures that lose
+        material by static exchange evaluation"""
+        game = self.game
+        board = game.board
+
+        def key(move):
+            if move == first:
+                return -(10**9)
+            start, coord, promotion = move
+            victim = board[coord]
+            if victim is None:
+                return 0 if promotion is None else -PIECE_VALUES[promotion.type]
+            attacker = PIECE_VALUES[board[start].type]
+            victim = PIECE_VALUES[victim.type]
+            # taking a piece worth at least the attacker can't lose material
+            if attacker > victim and see(game, move) < 0:
+                return 10**6 + attacker - victim
+            return attacker - 10 * victim
+
+        return sorted(moves, key=key)
+
+    def check_limits(self):
+        if self.stopped:
+            raise SearchStopped
+        if self.hard_deadline and perf_counter() >= self.hard_deadline:
+            raise SearchStopped
+        # movetime and nodes are hard limits too: stopped during the first depth,
+        # deepen falls back on the best root move scored so far
+        if self.max_nodes and self.nodes >= self.max_nodes:
+            raise SearchStopped
+        if self.deadline and perf_counter() >= self.deadline:
+            raise SearchStopped
+
+
+class EnginePlayer:
+    """Plays moves for one side of a Game, searching each one within the budget
+    of a TimeManager. Given a clock (seconds), it keeps the clock running like a
+    game clock, adding increment after every move; movetime, nodes and depth
+    limit each move on top of that. The TimeManager report of every move is kept
+    in reports."""
+
+    def __init__(
+        self,
+        clock=None,
+        increment=0,
+        movetime=None,
+        nodes=None,
+        depth=None,
+        tt=None,
+        search=None,
+    ):
+        self.clock = clock
+        self.increment = increment
+        self.movetime = movetime
+        self.nodes = nodes
+        self.depth = depth
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.search = search or Search
+        self.reports = []
+
+    @property
+    def flagged(self):
+        """Whether the player has run out of time"""
+        return self.clock is not None and self.clock < 0
+
+    def choose_move(self, game):
+        """The move to play in game's position, or None if there are no legal moves"""
+        manager = TimeManager(
+            self.clock, self.increment, None, self.movetime, self.nodes
+        )
+        start = perf_counter()
+        info = self.search(game, self.depth, tt=self.tt, time_manager=manager).run()
+        if self.clock is not None:
+            self.clock -= perf_counter() - start
+            if not self.flagged:
+                self.clock += self.increment
+        self.reports.append(manager.report())
+        return info.lines[0].move if info else None
+
+
+def best_move(game, **limits):
+    """The best move found by a Search of game with the given limits, or None if
+    there are no legal moves"""
+    info = Search(game, **limits).run()
+    return info.lines[0].move if info else None
+
+
+async def analyse(game, multipv=1, depth=None, movetime=None, nodes=None):
+    """Stream multi-PV analysis of game's position one Info per depth"""
+    search = Search(game, depth, movetime, nodes, multipv)
+    async for info in search.analyse():
+        yield info
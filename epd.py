@@ -0,0 +1,156 @@
+"""Extracts positions from PGN games as EPD lines, the usual input for tuning
+evaluation parameters. Games are replayed one at a time and lines written out in
+chunks, so corpora of any size are processed in constant memory:
+
+    python epd.py games.pgn --sample 0.1 --seed 7 --out positions
+
+Each line holds the position's first four FEN fields and the opcodes c9 (the
+game's result), ply (half moves since the game started) and sm (the move
+played from the position, in SAN; missing for the final position)."""
+
+import argparse
+import sys
+from array import array
+from hashlib import blake2b
+
+from chess import Game, position_key
+from pgn import move_to_san, read_games, san_to_move
+
+RESULTS = {"1-0", "0-1", "1/2-1/2"}
+
+
+class SeenPositions:
+    """Fixed size set of position keys for dropping duplicate positions. Each key
+    has a single slot, so a key evicted by another one can come through again;
+    that keeps memory constant however many positions go past."""
+
+    def __init__(self, size=1 << 20):
+        self.keys = array("Q", bytes(8 * size))
+
+    def add(self, key):
+        """Add key, returning False if it was already there"""
+        slot = key % len(self.keys)
+        if self.keys[slot] == key:
+            return False
+        self.keys[slot] = key
+        return True
+
+
+def sampled(key, seed, rate):
+    """Whether to keep the position with this key when sampling a fraction rate
+    of positions. The choice depends only on the key and the seed, so the same
+    positions are sampled on every run and in every process."""
+    if rate >= 1:
+        return True
+    digest = blake2b(key.to_bytes(8, "little"), digest_size=8, key=str(seed).encode())
+    return int.from_bytes(digest.digest(), "little") < rate * (1 << 64)
+
+
+def game_positions(pgn_game):
+    """Yield (game, ply, move) for every position of a PgnGame in turn, where
+    ply counts half moves from the game's first position (its FEN, if it has
+    one) and move is the (start, coord, promotion) move played from it, or None
+    for the final position, which is where an illegal move cuts the game short."""
+    fen = pgn_game.headers.get("FEN")
+    game = Game.from_fen(fen) if fen else Game()
+    ply = 0
+    for san in pgn_game.moves:
+        try:
+            move = san_to_move(game, san)
+        except (AssertionError, ValueError):
+            break
+        yield game, ply, move
+        game.play_move(move)
+        ply += 1
+    yield game, ply, None
+
+
+def epd_line(game, ply, move, result):
+    fields = game.fen.split()[:4]
+    opcodes = [f'c9 "{result}";', f"ply {ply};"]
+    if move is not None:
+        opcodes.append(f"sm {move_to_san(game, move)};")
+    return " ".join(fields + opcodes)
+
+
+def extract(games, rate=1.0, seed=0, seen=None, min_ply=0):
+    """Yield an EPD line for the positions of games (PgnGames) with a known
+    result, keeping a fraction rate of them sampled by seed, leaving out the
+    first min_ply half moves and, when given a SeenPositions, duplicates"""
+    for pgn_game in games:
+        if pgn_game.result not in RESULTS:
+            continue
+        for game, ply, move in game_positions(pgn_game):
+            if ply < min_ply:
+                continue
+            key = position_key(game.snapshot())
+            if not sampled(key, seed, rate):
+                continue
+            if seen is not None and not seen.add(key):
+                continue
+            yield epd_line(game, ply, move, pgn_game.result)
+
+
+def write_chunks(lines, prefix, chunk_size=100000):
+    """Write lines to files prefix-00000.epd, prefix-00001.epd, ... of at most
+    chunk_size lines each, returning their paths"""
+    paths = []
+    chunk = []
+
+    def flush():
+        path = f"{prefix}-{len(paths):05d}.epd"
+        with open(path, "w") as f:
+            f.write("\n".join(chunk) + "\n")
+        paths.append(path)
+        chunk.clear()
+
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return paths
+
+
+def read_epd(path):
+    """Yield (fen, opcodes) for each line of an EPD file, with opcodes a dict of
+    strings with any quotes removed"""
+    with open(path) as f:
+        for line in f:
+            fields = line.split(maxsplit=4)
+            if len(fields) < 4:
+                continue
+            opcodes = {}
+            for operation in fields[4].split(";") if len(fields) > 4 else []:
+                if operation.strip():
+                    name, _, value = operation.strip().partition(" ")
+                    opcodes[name] = value.strip('"')
+            yield " ".join(fields[:4]), opcodes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("pgn", nargs="+")
+    parser.add_argument("--out", default="positions", help="output file prefix")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--sample", type=float, default=1.0, help="fraction to keep")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-ply", type=int, default=0)
+    parser.add_argument(
+        "--dedup-size",
+        type=int,
+        default=1 << 20,
+        help="slots of the duplicate filter, 8 bytes each (0 to keep duplicates)",
+    )
+    args = parser.parse_args(argv)
+    games = (game for path in args.pgn for game in read_games(path))
+    seen = SeenPositions(args.dedup_size) if args.dedup_size else None
+    lines = extract(games, args.sample, args.seed, seen, args.min_ply)
+    for path in write_chunks(lines, args.out, args.chunk_size):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
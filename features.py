@@ -0,0 +1,98 @@
+"""Export positions as fixed-size feature planes for machine learning.
+
+Each position is encoded as an (18, 8, 8) array indexed by [plane, rank, file]:
+planes 0-11 mark the pieces (white pawn, knight, bishop, rook, queen, king, then
+the same for black), plane 12 is all ones when white is to move, planes 13-16
+are all ones for each remaining castling right (K, Q, k, q) and plane 17 marks
+the en passant square. Requires numpy."""
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed when actually exporting planes
+    np = None
+
+PIECE_ORDER = ["pawn", "knight", "bishop", "rook", "queen", "king"]
+PIECE_PLANES = {
+    (color, piece_type): i + 6 * c
+    for c, color in enumerate(["white", "black"])
+    for i, piece_type in enumerate(PIECE_ORDER)
+}
+SIDE_TO_MOVE_PLANE = 12
+CASTLING_PLANES = {"K": 13, "Q": 14, "k": 15, "q": 16}
+EN_PASSANT_PLANE = 17
+PLANES = 18
+SHAPE = (PLANES, 8, 8)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("numpy is required to export feature planes")
+
+
+def encode(game, out=None):
+    """Write the planes for game's current position into out, a zeroable
+    array of shape SHAPE, allocating one if not given. Returns out."""
+    _require_numpy()
+    if out is None:
+        out = np.zeros(SHAPE, dtype=np.uint8)
+    else:
+        out[...] = 0
+    # every plane is a 64 square block of the flattened array, so each piece
+    # only costs one index computation and all are set in one assignment
+    indices = []
+    for player in game.board.players.values():
+        for piece in player.pieces:
+            if piece.pos:
+                x, y = piece.pos
+                indices.append(PIECE_PLANES[player.color, piece.type] * 64 + y * 8 + x)
+    if game.turn % 2 == 0:
+        indices.extend(range(SIDE_TO_MOVE_PLANE * 64, SIDE_TO_MOVE_PLANE * 64 + 64))
+    for right in game.castling_rights:
+        plane = CASTLING_PLANES[right]
+        indices.extend(range(plane * 64, plane * 64 + 64))
+    if square := game.en_passant:
+        x, y = square
+        indices.append(EN_PASSANT_PLANE * 64 + y * 8 + x)
+    out.reshape(-1)[indices] = 1
+    return out
+
+
+def encode_batch(positions, out):
+    """Encode positions (an iterable of Games, e.g. chess.replay(moves)) into
+    consecutive entries of out until it is full. Returns the number written."""
+    count = 0
+    # zip stops on the range first, so no position is consumed beyond the last
+    for count, game in zip(range(1, len(out) + 1), positions):
+        encode(game, out[count - 1])
+    return count
+
+
+def iter_batches(positions, batch_size, dtype=None):
+    """Yield arrays of up to batch_size encoded positions. A single buffer is
+    preallocated and reused, so copy a batch if it must outlive the next one."""
+    _require_numpy()
+    buffer = np.zeros((batch_size,) + SHAPE, dtype=dtype or np.uint8)
+    positions = iter(positions)
+    while count := encode_batch(positions, buffer):
+        yield buffer[:count]
+        if count < batch_size:
+            break
+
+
+def open_memmap(path, count, dtype=None):
+    """Create a memory-mapped .npy file with room for count positions"""
+    _require_numpy()
+    return np.lib.format.open_memmap(
+        path, mode="w+", dtype=dtype or np.uint8, shape=(count,) + SHAPE
+    )
+
+
+def save_batches(positions, prefix, batch_size=4096, dtype=None):
+    """Write encoded positions to prefix-00000.npy, prefix-00001.npy, ...
+    holding batch_size positions each. Returns the paths written."""
+    paths = []
+    for i, batch in enumerate(iter_batches(positions, batch_size, dtype)):
+        path = f"{prefix}-{i:05d}.npy"
+        np.save(path, batch)
+        paths.append(path)
+    return paths
@@ -0,0 +1,175 @@
+"""Saving games as append-only journals: the starting position, then a three
+byte record for every move made, with a checkpoint of the whole position every
+so often. A saved game resumes from its latest checkpoint, replaying only the
+moves after it, and a record cut short by a crash is dropped on resuming.
+
+    python journal.py game.chj
+
+plays the game saved in game.chj on from where it was left, starting a new one
+if the file doesn't exist yet."""
+
+import argparse
+import os
+import struct
+import sys
+import zlib
+
+from chess import SQUARES, Game, Move, Snapshot
+
+MAGIC = b"CHJ1"
+MOVE_RECORD = struct.Struct("<cH")
+# placement, turn, castling rights (padded with spaces), en passant square
+# (NO_SQUARE for none) and a crc32 of all that, so a torn checkpoint is noticed
+CHECKPOINT_RECORD = struct.Struct("<c64sI4sBI")
+MOVE, CHECKPOINT = b"M", b"C"
+NO_SQUARE = 255
+
+
+def pack_checkpoint(snapshot):
+    placement, turn, castling_rights, en_passant = snapshot
+    square = NO_SQUARE if en_passant is None else en_passant[1] * 8 + en_passant[0]
+    fields = (placement, turn, castling_rights.encode().ljust(4), square)
+    crc = zlib.crc32(CHECKPOINT_RECORD.pack(CHECKPOINT, *fields, 0)[:-4])
+    return CHECKPOINT_RECORD.pack(CHECKPOINT, *fields, crc)
+
+
+def unpack_checkpoint(data, offset):
+    """The Snapshot in the checkpoint record at offset, or None if it is damaged"""
+    _, placement, turn, castling, square, crc = CHECKPOINT_RECORD.unpack_from(
+        data, offset
+    )
+    end = offset + CHECKPOINT_RECORD.size - 4
+    if zlib.crc32(data[offset:end]) != crc:
+        return None
+    en_passant = None if square == NO_SQUARE else SQUARES[square]
+    return Snapshot(placement, turn, castling.decode().strip(), en_passant)
+
+
+def read_journal(path):
+    """(snapshot, moves, end): the latest checkpoint in the journal at path, the
+    Moves made after it and where the intact records end"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a game journal")
+    snapshot, moves = None, []
+    offset = len(MAGIC)
+    while offset < len(data):
+        tag = data[offset : offset + 1]
+        if tag == MOVE and offset + MOVE_RECORD.size <= len(data):
+            moves.append(Move(MOVE_RECORD.unpack_from(data, offset)[1]))
+            offset += MOVE_RECORD.size
+        elif tag == CHECKPOINT and offset + CHECKPOINT_RECORD.size <= len(data):
+            if (checkpoint := unpack_checkpoint(data, offset)) is None:
+                break
+            snapshot, moves = checkpoint, []
+            offset += CHECKPOINT_RECORD.size
+        else:
+            # the tail of a write interrupted by a crash
+            break
+    if snapshot is None:
+        raise ValueError(f"{path} has no starting position")
+    return snapshot, moves, offset
+
+
+def load(path):
+    """The game saved in the journal at path, without opening it for saving"""
+    snapshot, moves, _ = read_journal(path)
+    game = Game.from_snapshot(snapshot)
+    for move in moves:
+        game.play_move(move)
+    return game
+
+
+class Journal:
+    """Saves a game's moves as they are made, once attached to it as game.journal
+    (which create() and resume() do). Records are written and fsynced together
+    every sync_every moves, so a crash loses at most the last sync_every - 1
+    moves, and a checkpoint is added every checkpoint_every moves, so resuming
+    never replays more moves than that."""
+
+    def __init__(self, path, game, file, sync_every=16, checkpoint_every=64):
+        self.path = path
+        self.game = game
+        self.file = file
+        self.sync_every = sync_every
+        self.checkpoint_every = checkpoint_every
+        self.buffer = bytearray()
+        self.pending = 0
+        self.since_checkpoint = 0
+        game.journal = self
+
+    @classmethod
+    def create(cls, path, game=None, **options):
+        """Start a journal at path (which must not exist yet) saving game, a new
+        Game by default, from its current position"""
+        game = game or Game()
+        file = open(path, "xb")
+        file.write(MAGIC + pack_checkpoint(game.snapshot()))
+        journal = cls(path, game, file, **options)
+        journal.sync()
+        return journal
+
+    @classmethod
+    def resume(cls, path, **options):
+        """Load the game saved at path and carry on saving it there. The game is
+        the journal's game attribute."""
+        snapshot, moves, end = read_journal(path)
+        game = Game.from_snapshot(snapshot)
+        for move in moves:
+            game.play_move(move)
+        file = open(path, "r+b")
+        file.truncate(end)
+        file.seek(end)
+        journal = cls(path, game, file, **options)
+        journal.since_checkpoint = len(moves)
+        return journal
+
+    def append(self, move):
+        """Record a Move the game has just made"""
+        self.buffer += MOVE_RECORD.pack(MOVE, move)
+        self.pending += 1
+        self.since_checkpoint += 1
+        if self.since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+        if self.pending >= self.sync_every:
+            self.sync()
+
+    def checkpoint(self):
+        """Record the game's whole position, to resume from"""
+        self.buffer += pack_checkpoint(self.game.snapshot())
+        self.since_checkpoint = 0
+
+    def sync(self):
+        """Write out the records so far and wait until they are on disk"""
+        self.file.write(self.buffer)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.buffer.clear()
+        self.pending = 0
+
+    def close(self):
+        self.sync()
+        self.file.close()
+        self.game.journal = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path")
+    parser.add_argument("--fen", help="starting position of a new game")
+    args = parser.parse_args(argv)
+    if os.path.exists(args.path):
+        journal = Journal.resume(args.path, sync_every=1)
+    else:
+        game = Game.from_fen(args.fen) if args.fen else Game()
+        journal = Journal.create(args.path, game, sync_every=1)
+    try:
+        journal.game.play_game()
+    finally:
+        journal.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""Mate solver: proves or refutes mate in N for the player to move, for checking
+puzzle sets. Depth-first search over only the moves that matter: the attacker
+needs one move that mates whatever the defence, the defender one reply that
+holds out. Results are kept in a transposition table by position, so positions
+reached by several move orders are only solved once.
+
+    python mate.py puzzles.epd --moves 3 --checks-only
+
+EPD lines with a dm (direct mate) opcode are solved to that many moves."""
+
+import argparse
+import sys
+from multiprocessing import Pool
+from time import perf_counter
+
+from chess import Game, move_to_uci, position_key
+from engine import SearchStopped
+from epd import read_epd
+
+
+class MateSolver:
+    """Solves mate problems in a copy of game's position. With checks_only, the
+    attacker only tries moves giving check, which solves most puzzles far faster
+    but misses mates with a quiet move. nodes limits the positions visited per
+    solve(). tt, a dict, can be shared between solvers in the same mode."""
+
+    def __init__(self, game, checks_only=False, nodes=None, tt=None):
+        self.game = Game.from_snapshot(game.snapshot())
+        self.checks_only = checks_only
+        self.max_nodes = nodes
+        self.tt = tt if tt is not None else {}
+        self.nodes = 0
+        self.stopped = False
+
+    def solve(self, moves):
+        """The solution tree of the shortest mate in at most moves moves, or None
+        if there is none (or the node limit was hit first, setting stopped).
+
+        A solution tree maps the attacker's move to a dict of every legal reply,
+        each mapped to the solution tree from there; the mating move maps to an
+        empty dict."""
+        self.nodes = 0
+        self.stopped = False
+        try:
+            for n in range(1, moves + 1):
+                if (tree := self.attack(n)) is not None:
+                    return tree
+        except SearchStopped:
+            self.stopped = True
+        return None
+
+    def attack(self, n):
+        """Solution tree of a mate in n for the player to move, or None"""
+        self.nodes += 1
+        if self.max_nodes and self.nodes > self.max_nodes:
+            raise SearchStopped
+        game = self.game
+        key = position_key(game.snapshot())
+        # (n, tree): a tree proves mate in n, None proves there is no mate in n
+        if entry := self.tt.get(key):
+            solved, tree = entry
+            if tree is not None and solved <= n:
+                return tree
+            if tree is None and solved >= n:
+                return None
+        quiet = []
+        # checks first, then the quiet moves if they are searched at all
+        for move in game.legal_moves:
+            game.push(move)
+            try:
+                if game.whose_turn.king.in_check:
+                    replies = self.defend(n)
+                elif n > 1 and not self.checks_only:
+                    quiet.append(move)
+                    continue
+                else:
+                    continue
+            finally:
+                game.pop()
+            if replies is not None:
+                return self.store(key, n, {move: replies})
+        for move in quiet:
+            game.push(move)
+            try:
+                replies = self.defend(n)
+            finally:
+                game.pop()
+            if replies is not None:
+                return self.store(key, n, {move: replies})
+        return self.store(key, n, None)
+
+    def defend(self, n):
+        """After the attacker's nth to last move: the solution tree after every
+        reply, or None if the defender has one escaping mate"""
+        game = self.game
+        moves = game.legal_moves
+        if not moves:
+            # same outcomes as Game.game_over: no moves and in check is mate
+            return {} if game.whose_turn.king.in_check else None
+        if n == 1:
+            return None
+        replies = {}
+        for move in moves:
+            game.push(move)
+            try:
+                tree = self.attack(n - 1)
+            finally:
+                game.pop()
+            if tree is None:
+                return None
+            replies[move] = tree
+        return replies
+
+    def store(self, key, n, tree):
+        # a proof is worth more than knowing there is no shorter mate
+        entry = self.tt.get(key)
+        if (
+            entry is None
+            or (tree is not None and (entry[1] is None or n < entry[0]))
+            or (tree is None and entry[1] is None and n > entry[0])
+        ):
+            self.tt[key] = n, tree
+        return tree
+
+
+def mate_length(tree):
+    """Moves the attacker needs to mate against the best defence in a solution
+    tree"""
+    return 1 + max(
+        (mate_length(after) for replies in tree.values() for after in replies.values()),
+        default=0,
+    )
+
+
+def main_line(tree):
+    """The moves of a solution tree, following the longest defence, as Moves"""
+    line = []
+    while tree:
+        move, replies = next(iter(tree.items()))
+        line.append(move)
+        if not replies:
+            break
+        reply = max(replies, key=lambda reply: mate_length(replies[reply]))
+        line.append(reply)
+        tree = replies[reply]
+    return line
+
+
+def _solve_task(task):
+    fen, moves, checks_only, nodes = task
+    solver = MateSolver(Game.from_fen(fen), checks_only, nodes)
+    tree = solver.solve(moves)
+    line = [move_to_uci(move) for move in main_line(tree)] if tree else None
+    return fen, moves, line, solver.stopped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("epd", nargs="+", help="EPD or FEN files, one per line")
+    parser.add_argument("--moves", type=int, default=2, help="without a dm opcode")
+    parser.add_argument("--checks-only", action="store_true")
+    parser.add_argument("--nodes", type=int, help="give up on a position after")
+    parser.add_argument("--processes", type=int)
+    args = parser.parse_args(argv)
+    tasks = [
+        (fen, int(opcodes.get("dm", args.moves)), args.checks_only, args.nodes)
+        for path in args.epd
+        for fen, opcodes in read_epd(path)
+    ]
+    counts = {"solved": 0, "unsolved": 0, "gave up": 0}
+    start = perf_counter()
+    with Pool(args.processes) as pool:
+        for fen, moves, line, stopped in pool.imap(_solve_task, tasks, chunksize=16):
+            if line:
+                counts["solved"] += 1
+                print(f"{fen}: mate in {(len(line) + 1) // 2}: {' '.join(line)}")
+            elif stopped:
+                counts["gave up"] += 1
+                print(f"{fen}: gave up")
+            else:
+                counts["unsolved"] += 1
+                print(f"{fen}: no mate in {moves}")
+    seconds = perf_counter() - start
+    print(", ".join(f"{count} {name}" for name, count in counts.items()), end="")
+    print(f" in {seconds:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
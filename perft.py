@@ -0,0 +1,129 @@
+"""Perft: counts the leaf nodes of the legal move tree to a given depth, to check
+move generation against known counts and to time it. The root moves are split
+over a pool of processes and subtree counts are cached by position and depth,
+so transpositions are only counted once. Divide reports the count under each
+root move, so a wrong total can be tracked down one move at a time:
+
+    python perft.py 4 --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq -"
+"""
+
+import argparse
+import sys
+from array import array
+from multiprocessing import Pool
+from time import perf_counter
+
+from chess import Game, move_to_uci, position_key
+
+# spreads depths over the key bits, so one position's counts at each depth
+# land in different slots
+DEPTH_MIX = 0x9E3779B97F4A7C15
+
+# the cache of this worker process
+_cache = None
+
+
+class PerftCache:
+    """Fixed size table of subtree counts by position key and depth. Each slot
+    keeps the latest count stored in it, so memory stays at 16 bytes a slot."""
+
+    def __init__(self, size=1 << 20):
+        self.checks = array("Q", bytes(8 * size))
+        self.counts = array("Q", bytes(8 * size))
+        self.hits = 0
+
+    def probe(self, key, depth):
+        check = key ^ depth * DEPTH_MIX & 0xFFFFFFFFFFFFFFFF
+        slot = check % len(self.checks)
+        if self.checks[slot] == check and self.counts[slot]:
+            self.hits += 1
+            return self.counts[slot]
+        return None
+
+    def store(self, key, depth, count):
+        check = key ^ depth * DEPTH_MIX & 0xFFFFFFFFFFFFFFFF
+        slot = check % len(self.checks)
+        self.checks[slot] = check
+        self.counts[slot] = count
+
+
+def perft(game, depth, cache=None):
+    """Leaf nodes of the legal move tree depth plies deep from game's position"""
+    if depth == 0:
+        return 1
+    moves = game.legal_moves
+    if depth == 1:
+        return len(moves)
+    if cache is not None:
+        key = position_key(game.snapshot())
+        if (count := cache.probe(key, depth)) is not None:
+            return count
+    count = 0
+    for move in moves:
+        game.push(move)
+        try:
+            count += perft(game, depth - 1, cache)
+        finally:
+            game.pop()
+    if cache is not None:
+        cache.store(key, depth, count)
+    return count
+
+
+def _init_worker(cache_size):
+    global _cache
+    _cache = PerftCache(cache_size) if cache_size else None
+
+
+def _perft_move(task):
+    snapshot, move, depth = task
+    game = Game.from_snapshot(snapshot)
+    game.push(move)
+    return move, perft(game, depth - 1, _cache)
+
+
+def divide(game, depth, processes=None, cache_size=1 << 20):
+    """Perft under each root move of game's position, as a dict of leaf counts by
+    move in UCI notation. The root moves are shared out over a pool of processes
+    (os.cpu_count() by default, processes=1 to stay in-process), each with its
+    own PerftCache of cache_size slots (0 for none). depth must be at least 1,
+    for there to be root moves to divide by."""
+    if depth < 1:
+        raise ValueError(f"divide needs a depth of at least 1, not {depth}")
+    snapshot = game.snapshot()
+    tasks = [(snapshot, move, depth) for move in game.legal_moves]
+    if processes == 1:
+        _init_worker(cache_size)
+        results = map(_perft_move, tasks)
+        return {move_to_uci(move): count for move, count in results}
+    with Pool(processes, _init_worker, (cache_size,)) as pool:
+        results = pool.imap_unordered(_perft_move, tasks)
+        counts = {move_to_uci(move): count for move, count in results}
+    # report in move generation order, whichever process finished first
+    return {move_to_uci(move): counts[move_to_uci(move)] for _, move, _ in tasks}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("depth", type=int)
+    parser.add_argument("--fen", help="position to count from (default: start)")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument(
+        "--cache-size", type=int, default=1 << 20, help="slots per process (0: none)"
+    )
+    args = parser.parse_args(argv)
+    if args.depth < 1:
+        parser.error("depth must be at least 1")
+    game = Game.from_fen(args.fen) if args.fen else Game()
+    start = perf_counter()
+    counts = divide(game, args.depth, args.processes, args.cache_size)
+    seconds = perf_counter() - start
+    for move, count in counts.items():
+        print(f"{move}: {count}")
+    total = sum(counts.values())
+    print(f"\nNodes searched: {total} in {seconds:.2f}s ({total / seconds:.0f}/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import re
+import textwrap
+from collections import namedtuple
+
+from chess import (
+    FEN_LETTERS,
+    PROMOTION_LETTERS,
+    coord_to_algebraic,
+    translate_algebraic,
+)
+
+PgnGame = namedtuple("PgnGame", ["headers", "moves", "result"])
+
+RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+HEADER = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# comments, variations (innermost first, see read_games), NAGs and move numbers
+COMMENT = re.compile(r"\{[^}]*\}|;[^\n]*")
+VARIATION = re.compile(r"\([^()]*\)")
+NOISE = re.compile(r"\$\d+|\d+\.+")
+
+
+def clean_san(san):
+    """Strip a SAN move down to the notation chess.translate_algebraic accepts:
+    no capture, check or promotion marks, or move annotations"""
+    return re.sub(r"[x+#=!?]", "", san)
+
+
+def san_to_move(game, san):
+    """The (start, coord, promotion) move a SAN move stands for in game's position.
+    Raises ValueError if it is illegal or ambiguous."""
+    return game.whose_turn.resolve_move(**translate_algebraic(clean_san(san)))
+
+
+def parse_movetext(text):
+    """Split PGN movetext into cleaned moves and the result, if there is one"""
+    text = COMMENT.sub(" ", text)
+    while VARIATION.search(text):
+        text = VARIATION.sub(" ", text)
+    moves, result = [], None
+    for token in NOISE.sub(" ", text).split():
+        if token in RESULTS:
+            result = token
+        else:
+            moves.append(clean_san(token))
+    return moves, result
+
+
+def read_games(file):
+    """Yield a PgnGame for every game in a PGN file (a path or an open text file),
+    reading it a line at a time so any number of games can be streamed"""
+    if isinstance(file, str):
+        with open(file) as f:
+            yield from read_games(f)
+        return
+    headers, movetext = {}, []
+    open_comments = 0
+
+    def finish():
+        moves, result = parse_movetext(" ".join(movetext))
+        return PgnGame(headers, moves, result or headers.get("Result", "*"))
+
+    for line in file:
+        line = line.strip()
+        if line.startswith("[") and (match := HEADER.match(line)):
+            if movetext:
+                yield finish()
+                headers, movetext = {}, []
+            headers[match.group(1)] = match.group(2)
+            continue
+        if line:
+            movetext.append(line)
+            # a result ends the game, unless it's inside a comment
+            open_comments += line.count("{") - line.count("}")
+            tokens = COMMENT.sub(" ", line).split()
+            if not open_comments and tokens and tokens[-1] in RESULTS:
+                yield finish()
+                headers, movetext = {}, []
+    if movetext:
+        yield finish()
+
+
+def move_to_san(game, move):
+    """Standard algebraic notation for a (start, coord, promotion) move that is
+    legal in game's position, e.g. Nbd7, exd8=Q+ or O-O-O#"""
+    start, coord, promotion = move
+    piece = game.board[start]
+    if piece.type == "king" and abs(start[0] - coord[0]) == 2:
+        san = "O-O-O" if coord[0] == 2 else "O-O"
+    else:
+        capture = game.board[coord] is not None
+        if piece.type == "pawn":
+            capture = capture or start[0] != coord[0]
+            san = coord_to_algebraic(start)[0] if capture else ""
+        else:
+            san = FEN_LETTERS["white", piece.type]
+            rivals = [
+                s
+                for s, c, _ in game.legal_moves
+                if c == coord and s != start and game.board[s].type == piece.type
+            ]
+            if rivals:
+                name = coord_to_algebraic(start)
+                if all(s[0] != start[0] for s in rivals):
+                    san += name[0]
+                elif all(s[1] != start[1] for s in rivals):
+                    san += name[1]
+                else:
+                    san += name
+        san += ("x" if capture else "") + coord_to_algebraic(coord)
+        if promotion:
+            san += "=" + PROMOTION_LETTERS[promotion].upper()
+    game.push(move)
+    try:
+        if game.whose_turn.king.in_check:
+            san += "+" if game.whose_turn.has_legal_move else "#"
+    finally:
+        game.pop()
+    return san
+
+
+def format_game(headers, moves, result, first_turn=0):
+    """PGN text for a game: headers, SAN moves numbered from first_turn (a
+    Game.turn) and the result"""
+    tokens = []
+    for turn, move in enumerate(moves, first_turn):
+        if turn % 2 == 0:
+            tokens.append(f"{turn // 2 + 1}.")
+        elif turn == first_turn:
+            tokens.append(f"{turn // 2 + 1}...")
+        tokens.append(move)
+    tokens.append(result)
+    lines = [f'[{name} "{value}"]' for name, value in headers.items()]
+    return (
+        "\n".join(lines)
+        + "\n\n"
+        + textwrap.fill(" ".join(tokens), 79, break_on_hyphens=False)
+        + "\n\n"
+    )
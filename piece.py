@@ -1,3 +1,6 @@
+from profiling import profiled
+from square import DIAGONAL, KING_STEPS, ORTHOGONAL, SQUARE_AT
+
 OPPOSITE_COLOR = {"white": "black", "black": "white"}
 
 ICONS = {
@@ -20,10 +23,15 @@ ICONS = {
 }
 
 
+def _piece_game(piece):
+    return piece.player.board.game
+
+
 class Piece:
     def __init__(self, player):
         self.player = player
         self.pos = None
+        self._moves = None
         self.moved = False
 
     def __str__(self):
@@ -34,28 +42,68 @@ class Piece:
     def __repr__(self):
         return f"{self.player.color} {self.type} at {self.pos}"
 
+    @property
+    def potential_moves(self):
+        """Squares the piece could move to ignoring check, including those with
+        pieces of either color on them.
+
+        They are cached along with the squares they depend on (see find_moves),
+        and the board drops the cache whenever one of those squares changes."""
+        if self._moves is None:
+            assert self.pos, "potential_moves called on a piece with no position"
+            self._moves, depends_on = self.find_moves()
+            dependents = self.player.board.dependents
+            for x, y in depends_on:
+                dependents[x][y].add(self)
+        return self._moves
+
     @property
     def legal_moves(self):
+        """Legal moves of this piece alone. Callers going through several of a
+        player's pieces should work out Player.evasions once and use
+        legal_moves_within instead, which skips moves that can't get out of
+        check."""
         if not self.pos:
             return []
-        potential = []
-        for m in self.potential_moves:
-            board = self.player.board
-            if (current := board[m]) is None:
-                potential.append(m)
-            else:
-                if current.player.color != self.player.color:
-                    potential.append(m)
+        return self.legal_moves_within(None)
+
+    @profiled("Piece.legal_moves", _piece_game)
+    def legal_moves_within(self, evasions):
+        """Legal moves given the player's evasions (see Player.evasions): in
+        check, only moves to those squares are tested for self-check, and none
+        at all in double check, other than the king's"""
+        board = self.player.board
+        if evasions is not None and self.type != "king":
+            if not evasions:
+                return []
+            potential = [m for m in self.potential_moves if m in evasions]
+        else:
+            potential = self.potential_moves
         legal = []
-        for p in potential:
-            if board.test_move(self, p):
-                legal.append(p)
+        for m in potential:
+            if (current := board[m]) is None or current.player is not self.player:
+                if board.test_move(self, m):
+                    legal.append(m)
         return legal
 
 
+def slide(piece):
+    """Potential moves of a piece moving along its directions until it runs into
+    a piece, and the squares they depend on"""
+    grid = piece.player.board.board
+    moves = []
+    for direction in piece.directions:
+        for coord in piece.pos.rays[direction]:
+            moves.append(coord)
+            if grid[coord[0]][coord[1]] is not None:
+                break
+    return moves, moves + [piece.pos]
+
+
 class King(Piece):
     type = "king"
 
+    @profiled("King.in_check", _piece_game)
     @property
     def in_check(self):
         # test if king is in the other player's list of threatened squares
@@ -63,45 +111,40 @@ class King(Piece):
 
     @property
     def can_castle(self):
-        if self.moved:
+        if self.moved or not self.pos:
             return []
         rooks = (self.player["qrook"], self.player["krook"])
         castleable = []
+        threatened = None
         for rook in rooks:
-            if rook.moved:
+            if rook.moved or not rook.pos:
                 continue
-            # if queenside rook, check those squares are empty and unthreatened
+            # if queenside rook, check those squares are empty and that the king
+            # doesn't pass through or land on a threatened square
             if rook.pos[0] == 0:
-                castle_squares = [(i, rook.pos[1]) for i in range(1, 4)]
+                castle_squares = [SQUARE_AT[i][rook.pos[1]] for i in range(1, 4)]
+                king_squares = castle_squares[1:]
                 side = "queenside"
             # else check kingside squares
             elif rook.pos[0] == 7:
-                castle_squares = [(i, rook.pos[1]) for i in range(5, 7)]
+                castle_squares = [SQUARE_AT[i][rook.pos[1]] for i in range(5, 7)]
+                king_squares = castle_squares
                 side = "kingside"
             else:
                 raise RuntimeError(f"Castling evaluation run on invalid piece, {rook}")
-            if all(
-                [
-                    self.player.board[c] is None
-                    and c not in self.player.other_player.threatens_all
-                    for c in castle_squares
-                ]
-            ):
-                castleable.append(side)
+            if all(self.player.board[c] is None for c in castle_squares):
+                if threatened is None:
+                    threatened = self.player.other_player.threatens_all
+                # can't castle out of check either
+                if self.pos not in threatened and not any(
+                    c in threatened for c in king_squares
+                ):
+                    castleable.append(side)
         return castleable
 
-    @property
-    def potential_moves(self):
-        assert self.pos, "potential_moves called on a piece with no position"
-        x, y = self.pos
-        moves = []
-        for dx in (-1, 0, 1):
-            for dy in (-1, 0, 1):
-                if not dx == 0 == dy:
-                    if 0 <= x + dx <= 7 and 0 <= y + dy <= 7:
-                        coord = (x + dx, y + dy)
-                        moves.append(coord)
-        return moves
+    def find_moves(self):
+        """Return the potential moves and the squares they depend on"""
+        return list(self.pos.neighbors), [self.pos]
 
     @property
     def threatens(self):
@@ -113,22 +156,12 @@ class King(Piece):
 class Queen(Piece):
     type = "queen"
 
-    @property
-    def potential_moves(self):
-        assert self.pos, "potential_moves called on a piece with no position"
-        x, y = self.pos
-        moves = []
-        for dx in (-1, 0, 1):
-            for dy in (-1, 0, 1):
-                if not dx == 0 == dy:
-                    i = 1
-                    while 0 <= x + dx * i <= 7 and 0 <= y + dy * i <= 7:
-                        coord = (x + dx * i, y + dy * i)
-                        moves.append(coord)
-                        i += 1
-                        if self.player.board[coord] is not None:
-                            break
-        return moves
+    directions = KING_STEPS
+
+    def find_moves(self):
+        """Return the potential moves and the squares they depend on, which are
+        the squares along each line up to the first piece"""
+        return slide(self)
 
     @property
     def threatens(self):
@@ -140,20 +173,12 @@ class Queen(Piece):
 class Rook(Piece):
     type = "rook"
 
-    @property
-    def potential_moves(self):
-        assert self.pos, "potential_moves called on a piece with no position"
-        x, y = self.pos
-        moves = []
-        for dx, dy in [(1, 0), (0, -1), (-1, -0), (-0, 1)]:
-            i = 1
-            while 0 <= x + dx * i <= 7 and 0 <= y + dy * i <= 7:
-                coord = (x + dx * i, y + dy * i)
-                moves.append(coord)
-                i += 1
-                if self.player.board[coord] is not None:
-                    break
-        return moves
+    directions = ORTHOGONAL
+
+    def find_moves(self):
+        """Return the potential moves and the squares they depend on, which are
+        the squares along each line up to the first piece"""
+        return slide(self)
 
     @property
     def threatens(self):
@@ -165,20 +190,12 @@ class Rook(Piece):
 class Bishop(Piece):
     type = "bishop"
 
-    @property
-    def potential_moves(self):
-        assert self.pos, "potential_moves called on a piece with no position"
-        x, y = self.pos
-        moves = []
-        for dx, dy in [(1, 1), (1, -1), (-1, -1), (-1, 1)]:
-            i = 1
-            while 0 <= x + dx * i <= 7 and 0 <= y + dy * i <= 7:
-                coord = (x + dx * i, y + dy * i)
-                moves.append(coord)
-                i += 1
-                if self.player.board[coord] is not None:
-                    break
-        return moves
+    directions = DIAGONAL
+
+    def find_moves(self):
+        """Return the potential moves and the squares they depend on, which are
+        the squares along each line up to the first piece"""
+        return slide(self)
 
     @property
     def threatens(self):
@@ -190,16 +207,9 @@ class Bishop(Piece):
 class Knight(Piece):
     type = "knight"
 
-    @property
-    def potential_moves(self):
-        assert self.pos, "potential_moves called on a piece with no position"
-        x, y = self.pos
-        moves = []
-        for dx in [-2, -1, 1, 2]:
-            for dy in [-2, -1, 1, 2]:
-                if abs(dx) != abs(dy) and 0 <= x + dx <= 7 and 0 <= y + dy <= 7:
-                    moves.append((x + dx, y + dy))
-        return moves
+    def find_moves(self):
+        """Return the potential moves and the squares they depend on"""
+        return list(self.pos.knight_jumps), [self.pos]
 
     @property
     def threatens(self):
@@ -215,28 +225,61 @@ class Pawn(Piece):
         self.double_step = None
         Piece.__init__(self, player)
 
+    @property
+    def moved(self):
+        return self._moved
+
+    @moved.setter
+    def moved(self, moved):
+        # whether a double step is possible depends on it
+        self._moved = moved
+        self._moves = None
+
     @property
     def potential_moves(self):
+        moves = Piece.potential_moves.fget(self)
+        # en passant depends on the turn, so it's never cached
+        if en_passant := self.en_passant_moves():
+            return moves + en_passant
+        return moves
+
+    def find_moves(self):
+        """Return the potential moves, except en passant, and the squares they
+        depend on"""
         direction = 1 if self.player.color == "white" else -1
         board = self.player.board
-        assert self.pos, "potential_moves called on a piece with no position"
         moves = []
         x, y = self.pos
+        depends_on = [self.pos]
         if 0 <= y + direction <= 7:  # piece not at end of board
-            one_step = (x, y + direction)
+            one_step = SQUARE_AT[x][y + direction]
+            depends_on.append(one_step)
             if board[one_step] is None:
                 moves.append(one_step)
-                two_step = (x, y + 2 * direction)
-                if not self.moved and board[two_step] is None:
-                    moves.append(two_step)
+                if not self.moved:
+                    two_step = SQUARE_AT[x][y + 2 * direction]
+                    depends_on.append(two_step)
+                    if board[two_step] is None:
+                        moves.append(two_step)
             for lateral in [-1, 1]:
                 if 0 <= x + lateral <= 7:  # piece not at side of board
-                    diagonal = (x + lateral, y + direction)
+                    diagonal = SQUARE_AT[x + lateral][y + direction]
+                    depends_on.append(diagonal)
                     if board[diagonal] is not None:
                         moves.append(diagonal)
-                    else:
-                        side = (x + lateral, y)
-                        side_piece = board[side]
+        return moves, depends_on
+
+    def en_passant_moves(self):
+        direction = 1 if self.player.color == "white" else -1
+        board = self.player.board
+        x, y = self.pos
+        moves = []
+        if 0 <= y + direction <= 7:
+            for lateral in [-1, 1]:
+                if 0 <= x + lateral <= 7:
+                    diagonal = SQUARE_AT[x + lateral][y + direction]
+                    if board[diagonal] is None:
+                        side_piece = board.board[x + lateral][y]
                         if (
                             side_piece is not None
                             and side_piece.player.color != self.player.color
@@ -249,15 +292,27 @@ class Pawn(Piece):
 
     @property
     def threatens(self):
-        direction = 1 if self.player.color == "white" else -1
         if not self.pos:
             return []
         x, y = self.pos
-        threatens = []
-        for lateral in [-1, 1]:
-            diagonal = (x + lateral, y + direction)
-            if (
-                0 <= x + lateral <= 7 and 0 <= y + direction <= 7
-            ):  # piece not on edges of board
-                threatens.append(diagonal)
-        return threatens
+        return PAWN_THREATS[self.player.color][x][y]
+
+
+def _pawn_threats(direction):
+    threats = []
+    for x in range(8):
+        threats.append([])
+        for y in range(8):
+            threats[x].append(
+                [
+                    SQUARE_AT[x + lateral][y + direction]
+                    for lateral in [-1, 1]
+                    # piece not on edges of board
+                    if 0 <= x + lateral <= 7 and 0 <= y + direction <= 7
+                ]
+            )
+    return threats
+
+
+# squares threatened by a pawn of each color, by the pawn's coords
+PAWN_THREATS = {"white": _pawn_threats(1), "black": _pawn_threats(-1)}
@@ -1,12 +1,34 @@
-from board import COLOR, OPPOSITE_COLOR, ALGEBRAIC_X
+from board import COLOR, OPPOSITE_COLOR
+from square import BY_NAME, KING_STEPS, SQUARE_AT, square
+
+# directions in the order each piece has always listed its moves
+ROOK_LINES = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_LINES = [(1, 1), (1, -1), (-1, -1), (-1, 1)]
+KNIGHT_JUMPS = [
+    (x, y) for x in (-2, -1, 1, 2) for y in (-2, -1, 1, 2) if abs(x) != abs(y)
+]
 
 
 def translate_algebraic(coord, dx, dy):
     """Apply movements to algebraic coordinates and return a new algebraic coordinate,
     or None if out side of a chessboard"""
-    x, y = ALGEBRAIC_X.index(coord[0]), int(coord[1])
-    if 0 <= x + dx < 8 and 1 <= y + dy < 9:  # y is 1 indexed
-        return ALGEBRAIC_X[x + dx] + str(y + dy)
+    x, y = square(coord)
+    if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+        return SQUARE_AT[x + dx][y + dy].name
+
+
+def lines(piece, directions):
+    """Squares along each of directions from piece up to the first piece in the
+    way, which is included whatever its color, using the core's precomputed
+    rays"""
+    board = piece.board.board
+    moves = []
+    for direction in directions:
+        for square in BY_NAME[piece.pos].rays[direction]:
+            moves.append(square.name)
+            if board[square.name] is not None:
+                break
+    return moves
 
 
 class Piece:
@@ -73,14 +95,7 @@ class King(Piece):
     @property
     def legal_moves(self):
         assert self.pos, "can't check moves on a piece not on the board"
-        moves = []
-        for x in (-1, 0, 1):
-            for y in (-1, 0, 1):
-                if not (x == 0 and y == 0):
-                    step = translate_algebraic(self.pos, x, y)
-                    if step is not None:
-                        moves.append(step)
-        return moves
+        return [square.name for square in BY_NAME[self.pos].neighbors]
 
     @property
     def can_castle(self):
@@ -147,6 +162,8 @@ class King(Piece):
         return self.test_check(self.pos)
 
     def test_check(self, coord):
+        # threatened squares are cached by the board until the position changes,
+        # so checking several squares costs a single scan of the board
         return coord in self.board.threatened_squares[self.color]
 
 
@@ -155,25 +172,8 @@ class Queen(Piece):
 
     @property
     def legal_moves(self):
-        board = self.board.board
         assert self.pos, "can't check moves on a piece not on the board"
-        moves = []
-        for x in (-1, 0, 1):
-            for y in (-1, 0, 1):
-                if not (x == 0 and y == 0):
-                    i = 1
-                    # keep looking further out in each direction until end of
-                    # board or a piece is hit
-                    while True:
-                        line = translate_algebraic(self.pos, x * i, y * i)
-                        if line is not None and board[line] is None:
-                            moves.append(line)
-                            i += 1
-                        else:
-                            if line is not None:
-                                moves.append(line)
-                            break
-        return moves
+        return lines(self, KING_STEPS)
 
 
 class Rook(Piece):
@@ -181,23 +181,8 @@ class Rook(Piece):
 
     @property
     def legal_moves(self):
-        board = self.board.board
         assert self.pos, "can't check moves on a piece not on the board"
-        moves = []
-        for x, y in [(1, 0), (0, 1), (-1, 0), (0, -1)]:
-            i = 1
-            # keep looking further out in each direction until end of
-            # board or a piece is hit
-            while True:
-                line = translate_algebraic(self.pos, x * i, y * i)
-                if line is not None and board[line] is None:
-                    moves.append(line)
-                    i += 1
-                else:
-                    if line is not None:
-                        moves.append(line)
-                    break
-        return moves
+        return lines(self, ROOK_LINES)
 
 
 class Knight(Piece):
@@ -206,14 +191,12 @@ class Knight(Piece):
     @property
     def legal_moves(self):
         assert self.pos, "can't check moves on a piece not on the board"
-        knight_moves = []
-        for x in [-2, -1, 1, 2]:
-            for y in [-2, -1, 1, 2]:
-                if abs(x) != abs(y) and (
-                    new_pos := translate_algebraic(self.pos, x, y)
-                ):
-                    knight_moves.append(new_pos)
-        return knight_moves
+        x, y = BY_NAME[self.pos]
+        return [
+            SQUARE_AT[x + dx][y + dy].name
+            for dx, dy in KNIGHT_JUMPS
+            if 0 <= x + dx < 8 and 0 <= y + dy < 8
+        ]
 
 
 class Bishop(Piece):
@@ -221,21 +204,8 @@ class Bishop(Piece):
 
     @property
     def legal_moves(self):
-        board = self.board.board
         assert self.pos, "can't check moves on a piece not on the board"
-        moves = []
-        for x, y in [(1, 1), (1, -1), (-1, -1), (-1, 1)]:
-            i = 1
-            while True:
-                diag = translate_algebraic(self.pos, x * i, y * i)
-                if diag is not None and board[diag] is None:
-                    moves.append(diag)
-                    i += 1
-                else:
-                    if diag is not None:
-                        moves.append(diag)
-                    break
-        return moves
+        return lines(self, BISHOP_LINES)
 
 
 class Pawn(Piece):
@@ -0,0 +1,150 @@
+import json
+import weakref
+from functools import wraps
+from time import perf_counter
+
+# number of games with profiling enabled
+_active = 0
+# (class, attribute, original, instrumented) for every profiled attribute
+_sites = []
+
+
+class Profiler:
+    """Call counts and time spent in instrumented methods for a single Game.
+
+    Times are inclusive, so a method that calls another instrumented method
+    (e.g. Piece.legal_moves -> Board.test_move) is charged for both."""
+
+    def __init__(self, game, per_turn=False):
+        self.game = game
+        self.per_turn = per_turn
+        self.counters = {}
+        self.turns = {}
+
+    def record(self, name, elapsed):
+        counter = self.counters.setdefault(name, [0, 0.0])
+        counter[0] += 1
+        counter[1] += elapsed
+        if self.per_turn:
+            turn = self.turns.setdefault(self.game.turn, {})
+            counter = turn.setdefault(name, [0, 0.0])
+            counter[0] += 1
+            counter[1] += elapsed
+
+    def reset(self):
+        self.counters = {}
+        self.turns = {}
+
+    def to_dict(self):
+        report = {
+            "methods": {
+                name: {"calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in sorted(self.counters.items())
+            }
+        }
+        if self.per_turn:
+            report["turns"] = {
+                turn: {
+                    name: {"calls": calls, "seconds": seconds}
+                    for name, (calls, seconds) in sorted(counters.items())
+                }
+                for turn, counters in sorted(self.turns.items())
+            }
+        return report
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, labels=None):
+        """Render the counters in the Prometheus text exposition format"""
+        extra = "".join(f',{k}="{v}"' for k, v in sorted((labels or {}).items()))
+        lines = [
+            "# HELP chess_calls_total Calls to instrumented chess methods.",
+            "# TYPE chess_calls_total counter",
+        ]
+        for name, (calls, _) in sorted(self.counters.items()):
+            lines.append(f'chess_calls_total{{method="{name}"{extra}}} {calls}')
+        lines += [
+            "# HELP chess_seconds_total Time spent in instrumented chess methods.",
+            "# TYPE chess_seconds_total counter",
+        ]
+        for name, (_, seconds) in sorted(self.counters.items()):
+            lines.append(f'chess_seconds_total{{method="{name}"{extra}}} {seconds!r}')
+        return "\n".join(lines) + "\n"
+
+
+def enable(game, per_turn=False):
+    global _active
+    if game.profiler is None:
+        if not _active:
+            for owner, attr, _, instrumented in _sites:
+                setattr(owner, attr, instrumented)
+        _active += 1
+        # a game dropped without disabling profiling still gives up its share
+        finalizer = weakref.finalize(game, _release)
+    else:
+        finalizer = game.profiler.finalizer
+    game.profiler = Profiler(game, per_turn)
+    game.profiler.finalizer = finalizer
+    return game.profiler
+
+
+def disable(game):
+    if game.profiler is not None:
+        game.profiler.finalizer()
+    profiler, game.profiler = game.profiler, None
+    return profiler
+
+
+def _release():
+    global _active
+    _active -= 1
+    if not _active:
+        for owner, attr, original, _ in _sites:
+            setattr(owner, attr, original)
+
+
+def _instrument(func, name, game_of):
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        profiler = game_of(self).profiler
+        if profiler is None:
+            return func(self, *args, **kwargs)
+        start = perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            profiler.record(name, perf_counter() - start)
+
+    return wrapper
+
+
+class profiled:
+    """Mark a method or property so its calls and time are recorded on the Game
+    found by game_of(self), for games with profiling enabled.
+
+    The class keeps the undecorated attribute until some game enables profiling,
+    at which point every marked attribute is swapped for its instrumented
+    version, so there is no overhead at all while profiling is unused."""
+
+    def __init__(self, name, game_of):
+        self.name = name
+        self.game_of = game_of
+
+    def __call__(self, attribute):
+        self.attribute = attribute
+        return self
+
+    def __set_name__(self, owner, attr):
+        original = self.attribute
+        if isinstance(original, property):
+            instrumented = property(
+                _instrument(original.fget, self.name, self.game_of),
+                original.fset,
+                original.fdel,
+                original.__doc__,
+            )
+        else:
+            instrumented = _instrument(original, self.name, self.game_of)
+        _sites.append((owner, attr, original, instrumented))
+        setattr(owner, attr, instrumented if _active else original)
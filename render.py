@@ -0,0 +1,136 @@
+"""Drawing boards as text. Everything that doesn't depend on the position (rank
+and file labels, square colors, the text of every piece on every square) is
+built once at import, so drawing a board is a lookup per square and a join.
+
+text() is the colored board Board.__str__ shows, plain() a compact one for
+logs, and a TerminalRenderer redraws a board in place in a terminal, rewriting
+only the squares that changed since it last drew."""
+
+import sys
+
+from piece import ICONS, OPPOSITE_COLOR
+from square import SQUARE_AT
+
+DARK = "\u001b[47m\u001b[30m"  # ]]
+RESET = "\u001b[0m"  # ]
+LETTERS = {
+    "king": "k",
+    "queen": "q",
+    "rook": "r",
+    "bishop": "b",
+    "knight": "n",
+    "pawn": "p",
+}
+
+# the text of each square, by x, y and then (color, piece type) or None if empty
+CELLS = [[{} for y in range(8)] for x in range(8)]
+# the letter of each piece in plain(), uppercase for white as in FEN
+PLAIN_LETTERS = {None: "."}
+for _color in ["white", "black"]:
+    for _type, _letter in LETTERS.items():
+        PLAIN_LETTERS[_color, _type] = _letter.upper() if _color == "white" else _letter
+for _x in range(8):
+    for _y in range(8):
+        _dark = SQUARE_AT[_x][_y].color == "black"
+        for _key in PLAIN_LETTERS:
+            if _key is None:
+                _icon = " "
+            else:
+                # pieces on dark squares use the other color's icon, which reads
+                # better against the background
+                _icon = ICONS[OPPOSITE_COLOR[_key[0]] if _dark else _key[0]][_key[1]]
+            CELLS[_x][_y][_key] = DARK + _icon + " " + RESET if _dark else _icon + " "
+del _color, _type, _letter, _x, _y, _dark, _key, _icon
+
+RANK_LABELS = [f"{y + 1} --" for y in range(8)]
+FOOTER = "\n  *  " + " ".join("|" * 8) + "\n" + " " * 5 + " ".join("abcdefgh")
+# text() rows are this wide before the first square, in terminal columns
+LABEL_WIDTH = len(RANK_LABELS[0])
+
+
+def _key(piece):
+    return None if piece is None else (piece.player.color, piece.type)
+
+
+def text(board):
+    """The board with colored squares, rank 8 at the top"""
+    grid = board.board
+    parts = []
+    for y in reversed(range(8)):
+        parts.append(RANK_LABELS[y])
+        for x in range(8):
+            piece = grid[x][y]
+            cells = CELLS[x][y]
+            parts.append(
+                cells[None] if piece is None else cells[piece.player.color, piece.type]
+            )
+        if y:
+            parts.append("\n")
+    parts.append(FOOTER)
+    return "".join(parts)
+
+
+def plain(board):
+    """The board as eight lines of FEN letters, "." for empty squares, with no
+    colors or icons, for logs"""
+    grid = board.board
+    rows = []
+    for y in reversed(range(8)):
+        rows.append("".join(PLAIN_LETTERS[_key(grid[x][y])] for x in range(8)))
+    return "\n".join(rows)
+
+
+class TerminalRenderer:
+    """Draws a board in an ANSI terminal with its top left corner at line top,
+    column left (both from 1), then keeps it up to date by rewriting only the
+    squares that changed since the last draw. Anything printed below the board
+    is cleared on each draw unless clear_below is False, which lets several
+    renderers with different corners show several games on one screen."""
+
+    def __init__(self, output=None, top=1, left=1, clear_below=True):
+        self.output = output or sys.stdout
+        self.top = top
+        self.left = left
+        self.clear_below = clear_below
+        # what each square showed when last drawn, None until the first draw
+        self.shown = None
+
+    def reset(self):
+        """Draw the whole board next time, e.g. after the screen was cleared"""
+        self.shown = None
+
+    def draw(self, board):
+        grid = board.board
+        parts = []
+        if self.shown is None:
+            self.shown = [[None] * 8 for x in range(8)]
+            if self.clear_below:
+                parts.append(self.position(self.top, 1) + "\u001b[J")  # ]
+            for i, line in enumerate(text(board).split("\n")):
+                parts.append(self.position(self.top + i, self.left) + line)
+            for x in range(8):
+                for y in range(8):
+                    self.shown[x][y] = _key(grid[x][y])
+        else:
+            for x in range(8):
+                shown = self.shown[x]
+                for y in range(8):
+                    key = _key(grid[x][y])
+                    if key != shown[y]:
+                        shown[y] = key
+                        parts.append(
+                            self.position(
+                                self.top + 7 - y, self.left + LABEL_WIDTH + 2 * x
+                            )
+                            + CELLS[x][y][key]
+                        )
+        # leave the cursor under the board
+        parts.append(self.position(self.top + 10, 1))
+        if self.clear_below:
+            parts.append("\u001b[J")  # ]
+        self.output.write("".join(parts))
+        self.output.flush()
+
+    @staticmethod
+    def position(line, column):
+        return f"\u001b[{line};{column}H"  # ]
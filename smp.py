@@ -0,0 +1,121 @@
+"""Lazy SMP: several processes search the same position, sharing a transposition
+table in shared memory, and the deepest result any of them completes is used."""
+
+import argparse
+import os
+from multiprocessing import Pool, shared_memory
+from time import perf_counter
+
+from chess import Game
+from engine import Info, Search, TranspositionTable
+
+
+def _search_worker(snapshot, tt_name, tt_size, worker, depth, movetime, nodes):
+    memory = shared_memory.SharedMemory(name=tt_name)
+    tt = TranspositionTable(buffer=memory.buf[:tt_size])
+    try:
+        # the first worker keeps the normal move order, helpers shuffle theirs
+        search = Search(
+            Game.from_snapshot(snapshot),
+            depth,
+            movetime,
+            nodes,
+            tt=tt,
+            seed=worker or None,
+        )
+        start = perf_counter()
+        info = search.run()
+        return worker, info, search.nodes, perf_counter() - start
+    finally:
+        tt.close()
+        memory.close()
+
+
+def parallel_search(
+    game, workers=None, depth=None, movetime=None, nodes=None, tt_size=1 << 24
+):
+    """Search game's position with workers processes (os.cpu_count() by default)
+    sharing a tt_size byte transposition table. Limits apply to each worker.
+
+    Returns an Info with the lines of the deepest search completed (preferring
+    the main worker on ties), the nodes searched by all workers together and
+    the seconds the longest of their searches took, which leaves out starting
+    the processes. None if no worker completed a search."""
+    workers = workers or os.cpu_count()
+    snapshot = game.snapshot()
+    memory = shared_memory.SharedMemory(create=True, size=tt_size)
+    try:
+        memory.buf[:tt_size] = bytes(tt_size)
+        with Pool(workers) as pool:
+            results = pool.starmap(
+                _search_worker,
+                [
+                    (snapshot, memory.name, tt_size, i, depth, movetime, nodes)
+                    for i in range(workers)
+                ],
+            )
+    finally:
+        memory.close()
+        memory.unlink()
+    total_nodes = sum(n for _, _, n, _ in results)
+    seconds = max(s for _, _, _, s in results)
+    completed = [(info.depth, -worker, info) for worker, info, _, _ in results if info]
+    if not completed:
+        return None
+    _, _, best = max(completed, key=lambda result: result[:2])
+    return Info(best.depth, best.lines, total_nodes, seconds)
+
+
+def benchmark(game, worker_counts, movetime=5.0):
+    """Nodes per second searched with each number of workers, over movetime
+    seconds each. Time spent starting and stopping the processes is reported
+    separately as startup, rather than counted against the search."""
+    results = []
+    for workers in worker_counts:
+        start = perf_counter()
+        info = parallel_search(game, workers, movetime=movetime)
+        elapsed = perf_counter() - start
+        if info is None:
+            # nothing to search (the game is over) or no depth completed
+            results.append(
+                {
+                    "workers": workers,
+                    "nodes": 0,
+                    "seconds": 0.0,
+                    "startup": elapsed,
+                    "nps": 0.0,
+                    "depth": 0,
+                }
+            )
+            continue
+        results.append(
+            {
+                "workers": workers,
+                "nodes": info.nodes,
+                "seconds": info.seconds,
+                "startup": elapsed - info.seconds,
+                "nps": info.nodes / info.seconds if info.seconds > 0 else 0.0,
+                "depth": info.depth,
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lazy SMP nodes/sec scaling")
+    parser.add_argument("--fen", help="position to search (default: start)")
+    parser.add_argument("--movetime", type=float, default=5.0)
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()]
+    )
+    args = parser.parse_args()
+    game = Game.from_fen(args.fen) if args.fen else Game()
+    baseline = None
+    for result in benchmark(game, args.workers, args.movetime):
+        baseline = baseline or result["nps"]
+        scaling = result["nps"] / baseline if baseline else 0.0
+        print(
+            f"{result['workers']:>3} workers: {result['nps']:>10.0f} nodes/sec "
+            f"({scaling:.2f}x), depth {result['depth']}, "
+            f"{result['startup']:.2f}s startup"
+        )
@@ -0,0 +1,78 @@
+"""The 64 squares of the board as interned Square objects, with everything about
+them worked out once up front, so converting between forms and walking the
+board are table lookups rather than string searches and tuple building."""
+
+FILES = "abcdefgh"
+RANKS = "12345678"
+FILE_INDEX = {f: x for x, f in enumerate(FILES)}
+RANK_INDEX = {r: y for y, r in enumerate(RANKS)}
+
+KING_STEPS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+KNIGHT_JUMPS = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+ORTHOGONAL = [(1, 0), (0, -1), (-1, 0), (0, 1)]
+DIAGONAL = [(1, 1), (1, -1), (-1, -1), (-1, 1)]
+
+
+class Square(tuple):
+    """A square as an (x, y) tuple (a1 is (0, 0)), so it compares and hashes equal
+    to the plain tuple, with precomputed:
+
+    index -- y * 8 + x, as in Snapshot placements and Moves
+    file, rank -- x and y
+    name -- algebraic name, e.g. "e4"
+    color -- "black" for dark squares, "white" for light ones
+    neighbors -- the squares a king step away
+    knight_jumps -- the squares a knight's jump away
+    rays -- the squares in each (dx, dy) direction, nearest first
+
+    There is only ever one Square for each square: get them with square(), from
+    SQUARES by index or from BY_NAME."""
+
+    def __new__(cls, x, y):
+        self = tuple.__new__(cls, (x, y))
+        self.index = y * 8 + x
+        self.file, self.rank = x, y
+        self.name = FILES[x] + RANKS[y]
+        self.color = "black" if (x + y) % 2 == 0 else "white"
+        return self
+
+    def __repr__(self):
+        return f"Square({self.name})"
+
+    def __reduce__(self):
+        # unpickle as the interned square
+        return square, (tuple(self),)
+
+
+SQUARES = [Square(i % 8, i // 8) for i in range(64)]
+# SQUARE_AT[x][y]
+SQUARE_AT = [[SQUARES[y * 8 + x] for y in range(8)] for x in range(8)]
+BY_NAME = {s.name: s for s in SQUARES}
+
+
+def _walk(x, y, dx, dy, limit=7):
+    squares = []
+    for i in range(1, limit + 1):
+        if not (0 <= x + dx * i <= 7 and 0 <= y + dy * i <= 7):
+            break
+        squares.append(SQUARE_AT[x + dx * i][y + dy * i])
+    return tuple(squares)
+
+
+for _s in SQUARES:
+    _s.neighbors = tuple(t for d in KING_STEPS for t in _walk(*_s, *d, limit=1))
+    _s.knight_jumps = tuple(t for d in KNIGHT_JUMPS for t in _walk(*_s, *d, limit=1))
+    _s.rays = {d: _walk(*_s, *d) for d in ORTHOGONAL + DIAGONAL}
+del _s
+
+
+def square(coord):
+    """The Square for an (x, y) tuple, a Square or an algebraic name"""
+    if isinstance(coord, str):
+        if coord not in BY_NAME:
+            raise ValueError(f"invalid square {coord}")
+        return BY_NAME[coord]
+    x, y = coord
+    if not (0 <= x <= 7 and 0 <= y <= 7):
+        raise ValueError(f"invalid square {coord}")
+    return SQUARE_AT[x][y]
@@ -1,6 +1,30 @@
+import asyncio
+import gc
+import json
+import os
+import pickle
 from io import StringIO
+from time import perf_counter
 from chess import *
 import pytest
+import features
+import batch
+import engine
+import smp
+import pgn
+import bench
+import uci
+import tournament
+import epd
+import tune
+import corpus
+import perft
+import mate
+import journal
+import board as legacy_board
+import pieces as legacy_pieces
+import render
+import analysis
 
 
 def translate_coord(coord):
@@ -391,3 +415,1435 @@ class TestPawn:
         assert translate_coord("d5") in white["pawn_1"].legal_moves
         board.remove_piece(white["qrook"])
         assert translate_coord("e3") in black["pawn_1"].legal_moves
+
+
+class TestProfiling:
+    def test_counters(self, new_game):
+        game, board, white, black = new_game
+        profiler = game.enable_profiling()
+        game.play_turn("e4")
+        game.play_turn("e5")
+        assert game.game_over is None
+        for name in [
+            "Piece.legal_moves",
+            "Board.test_move",
+            "Player.threatens_all",
+            "King.in_check",
+            "Player.make_move",
+        ]:
+            calls, seconds = profiler.counters[name]
+            assert calls > 0 and seconds >= 0
+        assert profiler.counters["Player.make_move"][0] == 2
+        report = json.loads(profiler.to_json())
+        assert report["methods"]["Player.make_move"]["calls"] == 2
+        text = profiler.to_prometheus({"game": "1"})
+        assert 'chess_calls_total{method="Player.make_move",game="1"} 2' in text
+
+    def test_per_turn(self, new_game):
+        game, board, white, black = new_game
+        profiler = game.enable_profiling(per_turn=True)
+        game.play_turn("d4")
+        game.play_turn("d5")
+        assert set(profiler.turns) == {0, 1}
+        assert profiler.turns[1]["Player.make_move"][0] == 1
+
+    def test_disabled(self, new_game):
+        game, board, white, black = new_game
+        # games other tests left profiled are released when collected
+        gc.collect()
+        active = profiling._active
+        other = Game()
+        other.enable_profiling()
+        profiler = game.enable_profiling()
+        assert game.disable_profiling() is profiler
+        game.play_turn("e4")
+        assert profiler.counters == {}
+        assert game.profiler is None
+        other.disable_profiling()
+        assert profiling._active == active
+
+    def test_released_with_game(self):
+        gc.collect()
+        active = profiling._active
+        game = Game()
+        game.enable_profiling()
+        game.enable_profiling(per_turn=True)
+        assert profiling._active == active + 1
+        del game
+        gc.collect()
+        assert profiling._active == active
+        if not active:
+            for owner, attr, original, _ in profiling._sites:
+                assert owner.__dict__[attr] is original
+
+
+class TestFeatures:
+    @pytest.fixture(autouse=True)
+    def numpy(self):
+        # skip just these tests, not the whole module, without numpy
+        self.np = pytest.importorskip("numpy")
+
+    def test_start_position(self, new_game):
+        game, board, white, black = new_game
+        planes = features.encode(game)
+        assert planes.shape == features.SHAPE
+        assert planes[:12].sum() == 32
+        assert planes[features.PIECE_PLANES["white", "king"], 0, 4] == 1
+        assert planes[features.PIECE_PLANES["black", "pawn"], 6].sum() == 8
+        assert planes[features.SIDE_TO_MOVE_PLANE].all()
+        assert planes[13:17].all()
+        assert not planes[features.EN_PASSANT_PLANE].any()
+
+    def test_state_planes(self, new_game):
+        game, board, white, black = new_game
+        game.play_turn("e4")
+        planes = features.encode(game)
+        assert not planes[features.SIDE_TO_MOVE_PLANE].any()
+        assert planes[features.EN_PASSANT_PLANE, 2, 4] == 1
+        assert planes[features.EN_PASSANT_PLANE].sum() == 1
+        white["krook"].moved = True
+        assert game.castling_rights == "Qkq"
+        planes = features.encode(game, planes)
+        assert not planes[features.CASTLING_PLANES["K"]].any()
+        assert planes[features.CASTLING_PLANES["Q"]].all()
+
+    def test_batches(self, tmp_path):
+        moves = ["e4", "e5", "Nf3", "Nc6", "Bb5"]
+        batches = [b.copy() for b in features.iter_batches(replay(moves), 4)]
+        assert [len(b) for b in batches] == [4, 2]
+        paths = features.save_batches(replay(moves), str(tmp_path / "planes"), 4)
+        assert len(paths) == 2
+        assert (self.np.load(paths[1]) == batches[1]).all()
+        planes = features.open_memmap(str(tmp_path / "all.npy"), 6)
+        assert features.encode_batch(replay(moves), planes) == 6
+        planes.flush()
+        loaded = self.np.load(str(tmp_path / "all.npy"), mmap_mode="r")
+        assert (loaded[4:] == batches[1]).all()
+        assert loaded[5, features.PIECE_PLANES["white", "bishop"], 4, 1] == 1
+
+
+class TestFen:
+    KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+    def test_round_trip(self, new_game):
+        game, board, white, black = new_game
+        start = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+        assert game.fen == start
+        game.play_turn("e4")
+        game.play_turn("c5")
+        fen = "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2"
+        assert game.fen == fen
+        assert Game.from_fen(fen).fen == fen
+        game.set_fen(self.KIWIPETE)
+        assert game.fen == self.KIWIPETE
+        assert len(white.pieces) == 16
+
+    def test_set_fen(self):
+        game = Game.from_fen("4k3/1P6/8/8/8/8/8/R3K2R w KQ - 0 1")
+        white, black = game.board.players["white"], game.board.players["black"]
+        assert white.king.can_castle == ["queenside", "kingside"]
+        assert white["qrook"].pos == (0, 0)
+        assert len(black.removed) == 15
+        game.play_turn("b8Q")
+        assert isinstance(game.board["b8"], Queen)
+        with pytest.raises(ValueError):
+            game.set_fen("4k3/8/8/8/8/8/8/4K3 w Q - 0 1")
+        with pytest.raises(ValueError):
+            game.set_fen("4k3/9/8/8/8/8/8/4K3 w - - 0 1")
+
+    def test_legal_moves(self):
+        game = Game.from_fen(self.KIWIPETE)
+        moves = [move_to_uci(m) for m in game.legal_moves]
+        assert len(moves) == 48
+        assert "e1g1" in moves and "e1c1" in moves
+        game = Game.from_fen("8/4P3/8/8/8/k7/8/K7 w - - 0 1")
+        moves = [move_to_uci(m) for m in game.legal_moves]
+        assert {"e7e8q", "e7e8r", "e7e8b", "e7e8n"} < set(moves)
+
+    def test_castle_out_of_check(self):
+        game = Game.from_fen("4k3/8/8/8/8/8/8/R3K2r w Q - 0 1")
+        assert game.board.players["white"].king.can_castle == []
+
+
+class TestBatch:
+    def test_evaluate_positions(self):
+        positions = [
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+            "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3",
+            "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1",
+            Game.from_fen(TestFen.KIWIPETE),
+        ]
+        results = batch.evaluate_positions(positions)
+        assert [len(r["legal_moves"]) for r in results] == [20, 0, 0, 48]
+        assert [r["game_over"] for r in results] == [
+            None,
+            "checkmate",
+            "stalemate",
+            None,
+        ]
+        assert [r["in_check"] for r in results] == [False, True, False, False]
+        assert results[3]["fen"] == TestFen.KIWIPETE
+
+    def test_parallel(self):
+        fens = ["rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"] * 4
+        fens.append("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+        serial = batch.evaluate_positions(fens, processes=1)
+        parallel = batch.evaluate_positions(fens * 60, processes=2, chunksize=50)
+        assert parallel == serial * 60
+
+
+class TestSnapshot:
+    def test_snapshot(self, new_game):
+        game, board, white, black = new_game
+        start = game.snapshot()
+        assert start == Game().snapshot()
+        assert len(start.placement) == 64
+        assert start.placement[:8] == b"RNBQKBNR"
+        game.play_turn("e4")
+        after = game.snapshot()
+        assert after != start
+        assert after.en_passant == (4, 2)
+        assert len({start, after, Game().snapshot()}) == 2
+        assert pickle.loads(pickle.dumps(after)) == after
+
+    def test_restore(self, new_game):
+        game, board, white, black = new_game
+        for move in ["e4", "d5", "e5", "f5"]:
+            game.play_turn(move)
+        snapshot = game.snapshot()
+        fen = game.fen
+        branch = Game.from_snapshot(snapshot)
+        assert branch.fen == fen
+        assert branch.snapshot() == snapshot
+        # the branch can be played independently, including en passant
+        branch.play_turn("f6")
+        assert branch.board["f5"] is None
+        assert game.board["f5"].type == "pawn"
+        branch.restore(snapshot)
+        assert branch.fen == fen
+        game.play_turn("Ke2")
+        game.play_turn("Qd6")
+        game.restore(snapshot)
+        assert game.fen == fen
+        assert game.castling_rights == "KQkq"
+
+    def test_from_snapshot_builds_only_needed_pieces(self):
+        fen = "r3k3/1P6/8/8/8/8/8/R3K2R w KQq - 0 1"
+        game = Game.from_snapshot(Game.from_fen(fen).snapshot())
+        assert game.fen == fen
+        white, black = game.board.players["white"], game.board.players["black"]
+        assert len(white.pieces) == 4 and len(black.pieces) == 3
+        assert white.removed == [] and black["krook"] in black.removed
+        assert set(move_to_uci(m) for m in game.legal_moves) >= {"e1g1", "e1c1"}
+        game.play_turn("ba8Q")
+        assert game.board["a8"].type == "queen" and len(white.pieces) == 5
+        game.play_turn("Kd7")
+        game.play_turn("O-O")
+        assert game.board["f1"] is white["krook"]
+
+
+class TestPushPop:
+    def test_play_move(self, new_game):
+        game, board, white, black = new_game
+        game.play_move(((4, 1), (4, 3), None))
+        assert board["e4"] is white["pawn_4"]
+        assert white["pawn_4"].double_step == 0
+        with pytest.raises(ValueError):
+            game.play_move(((4, 3), (4, 4), None))
+        with pytest.raises(ValueError):
+            game.play_move(((4, 6), (4, 3), None))
+        game.set_fen("4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1")
+        game.play_move(((4, 0), (6, 0), None))
+        assert board["g1"] is white.king and board["f1"] is white["krook"]
+
+    def test_push_pop(self, new_game):
+        game, board, white, black = new_game
+        fen = game.fen
+        for move in game.legal_moves:
+            game.push(move)
+            assert game.turn == 1
+            game.pop()
+            assert game.fen == fen
+        game.set_fen("4k3/1P6/8/8/8/8/8/4K3 w - - 0 1")
+        game.push(((1, 6), (1, 7), Knight))
+        assert isinstance(board["b8"], Knight)
+        game.pop()
+        assert board["b7"].type == "pawn" and board["b8"] is None
+
+
+class TestMove:
+    def test_pack(self):
+        move = Move.of((4, 6), (3, 7), Queen)
+        assert move == 52 | 59 << 6 | 1 << 12 and move < 1 << 16
+        assert (move.start, move.coord, move.promotion) == ((4, 6), (3, 7), Queen)
+        start, coord, promotion = uci_to_move("e2e4")
+        assert (start, coord, promotion) == ((4, 1), (4, 3), None)
+        assert repr(move) == "Move(e7d8q)"
+        assert hash(move) == hash(int(move))
+        assert pickle.loads(pickle.dumps(move)) == move
+
+    def test_legal_moves(self):
+        game = Game.from_fen("r3k3/1P6/8/8/8/8/8/R3K2R w KQq - 0 1")
+        moves = game.legal_moves
+        assert all(isinstance(move, Move) and move for move in moves)
+        assert len(set(moves)) == len(moves)
+        assert {move_to_uci(m) for m in moves} >= {"e1g1", "e1c1", "b7a8q", "b7b8n"}
+        assert all(Move.of(*move) == move for move in moves)
+
+    def test_make_move(self, new_game):
+        game, board, white, black = new_game
+        white.make_move(uci_to_move("g1f3"))
+        assert board["f3"] is white["kknight"]
+        with pytest.raises(ValueError):
+            white.make_move(uci_to_move("e7e5"))
+        with pytest.raises(ValueError):
+            white.make_move(uci_to_move("f3f5"))
+        with pytest.raises(ValueError):
+            uci_to_move("e2e2")
+        with pytest.raises(ValueError):
+            white.make_move(uci_to_move("b1c3q"))
+        # a pinned piece, and a capture of one's own piece
+        game = Game.from_fen("4k3/4r3/8/8/8/8/4N3/3QK3 w - - 0 1")
+        white = game.whose_turn
+        for uci in ["e2c3", "d1e2", "e1d1"]:
+            with pytest.raises(ValueError):
+                white.make_move(uci_to_move(uci))
+        assert game.fen == "4k3/4r3/8/8/8/8/4N3/3QK3 w - - 0 1"
+        white.make_move(uci_to_move("e1f2"))
+
+    def test_make_move_castling(self):
+        fen = "4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1"
+        game = Game.from_fen(fen)
+        white = game.whose_turn
+        # two squares sideways, but not along the home rank
+        with pytest.raises(ValueError):
+            white.make_move(uci_to_move("e1c2"))
+        assert game.fen == fen
+        white.make_move(uci_to_move("e1c1"))
+        assert game.board["d1"] is white["qrook"]
+        # a king two squares from a1 but off its home square doesn't castle
+        game = Game.from_fen("4k3/8/8/8/8/8/8/R2K3R w - - 0 1")
+        with pytest.raises(ValueError):
+            game.whose_turn.make_move(uci_to_move("d1f1"))
+
+
+class TestEngine:
+    def test_evaluate(self, new_game):
+        game, board, white, black = new_game
+        assert engine.evaluate(game) == 0
+        board.remove_piece(black["queen"])
+        assert engine.evaluate(game) == 900 - 5
+        game.turn = 1
+        assert engine.evaluate(game) == -895
+
+    def test_mate_in_one(self):
+        game = Game.from_fen("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        info = engine.Search(game, depth=3).run()
+        assert info.lines[0].move == uci_to_move("a1a8")
+        assert engine.is_mate_score(info.lines[0].score)
+        assert game.fen == "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1"
+
+    def test_multipv(self, new_game):
+        game, board, white, black = new_game
+        search = engine.Search(game, depth=2, multipv=3)
+        infos = list(search.iterate())
+        assert [info.depth for info in infos] == [1, 2]
+        lines = infos[-1].lines
+        assert len(lines) == 3
+        assert len({line.move for line in lines}) == 3
+        assert lines[0].score >= lines[1].score >= lines[2].score
+        assert all(len(line.pv) == 2 for line in lines)
+
+    def test_limits(self, new_game):
+        game, board, white, black = new_game
+        info = engine.Search(game, nodes=300).run()
+        assert info.nodes < 300 + engine.CHECK_EVERY
+        assert engine.best_move(game, depth=1) in game.legal_moves
+
+    def test_hard_limits(self):
+        # both limits hold during the first depth too, which takes far longer
+        game = Game.from_fen(TestFen.KIWIPETE)
+        start = perf_counter()
+        info = engine.Search(game, movetime=0.05).run()
+        assert perf_counter() - start < 0.5
+        assert info.depth == 0 and info.lines[0].move in game.legal_moves
+        info = engine.Search(game, nodes=50).run()
+        assert info.depth == 0 and info.nodes < 50 + engine.CHECK_EVERY
+
+    def test_analyse(self, new_game):
+        game, board, white, black = new_game
+
+        async def first_two():
+            search = engine.Search(game, multipv=2)
+            depths = []
+            async for info in search.analyse():
+                depths.append(info.depth)
+                if len(depths) == 2:
+                    break
+            return search, depths
+
+        search, depths = asyncio.run(first_two())
+        assert depths == [1, 2]
+        assert search.stopped
+
+
+class TestSee:
+    @pytest.mark.parametrize(
+        "fen, uci_move, value",
+        [
+            ("1k1r4/1pp4p/p7/4p3/8/P5P1/1PP4P/2K1R3 w - - 0 1", "e1e5", 100),
+            (
+                "1k1r3q/1ppn3p/p4b2/4p3/8/P2N2P1/1PP1R1BP/2K1Q3 w - - 0 1",
+                "d3e5",
+                100 - 320,
+            ),
+            # doubled rooks: the one behind x-rays the pawn
+            ("k3r3/8/8/4p3/8/8/4R3/K3R3 w - - 0 1", "e2e5", 100),
+            ("k3r3/8/8/4p3/8/8/4R3/K7 w - - 0 1", "e2e5", 100 - 500),
+            # a bishop behind a pawn
+            ("k7/5n2/8/4p3/3P4/2B5/8/K7 w - - 0 1", "d4e5", 100),
+            ("k7/5n2/8/4p3/3P4/8/8/K7 w - - 0 1", "d4e5", 0),
+            # the king can only recapture on an undefended square
+            ("8/8/8/8/8/1k6/1p6/1Q4K1 w - - 0 1", "b1b2", 100 - 900),
+            ("8/8/8/8/8/1k6/1p6/1Q1N2K1 w - - 0 1", "b1b2", 100),
+            ("k7/8/8/3pP3/8/8/8/K7 w - d6 0 1", "e5d6", 100),
+            ("k7/8/8/8/8/8/8/K2R4 w - - 0 1", "d1d5", 0),
+        ],
+    )
+    def test_see(self, fen, uci_move, value):
+        game = Game.from_fen(fen)
+        assert engine.see(game, uci_to_move(uci_move)) == value
+        assert game.fen == fen
+
+    def test_hanging_pieces(self):
+        game = Game.from_fen("k7/8/8/3q4/8/8/8/K2R4 w - - 0 1")
+        assert engine.hanging_pieces(game, "black") == [game.board["d5"]]
+        assert engine.hanging_pieces(game, "white") == [game.board["d1"]]
+        game = Game.from_fen("k7/8/4p3/3n4/8/8/8/K2R4 w - - 0 1")
+        assert engine.hanging_pieces(game, "black") == []
+
+    def test_quiescence(self):
+        # the pawn on d5 is defended, which only quiescence search notices at depth 1
+        game = Game.from_fen("k7/8/4p3/3p4/8/8/8/K2Q4 w - - 0 1")
+        info = engine.Search(game, depth=1).run()
+        assert info.lines[0].move != uci_to_move("d1d5")
+        search = engine.Search(game)
+        assert search.quiesce(-engine.MATE, engine.MATE, 0)[0] == engine.evaluate(game)
+
+    def test_quiescence_game_over(self):
+        # mate found at depth 1 outranks any material gain
+        game = Game.from_fen("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+        info = engine.Search(game, depth=1).run()
+        assert info.lines[0].move == uci_to_move("a1a8")
+        assert engine.is_mate_score(info.lines[0].score)
+        game = Game.from_fen("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+        search = engine.Search(game)
+        assert search.quiesce(-engine.MATE, engine.MATE, 0)[0] == 0
+
+    def test_captures(self):
+        kiwipete = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq -"
+        for fen in [kiwipete, "r3k3/1P6/8/8/8/8/8/R3K2R w KQq - 0 1"]:
+            game = Game.from_fen(fen)
+            board = game.board
+            expected = {
+                move
+                for move in game.legal_moves
+                if board[move.coord] is not None
+                or move.promotion is not None
+                or (board[move.start].type == "pawn" and move.start[0] != move.coord[0])
+            }
+            search = engine.Search(game)
+            assert set(search.captures(game.whose_turn)) == expected
+
+
+class TestTimeManager:
+    def test_allocation(self):
+        manager = engine.TimeManager(clock=60.02, increment=1, overhead=0.02)
+        assert manager.optimum == pytest.approx(60 / 30 + 0.8)
+        assert manager.maximum == pytest.approx(manager.optimum * 4)
+        manager = engine.TimeManager(clock=1, increment=10)
+        assert manager.optimum <= 0.5 and manager.maximum <= 0.8
+        manager = engine.TimeManager(clock=60, movetime=0.5)
+        assert manager.optimum == manager.maximum == 0.5
+
+    def test_extensions(self):
+        manager = engine.TimeManager(clock=60)
+        manager.start(in_check=True)
+        assert manager.planned == pytest.approx(manager.optimum * 1.3)
+        line = engine.Line(((4, 1), (4, 3), None), 0, [])
+        other = engine.Line(((3, 1), (3, 3), None), 0, [])
+        assert manager.completed(engine.Info(1, [line], 20, 0.1))
+        manager.completed(engine.Info(2, [other], 100, 0.2))
+        assert manager.best_move_changes == 1
+        assert manager.extensions == ["check", "unstable best move"]
+        for _ in range(10):
+            manager.extend("unstable best move", 1.5)
+        assert manager.planned == manager.maximum
+
+    def test_hard_deadline(self, new_game):
+        game, board, white, black = new_game
+        manager = engine.TimeManager(movetime=0.05)
+        info = engine.Search(game, time_manager=manager).run()
+        assert info.lines[0].move in game.legal_moves
+        report = manager.report()
+        assert report["used"] < 0.05 + 0.03
+        assert report["depth"] == info.depth
+
+    def test_stopped_in_first_depth(self, new_game):
+        game, board, white, black = new_game
+        manager = engine.TimeManager(movetime=0)
+        info = engine.Search(game, time_manager=manager).run()
+        assert info.depth == 0
+        assert info.lines[0].move in game.legal_moves
+
+    def test_node_budget_is_deterministic(self, new_game):
+        game, board, white, black = new_game
+        players = [engine.EnginePlayer(nodes=200) for _ in range(2)]
+        moves = [player.choose_move(game) for player in players]
+        assert moves[0] == moves[1]
+        reports = [player.reports[0] for player in players]
+        assert reports[0]["nodes"] == reports[1]["nodes"]
+        assert reports[0]["nodes"] < 200 + engine.CHECK_EVERY
+
+    def test_game_loop(self, new_game, capsys):
+        game, board, white, black = new_game
+        player = engine.EnginePlayer(clock=10, increment=0.1, depth=1)
+        game.engines["black"] = player
+        game.play_turn("e4")
+        game.play_turn()
+        assert game.turn == 2
+        assert 10 - player.reports[0]["used"] < player.clock <= 10.1
+        assert "plays" in capsys.readouterr().out
+
+    def test_game_loop_flag(self, new_game, capsys):
+        game, board, white, black = new_game
+        game.engines["white"] = engine.EnginePlayer(clock=0.001, depth=1)
+        game.play_turn()
+        assert game.turn == 0
+        assert game.game_over == "forfeit"
+
+
+class TestTranspositionTable:
+    def test_store_probe(self):
+        tt = engine.TranspositionTable(size=1024)
+        move = uci_to_move("e7e8q")
+        tt.store(12345, 3, engine.EXACT, -250, move)
+        assert tt.probe(12345) == (3, engine.EXACT, -250, move)
+        assert tt.probe(12345 + tt.entries) is None
+        # a shallower result for another position doesn't evict a deeper one
+        tt.store(12345 + tt.entries, 1, engine.LOWER, 10, None)
+        assert tt.probe(12345 + tt.entries) is None
+        tt.store(12345 + tt.entries, 5, engine.UPPER, 10, None)
+        assert tt.probe(12345 + tt.entries) == (5, engine.UPPER, 10, None)
+        tt.clear()
+        assert tt.probe(12345 + tt.entries) is None
+
+    def test_torn_entry(self):
+        tt = engine.TranspositionTable(size=1024)
+        tt.store(99, 2, engine.EXACT, 40, None)
+        offset = 99 % tt.entries * tt.ENTRY.size
+        tt.buffer[offset + 8] ^= 1
+        assert tt.probe(99) is None
+
+    def test_parallel_search(self, new_game):
+        game, board, white, black = new_game
+        info = smp.parallel_search(game, workers=2, depth=2, tt_size=1 << 16)
+        assert info.depth == 2
+        assert info.lines[0].move in game.legal_moves
+        assert info.nodes > 20
+
+    def test_benchmark(self, new_game):
+        game, board, white, black = new_game
+        (result,) = smp.benchmark(game, [1], movetime=0.2)
+        assert result["nodes"] > 0 and result["nps"] > 0
+        assert result["seconds"] <= 1 and result["startup"] >= 0
+        # nothing to search once the game is over
+        for move in ["f3", "e5", "g4", "Qh4"]:
+            game.play_turn(move)
+        (result,) = smp.benchmark(game, [1], movetime=0.2)
+        assert result["nps"] == 0 and result["depth"] == 0
+
+
+class TestHasLegalMove:
+    @pytest.mark.parametrize(
+        "pgn",
+        [
+            "pillsbury_lasker_1896.pgn",
+            "kasparov_topalov_1999.pgn",
+        ],
+    )
+    def test_agrees_with_legal_moves(self, pgn):
+        moves = format_pgn(pgn).split("\n")[:-1]
+        for game in replay(moves):
+            for player in game.board.players.values():
+                assert player.has_legal_move == bool(player.legal_moves_all)
+
+    def test_special_cases(self):
+        # the only legal move is taking the checking pawn en passant
+        game = Game.from_fen("8/8/8/2k5/3Pp3/8/8/7K b - d3 0 1")
+        game.board.add_piece(game.board.players["white"]["qrook"], (1, 5))
+        game.board.add_piece(game.board.players["white"]["krook"], (2, 0))
+        game.board.add_piece(game.board.players["white"]["queen"], (7, 4))
+        black = game.whose_turn
+        assert black.king.in_check
+        assert black.has_legal_move == bool(black.legal_moves_all)
+        # the pinned bishop can't move, the king has no squares
+        game.set_fen("k7/8/8/8/8/8/2r5/KB5q w - - 0 1")
+        assert not game.whose_turn.has_legal_move
+        assert game.game_over == "stalemate"
+
+    def test_opening_is_cheap(self, new_game):
+        game, board, white, black = new_game
+        profiler = game.enable_profiling()
+        assert game.game_over is None
+        game.disable_profiling()
+        assert profiler.counters.get("Board.test_move", (0, 0))[0] <= 1
+        assert "Piece.legal_moves" not in profiler.counters
+
+
+class TestPgn:
+    def test_bundled(self):
+        (game,) = pgn.read_games("pillsbury_lasker_1896.pgn")
+        assert game.result == "0-1"
+        assert game.moves == format_pgn("pillsbury_lasker_1896.pgn").split("\n")[:-1]
+
+    def test_read_games(self):
+        text = StringIO(
+            '[Event "one"]\n[Result "1/2-1/2"]\n\n'
+            "1. e4 {a comment 1-0\nstill going} e5 (1... c5 2. Nf3 (2. c3)) "
+            "2. Nf3!? $1 Nc6 3. exd8=Q+ 1/2-1/2\n\n"
+            '[Event "two"]\n1. d4 *\n'
+        )
+        first, second = pgn.read_games(text)
+        assert first.headers == {"Event": "one", "Result": "1/2-1/2"}
+        assert first.moves == ["e4", "e5", "Nf3", "Nc6", "ed8Q"]
+        assert first.result == "1/2-1/2"
+        assert second == pgn.PgnGame({"Event": "two"}, ["d4"], "*")
+
+    def test_pawn_capture_promotion(self):
+        game = Game.from_fen("3r3k/4P3/8/8/8/8/8/K7 w - - 0 1")
+        game.play_turn("ed8Q")
+        assert isinstance(game.board["d8"], Queen)
+
+    @pytest.mark.parametrize(
+        "fen, uci_move, san",
+        [
+            ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", "g1f3", "Nf3"),
+            ("3r3k/4P3/8/8/8/8/8/K7 w - - 0 1", "e7d8q", "exd8=Q+"),
+            ("k7/8/8/8/8/8/8/R3K2R w KQ - 0 1", "e1c1", "O-O-O"),
+            ("6k1/5ppp/8/8/8/8/8/R3K3 w Q - 0 1", "a1a8", "Ra8#"),
+            ("k7/8/8/8/8/8/8/1N1N2K1 w - - 0 1", "b1c3", "Nbc3"),
+            ("k7/8/8/N7/8/8/8/N5K1 w - - 0 1", "a1b3", "N1b3"),
+            ("k7/8/8/3pP3/8/8/8/6K1 w - d6 0 1", "e5d6", "exd6"),
+        ],
+    )
+    def test_move_to_san(self, fen, uci_move, san):
+        game = Game.from_fen(fen)
+        assert pgn.move_to_san(game, uci_to_move(uci_move)) == san
+        assert game.fen == fen
+
+    def test_san_to_move(self):
+        game = Game.from_fen("k7/8/8/N7/8/8/8/N3K2R w K - 0 1")
+        assert pgn.san_to_move(game, "N1b3") == uci_to_move("a1b3")
+        assert pgn.san_to_move(game, "O-O") == uci_to_move("e1g1")
+        with pytest.raises(ValueError):
+            pgn.san_to_move(game, "Nb3")
+        with pytest.raises(ValueError):
+            pgn.san_to_move(game, "Nb4")
+
+    def test_format_game_round_trip(self):
+        headers = {"Event": "test", "Result": "1-0"}
+        text = pgn.format_game(headers, ["e5", "Nf3"], "1-0", first_turn=1)
+        assert "1... e5 2. Nf3 1-0" in text
+        (game,) = pgn.read_games(StringIO(text))
+        assert game == pgn.PgnGame(headers, ["e5", "Nf3"], "1-0")
+
+
+class TestBench:
+    def test_run(self):
+        result = bench.run(["reti_alekhine_1925.pgn"], repeat=1)
+        assert result["games"] == 1
+        assert result["plies"] == len(format_pgn("reti_alekhine_1925.pgn").split()) - 1
+        assert result["peak_memory_bytes"] > 0
+        assert set(result["operations"]) == set(bench.OPERATIONS)
+        assert bench.compare(result, result) == []
+        slower = json.loads(json.dumps(result))
+        slower["plies_per_second"] /= 2
+        slower["operations"]["make_move"]["p99_ms"] *= 2
+        assert len(bench.compare(slower, result)) == 2
+
+    def test_main(self, tmp_path, capsys):
+        baseline = str(tmp_path / "baseline.json")
+        args = ["reti_alekhine_1925.pgn", "--repeat", "1"]
+        assert bench.main(args + ["--save", baseline]) == 0
+        with open(baseline) as f:
+            saved = json.load(f)
+        saved["plies_per_second"] *= 10
+        with open(baseline, "w") as f:
+            json.dump(saved, f)
+        assert bench.main(args + ["--baseline", baseline]) == 1
+        assert "REGRESSION plies_per_second" in capsys.readouterr().out
+
+
+class TestMoveCache:
+    def test_invalidation(self, new_game):
+        game, board, white, black = new_game
+        rook = white["krook"]
+        game.play_turn("h4")
+        assert (7, 2) in rook.potential_moves
+        cached = rook._moves
+        # moves elsewhere leave the cache alone
+        game.play_turn("a5")
+        assert rook._moves is cached
+        # moving a piece out of the rook's path, or into it, changes its moves
+        game.play_turn("Nf3")
+        assert rook._moves is None
+        assert (5, 0) in rook.potential_moves
+        game.play_turn("Ra6")
+        game.play_turn("Nh2")
+        assert rook.potential_moves == [(6, 0), (5, 0), (7, 1)]
+
+    def test_pawn_moved(self, empty_board):
+        game, board, white, black = empty_board
+        board.add_piece(white["pawn_0"], (0, 1))
+        assert white["pawn_0"].potential_moves == [(0, 2), (0, 3)]
+        white["pawn_0"].moved = True
+        assert white["pawn_0"].potential_moves == [(0, 2)]
+
+    @pytest.mark.parametrize(
+        "pgn", ["steinitz_bardeleben_1895.pgn", "botvinnik_capablanca_1938.pgn"]
+    )
+    def test_matches_uncached(self, pgn):
+        moves = format_pgn(pgn).split("\n")[:-1]
+        for game in replay(moves):
+            for player in game.board.players.values():
+                for piece in player.pieces:
+                    if piece.pos:
+                        moves, _ = piece.find_moves()
+                        if piece.type == "pawn":
+                            moves += piece.en_passant_moves()
+                        assert piece.potential_moves == moves
+
+
+class TestUci:
+    @pytest.fixture
+    def uci_engine(self):
+        output = StringIO()
+        return uci.UciEngine(output), output
+
+    def test_handshake(self, uci_engine):
+        engine, output = uci_engine
+        engine.run(StringIO("uci\nisready\nsetoption name MultiPV value 2\nquit\n"))
+        lines = output.getvalue().splitlines()
+        assert lines[0].startswith("id name")
+        assert "uciok" in lines and lines[-1] == "readyok"
+        assert engine.multipv == 2
+
+    def test_incremental_position(self, uci_engine, monkeypatch):
+        engine, output = uci_engine
+        engine.handle("position startpos moves e2e4 e7e5")
+        assert (
+            engine.game.fen
+            == Game.from_fen(
+                "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2"
+            ).fen
+        )
+        set_ups = []
+        set_fen = engine.game.set_fen
+        monkeypatch.setattr(
+            engine.game, "set_fen", lambda fen: set_fen(set_ups.append(fen) or fen)
+        )
+        engine.handle("position startpos moves e2e4 e7e5 g1f3")
+        assert set_ups == []
+        assert engine.game.turn == 3 and engine.game.board["f3"].type == "knight"
+        engine.handle("position startpos moves d2d4")
+        assert set_ups == [uci.STARTPOS]
+
+    def test_go(self, uci_engine):
+        engine, output = uci_engine
+        engine.handle("position fen 6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        engine.handle("go depth 3")
+        engine.wait()
+        lines = output.getvalue().splitlines()
+        assert lines[-1] == "bestmove a1a8"
+        assert "score mate 1" in lines[-2]
+
+    def test_stop(self, uci_engine):
+        engine, output = uci_engine
+        engine.handle("position startpos")
+        engine.handle("go infinite")
+        engine.handle("stop")
+        assert engine.thread is None
+        assert output.getvalue().splitlines()[-1].startswith("bestmove ")
+
+    def test_bad_move(self, uci_engine):
+        engine, output = uci_engine
+        engine.run(StringIO("position startpos moves e2e5\nquit\n"))
+        assert output.getvalue().startswith("info string")
+
+
+class TestTournament:
+    def test_play(self):
+        white = tournament.Engine("white", depth=1)
+        black = tournament.Engine("black", depth=1)
+        game = tournament.play(white, black, max_plies=6)
+        assert len(game["moves"]) == 6
+        assert game["result"] == "1/2-1/2"
+        assert game["termination"] == "adjudicated after max plies"
+        replayed = list(replay([pgn.clean_san(move) for move in game["moves"]]))
+        assert replayed[-1].turn == 6
+
+    def test_play_checkmate(self):
+        engine = tournament.Engine("engine", depth=2)
+        fen = "6k1/5ppp/8/8/8/8/8/R3K3 w Q - 0 1"
+        game = tournament.play(engine, engine, fen)
+        assert game["moves"] == ["Ra8#"]
+        assert (game["result"], game["termination"]) == ("1-0", "checkmate")
+
+    def test_insufficient_material(self):
+        engine = tournament.Engine("engine", depth=1)
+        game = tournament.play(engine, engine, "k7/8/8/8/8/8/6q1/6K1 w - - 0 1")
+        assert game["moves"] == ["Kxg2"]
+        assert game["termination"] == "insufficient material"
+
+    def test_parse(self):
+        assert tournament.parse_engine("new:depth=3,movetime=0.5") == (
+            tournament.Engine("new", depth=3, movetime=0.5)
+        )
+        with pytest.raises(ValueError):
+            tournament.parse_engine("new:speed=3")
+        assert tournament.parse_time_control("10+0.1") == (10.0, 0.1)
+
+    def test_elo(self):
+        assert tournament.elo(10, 0, 10)[0] == 0
+        difference, margin = tournament.elo(60, 20, 20)
+        assert difference == pytest.approx(147.2, abs=0.1)
+        assert tournament.elo(20, 20, 60)[0] == pytest.approx(-difference)
+        assert margin > 0
+
+    def test_sprt(self):
+        assert tournament.sprt(0, 0, 0, 0, 5)[3] is None
+        assert tournament.sprt(600, 200, 200, 0, 5)[3] == "H1"
+        assert tournament.sprt(200, 200, 600, 0, 5)[3] == "H0"
+
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_match(self, processes):
+        output = StringIO()
+        summary = tournament.match(
+            tournament.Engine("a", depth=1),
+            tournament.Engine("b", nodes=50),
+            4,
+            processes=processes,
+            pgn=output,
+            hypothesis=(0, 5),
+            max_plies=4,
+        )
+        assert summary["games"] == 4
+        assert summary["wins"] + summary["draws"] + summary["losses"] == 4
+        assert summary["sprt"]["result"] is None
+        games = list(pgn.read_games(StringIO(output.getvalue())))
+        assert sorted(game.headers["Round"] for game in games) == ["1", "2", "3", "4"]
+        assert all(len(game.moves) == 4 for game in games)
+
+
+class TestEpd:
+    def test_extract(self):
+        (game,) = pgn.read_games("pillsbury_lasker_1896.pgn")
+        lines = list(epd.extract([game]))
+        assert len(lines) == len(game.moves) + 1
+        assert lines[0] == (
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - "
+            f'c9 "0-1"; ply 0; sm {game.moves[0]};'
+        )
+        assert lines[-1].endswith(f'c9 "0-1"; ply {len(game.moves)};')
+
+    def test_sample_and_dedup(self):
+        games = list(pgn.read_games("kasparov_topalov_1999.pgn")) * 2
+        everything = list(epd.extract(games))
+        sample = list(epd.extract(games, rate=0.3, seed=5))
+        assert sample == list(epd.extract(games, rate=0.3, seed=5))
+        assert sample != list(epd.extract(games, rate=0.3, seed=6))
+        assert 0.15 * len(everything) < len(sample) < 0.45 * len(everything)
+        unique = list(epd.extract(games, seen=epd.SeenPositions()))
+        assert len(unique) == len(everything) // 2
+        assert len(list(epd.extract(games, min_ply=10))) == len(everything) - 20
+
+    def test_seen_positions(self):
+        seen = epd.SeenPositions(4)
+        assert seen.add(5) and not seen.add(5)
+        assert seen.add(9)
+        assert seen.add(5)
+
+    def test_start_position_and_illegal_move(self):
+        headers = {"FEN": "6k1/5ppp/8/8/8/8/8/R3K3 w Q - 0 1"}
+        lines = list(epd.extract([pgn.PgnGame(headers, ["Ra8", "Kh7"], "1-0")]))
+        assert [line.split(";")[-2].strip() for line in lines] == ["sm Ra8#", "ply 1"]
+
+    def test_ply_from_first_position(self):
+        # plies count from the FEN, not from its move number
+        headers = {"FEN": "4k3/8/8/8/8/8/8/R3K3 b Q - 3 40"}
+        game = pgn.PgnGame(headers, ["Kd7", "Ra7", "Kc6"], "1-0")
+        assert [ply for _, ply, _ in epd.game_positions(game)] == [0, 1, 2, 3]
+
+    def test_malformed_san(self):
+        # a bad game is cut short, and the games after it still come through
+        games = [
+            pgn.PgnGame({}, ["e4", "Zab4", "d4"], "1-0"),
+            pgn.PgnGame({}, ["e4", "e5", "hxg3"], "1-0"),
+            pgn.PgnGame({}, ["d4"], "0-1"),
+        ]
+        assert [len(list(epd.extract([game]))) for game in games] == [2, 3, 2]
+        assert len(list(epd.extract(games))) == 7
+
+    def test_write_and_read(self, tmp_path):
+        (game,) = pgn.read_games("reti_alekhine_1925.pgn")
+        lines = list(epd.extract([game]))
+        paths = epd.write_chunks(lines, str(tmp_path / "positions"), chunk_size=50)
+        assert len(paths) == (len(lines) + 49) // 50
+        read = [p for path in paths for p in epd.read_epd(path)]
+        assert len(read) == len(lines)
+        fen, opcodes = read[1]
+        assert Game.from_fen(fen).turn % 2 == 1
+        assert opcodes == {"c9": game.result, "ply": "1", "sm": game.moves[1]}
+
+
+class TestTune:
+    @pytest.fixture
+    def dataset(self, tmp_path):
+        pytest.importorskip("numpy")
+        games = [g for path in bench.BUNDLED_GAMES for g in pgn.read_games(path)]
+        positions = [
+            (" ".join(line.split()[:4]), tune.RESULTS[line.split('"')[1]])
+            for line in epd.extract(games)
+        ]
+        tune.save_dataset(tune.extract(iter(positions), 1000), tmp_path)
+        return positions, tmp_path
+
+    def test_matches_engine_evaluation(self, dataset):
+        positions, directory = dataset
+        data = tune.load_dataset(directory)
+        assert len(data.results) == len(positions)
+        scores = tune.evaluate(tune.initial_weights(), data.squares, data.signs)
+        for (fen, result), score in zip(positions[::25], scores[::25]):
+            game = Game.from_fen(fen)
+            sign = 1 if game.turn % 2 == 0 else -1
+            assert score == sign * engine.evaluate(game)
+
+    def test_gradient(self, dataset):
+        import numpy as np
+
+        positions, directory = dataset
+        data = tune.load_dataset(directory)
+        weights = tune.initial_weights()
+        error, gradient, count = tune.error_and_gradient(weights, 1.0, data)
+        for i in [0, 3, 6 + 64 * 1 + 18, 6 + 64 * 3 + 8]:
+            shifted = weights.copy()
+            shifted[i] += 1e-3
+            numeric = (tune.error_and_gradient(shifted, 1.0, data)[0] - error) / 1e-3
+            assert numeric == pytest.approx(gradient[i], rel=1e-2, abs=1e-6)
+
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_tuner(self, dataset, processes):
+        positions, directory = dataset
+        checkpoint = str(directory / "weights.json")
+        tuner = tune.Tuner(directory, processes, checkpoint=checkpoint)
+        try:
+            start = tuner.error()
+            final = tuner.run(10)
+        finally:
+            tuner.close()
+        assert final < start
+        resumed = tune.Tuner(directory, 1, checkpoint=checkpoint)
+        assert resumed.epoch == 10
+        assert resumed.error() == pytest.approx(final)
+        with open(checkpoint) as f:
+            state = json.load(f)
+        assert len(state["piece_square_tables"]["knight"]) == 64
+
+    def test_fit_k(self, dataset):
+        positions, directory = dataset
+        data = tune.load_dataset(directory)
+        scores = tune.evaluate(tune.initial_weights(), data.squares, data.signs)
+        # results exactly as the sigmoid predicts them at k = 1.3
+        soft = tune.Dataset(data.squares, data.signs, tune.sigmoid(scores, 1.3))
+        tune.save_dataset(soft, directory / "soft")
+        tuner = tune.Tuner(directory / "soft", 1)
+        assert tuner.k == pytest.approx(1.3, abs=0.01)
+
+    def test_apply(self, dataset, monkeypatch):
+        positions, directory = dataset
+        weights = tune.initial_weights()
+        weights[tune.PIECE_ORDER.index("queen")] = 1000
+        values, tables = tune.weights_to_tables(weights)
+        path = directory / "weights.json"
+        path.write_text(
+            json.dumps({"piece_values": values, "piece_square_tables": tables})
+        )
+        monkeypatch.setattr(engine, "PIECE_VALUES", dict(engine.PIECE_VALUES))
+        monkeypatch.setattr(
+            engine, "PIECE_SQUARE_TABLES", dict(engine.PIECE_SQUARE_TABLES)
+        )
+        tune.apply(path)
+        assert engine.PIECE_VALUES["queen"] == 1000
+
+
+class TestCorpus:
+    def test_walk(self):
+        games = [g for path in bench.BUNDLED_GAMES for g in pgn.read_games(path)]
+        # an opening-heavy corpus: every game, cut short at many plies
+        games = [
+            pgn.PgnGame({}, game.moves[:n], game.result)
+            for game in games
+            for n in range(10, len(game.moves) + 1, 5)
+        ]
+        trie = corpus.MoveTrie(games)
+        assert trie.games == len(games)
+        assert trie.nodes < trie.plies / 5
+        finals = {}
+        stats = trie.walk(on_game=lambda game, g: finals.setdefault(id(g), game.fen))
+        assert stats == {"games": len(games), "skipped": 0, "plies": trie.nodes}
+        for g in games[::7]:
+            assert finals[id(g)] == list(replay(g.moves))[-1].fen
+
+    def test_on_ply(self):
+        games = [
+            pgn.PgnGame({}, ["e4", "e5", "Nf3"], "*"),
+            pgn.PgnGame({}, ["e4", "c5"], "*"),
+            pgn.PgnGame({}, ["d4"], "*"),
+            pgn.PgnGame({"FEN": "4k3/8/8/8/8/8/8/4K2R w K - 0 1"}, ["O-O"], "*"),
+        ]
+        seen = []
+        corpus.MoveTrie(games).walk(
+            on_ply=lambda game, ply, through: seen.append(
+                (game.fen.split()[0], ply, len(through))
+            ),
+            plies=[1, 2],
+        )
+        assert sorted(seen) == sorted(
+            [
+                ("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR", 1, 2),
+                ("rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR", 2, 1),
+                ("rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR", 2, 1),
+                ("rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR", 1, 1),
+                ("4k3/8/8/8/8/8/8/5RK1", 1, 1),
+            ]
+        )
+
+    def test_illegal_move(self):
+        games = [
+            pgn.PgnGame({}, ["e4", "e4"], "*"),
+            pgn.PgnGame({}, ["e4", "e4", "d4"], "*"),
+            pgn.PgnGame({}, ["e4", "e5"], "*"),
+            # malformed SAN is skipped like an illegal move
+            pgn.PgnGame({}, ["e4", "Zab4"], "*"),
+            pgn.PgnGame({}, ["e4", "e5", "hxg3"], "*"),
+        ]
+        ended = []
+        stats = corpus.MoveTrie(games).walk(on_game=lambda game, g: ended.append(g))
+        assert stats == {"games": 1, "skipped": 4, "plies": 2}
+        assert ended == [games[2]]
+
+
+class TestPerft:
+    KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq -"
+
+    def test_start_position(self):
+        game = Game()
+        assert [perft.perft(game, depth) for depth in range(4)] == [1, 20, 400, 8902]
+        assert game.fen == Game().fen
+
+    def test_cache(self):
+        cache = perft.PerftCache(1 << 12)
+        assert perft.perft(Game(), 3, cache) == 8902
+        assert perft.perft(Game(), 3, cache) == 8902
+        assert cache.hits == 1
+        assert cache.probe(position_key(Game().snapshot()), 3) == 8902
+        assert cache.probe(position_key(Game().snapshot()), 2) is None
+
+    def test_divide(self):
+        counts = perft.divide(Game.from_fen(self.KIWIPETE), 2, processes=1)
+        assert len(counts) == 48
+        assert sum(counts.values()) == 2039
+        assert counts["e1g1"] == 43
+        assert sum(perft.divide(Game(), 1, processes=1).values()) == 20
+        with pytest.raises(ValueError):
+            perft.divide(Game(), 0, processes=1)
+        with pytest.raises(SystemExit):
+            perft.main(["0"])
+
+    def test_divide_processes(self):
+        game = Game.from_fen("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - -")
+        counts = perft.divide(game, 3, processes=2, cache_size=1 << 10)
+        assert list(counts) == [move_to_uci(move) for move in game.legal_moves]
+        assert sum(counts.values()) == 2812
+
+
+class TestMate:
+    LEGAL = "r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 0"
+    QUIET = "k7/8/2K5/8/8/8/8/7R w - - 0 1"
+
+    def check_tree(self, game, tree):
+        """Every line of a solution tree ends in checkmate"""
+        ((move, replies),) = tree.items()
+        game.push(move)
+        if not replies:
+            assert game.game_over == "checkmate"
+        assert set(replies) == set(game.legal_moves)
+        for reply, after in replies.items():
+            game.push(reply)
+            self.check_tree(game, after)
+            game.pop()
+        game.pop()
+
+    def test_mate_in_one(self):
+        solver = mate.MateSolver(Game.from_fen("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - -"))
+        assert solver.solve(3) == {uci_to_move("a1a8"): {}}
+
+    def test_mate_in_two(self):
+        game = Game.from_fen(self.LEGAL)
+        tree = mate.MateSolver(game).solve(2)
+        assert mate.mate_length(tree) == 2
+        assert [move_to_uci(m) for m in mate.main_line(tree)][0] == "d5f6"
+        self.check_tree(game, tree)
+        assert game.fen == Game.from_fen(self.LEGAL).fen
+
+    def test_checks_only(self):
+        game = Game.from_fen(self.QUIET)
+        assert mate.MateSolver(game, checks_only=True).solve(3) is None
+        tree = mate.MateSolver(game).solve(3)
+        assert [move_to_uci(m) for m in mate.main_line(tree)] == [
+            "c6b6",
+            "a8b8",
+            "h1h8",
+        ]
+        self.check_tree(game, tree)
+
+    def test_no_mate(self):
+        # the only checks lead to stalemate or escape
+        assert mate.MateSolver(Game.from_fen(self.QUIET)).solve(1) is None
+        solver = mate.MateSolver(Game())
+        assert solver.solve(2) is None
+        assert not solver.stopped
+
+    def test_limits_and_tt(self):
+        # enough for the root of each depth, but not for a reply to be answered,
+        # whatever order the moves come in
+        solver = mate.MateSolver(Game.from_fen(self.LEGAL), nodes=2)
+        assert solver.solve(2) is None
+        assert solver.stopped
+        tt = {}
+        first = mate.MateSolver(Game.from_fen(self.LEGAL), tt=tt)
+        tree = first.solve(2)
+        second = mate.MateSolver(Game.from_fen(self.LEGAL), tt=tt)
+        assert second.solve(2) == tree
+        assert second.nodes < first.nodes
+
+    def test_main(self, tmp_path, capsys):
+        path = tmp_path / "puzzles.epd"
+        path.write_text(f"{self.LEGAL[:-4]} dm 2;\n{STARTPOS}\n")
+        assert mate.main([str(path), "--moves", "1", "--processes", "1"]) == 0
+        out = capsys.readouterr().out.splitlines()
+        assert out[0].endswith("mate in 2: d5f6 g7f6 c4f7")
+        assert out[1].endswith("no mate in 1")
+        assert out[2].startswith("1 solved, 1 unsolved, 0 gave up")
+
+
+class TestJournal:
+    def play(self, game, plies, start=0):
+        moves = next(pgn.read_games(bench.BUNDLED_GAMES[0])).moves[start:plies]
+        for move in moves:
+            game.play_move(pgn.san_to_move(game, move))
+        return len(moves)
+
+    def test_save_and_resume(self, tmp_path):
+        path = str(tmp_path / "game.chj")
+        saved = journal.Journal.create(path, checkpoint_every=10)
+        plies = self.play(saved.game, 45)
+        saved.close()
+        assert saved.game.journal is None
+        resumed = journal.Journal.resume(path)
+        assert resumed.game.fen == saved.game.fen
+        assert resumed.since_checkpoint == plies % 10
+        assert journal.load(path).fen == saved.game.fen
+        # the resumed game goes on being saved
+        resumed.game.play_move(resumed.game.legal_moves[0])
+        resumed.close()
+        assert journal.load(path).fen == resumed.game.fen
+
+    def test_play_turn(self, tmp_path):
+        path = str(tmp_path / "game.chj")
+        saved = journal.Journal.create(path, Game.from_fen(STARTPOS), sync_every=1)
+        saved.game.play_turn("e4")
+        saved.game.play_turn("e5")
+        saved.game.play_turn("Nf3")
+        assert journal.read_journal(path)[1] == [
+            uci_to_move(m) for m in ["e2e4", "e7e5", "g1f3"]
+        ]
+        saved.close()
+        with pytest.raises(FileExistsError):
+            journal.Journal.create(path)
+
+    def test_batched_sync(self, tmp_path):
+        path = str(tmp_path / "game.chj")
+        saved = journal.Journal.create(path, sync_every=4)
+        size = os.path.getsize(path)
+        self.play(saved.game, 3)
+        assert os.path.getsize(path) == size
+        self.play(saved.game, 5, start=3)
+        assert os.path.getsize(path) == size + 4 * journal.MOVE_RECORD.size
+        saved.close()
+
+    def test_torn_tail(self, tmp_path):
+        path = str(tmp_path / "game.chj")
+        saved = journal.Journal.create(path, checkpoint_every=4)
+        self.play(saved.game, 6)
+        saved.close()
+        fen = saved.game.fen
+        with open(path, "ab") as f:
+            f.write(journal.MOVE)
+        resumed = journal.Journal.resume(path)
+        assert resumed.game.fen == fen
+        resumed.close()
+        # a damaged checkpoint ends the journal too
+        with open(path, "ab") as f:
+            f.write(journal.pack_checkpoint(Game().snapshot())[:-1] + b"\0")
+        assert journal.load(path).fen == fen
+        with open(path, "wb") as f:
+            f.write(b"not a journal")
+        with pytest.raises(ValueError):
+            journal.load(path)
+
+
+class TestSquare:
+    def test_interned(self):
+        e4 = square("e4")
+        assert square((4, 3)) is e4 is SQUARES[28] is algebraic_to_coord("e4")
+        assert e4 == (4, 3) and hash(e4) == hash((4, 3))
+        assert (e4.index, e4.file, e4.rank, e4.name) == (28, 4, 3, "e4")
+        assert square("a1").color == "black" and e4.color == "white"
+        assert pickle.loads(pickle.dumps(e4)) is e4
+        with pytest.raises(ValueError):
+            square("i9")
+        with pytest.raises(ValueError):
+            square((8, 0))
+        board = Game().board
+        assert board["e2"] is board[4, 1]
+        with pytest.raises(ValueError):
+            board["i9"]
+        with pytest.raises(ValueError):
+            legacy_pieces.translate_algebraic("e0", 0, 1)
+
+    def test_neighbors_and_rays(self):
+        assert sorted(square("a1").neighbors) == [(0, 1), (1, 0), (1, 1)]
+        assert len(square("e4").neighbors) == 8
+        assert {s.name for s in square("b1").knight_jumps} == {"a3", "c3", "d2"}
+        diagonal = square("a1").rays[1, 1]
+        assert [s.name for s in diagonal] == ["b2", "c3", "d4", "e5", "f6", "g7", "h8"]
+        assert square("a1").rays[-1, 0] == ()
+
+    def test_board_positions(self, new_game):
+        game, board, white, black = new_game
+        game.play_turn("e4")
+        game.play_turn("Nf6")
+        assert white["pawn_4"].pos is square("e4")
+        assert black["kknight"].pos is square("f6")
+        assert all(type(move.coord) is Square for move in game.legal_moves)
+        assert translate_algebraic("Nf3")["coord"] is square("f3")
+
+
+class TestLegacyBoard:
+    def place(self, placement):
+        b = legacy_board.Board()
+        placed = {}
+        for square, (color, piece_type) in placement.items():
+            placed[square] = getattr(legacy_pieces, piece_type)(b, color)
+            b.add_piece(placed[square], square)
+        return b, placed
+
+    def test_moves(self):
+        b, placed = self.place(
+            {
+                "d4": ("white", "Queen"),
+                "d6": ("black", "Pawn"),
+                "b1": ("white", "Knight"),
+            }
+        )
+        queen_moves = placed["d4"].legal_moves
+        assert legacy_board.ALGEBRAIC_X == "abcdefgh"
+        assert "d6" in queen_moves and "d7" not in queen_moves
+        assert len(queen_moves) == 25
+        assert placed["b1"].legal_moves == ["a3", "c3", "d2"]
+        assert placed["d6"].can_take == ["c5", "e5"]
+
+    def test_threatened_squares_cached(self):
+        b, placed = self.place(
+            {
+                "e1": ("white", "King"),
+                "a1": ("white", "Rook"),
+                "h1": ("white", "Rook"),
+                "c8": ("black", "Rook"),
+            }
+        )
+        king = placed["e1"]
+        threatened = b.threatened_squares
+        assert b.threatened_squares is threatened
+        assert "c1" in threatened["white"] and "e1" not in threatened["white"]
+        assert king.can_castle == {"kingside": placed["h1"]}
+        assert b.threatened_squares is threatened
+        b.move_piece(placed["c8"], "e8")
+        assert b.threatened_squares is not threatened
+        assert king.in_check and king.can_castle == {}
+        b.remove_piece(placed["c8"])
+        king.castle("queenside")
+        assert b.board["c1"] is king and b.board["d1"] is placed["a1"]
+
+
+class TestRender:
+    def test_text(self, new_game):
+        game, board, white, black = new_game
+        lines = str(board).split("\n")
+        assert len(lines) == 10
+        assert lines[0].startswith("8 --") and lines[-1] == "     a b c d e f g h"
+        # a1 is dark, so the white rook there is drawn with the other icon
+        assert lines[7] == "1 --" + "".join(
+            render.CELLS[x][0][white["qrook"].player.color, board[x][0].type]
+            for x in range(8)
+        )
+        assert "\u001b[47m\u001b[30m♖ \u001b[0m" in lines[7]  # ]]]
+
+    def test_plain(self, new_game):
+        game, board, white, black = new_game
+        game.play_turn("e4")
+        assert render.plain(board).split("\n") == [
+            "rnbqkbnr",
+            "pppppppp",
+            "........",
+            "........",
+            "....P...",
+            "........",
+            "PPPP.PPP",
+            "RNBQKBNR",
+        ]
+
+    def test_terminal_diff(self, new_game):
+        game, board, white, black = new_game
+        output = StringIO()
+        game.renderer = render.TerminalRenderer(output, top=3)
+        game.show_board()
+        first = output.getvalue()
+        assert first.count("\u001b[") > 64  # ]
+        for line in str(board).split("\n"):
+            assert line in first
+        output.seek(0)
+        output.truncate()
+        game.play_turn("e4")
+        game.show_board()
+        # only e2 and e4 are redrawn, then the cursor goes under the board
+        assert output.getvalue() == (
+            "\u001b[9;13H  \u001b[7;13H♟ "  # ]]
+            "\u001b[13;1H\u001b[J"  # ]]
+        )
+        output.seek(0)
+        output.truncate()
+        game.show_board()
+        assert output.getvalue() == "\u001b[13;1H\u001b[J"  # ]]
+
+
+class TestAnalysis:
+    def test_cached(self, tmp_path):
+        path = str(tmp_path / "analysis.sqlite")
+        cache = analysis.AnalysisCache(path)
+        game = Game.from_fen("6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        result = cache.analyse(game, 2)
+        assert result.best_move == uci_to_move("a1a8")
+        assert set(result.legal_moves) == set(game.legal_moves)
+        assert result.status is None and result.depth == 2
+        assert cache.analyse(game, 1) is result
+        cache.close()
+        reopened = analysis.AnalysisCache(path)
+        assert reopened.get(result.key) == result
+        # a deeper request searches again and replaces the result
+        assert reopened.analyse(game, 3).depth == 3
+        assert reopened.get(result.key).depth == 3
+        reopened.close()
+
+    def test_game_over(self):
+        cache = analysis.AnalysisCache()
+        game = Game()
+        for move in ["f3", "e5", "g4", "Qh4"]:
+            game.play_turn(move)
+        result = cache.analyse(game, 3)
+        assert result.status == "checkmate" and result.best_move is None
+        assert result.legal_moves == ()
+
+    def test_depth_aware(self):
+        cache = analysis.AnalysisCache()
+        key = (1 << 64) - 5  # keys use all 64 bits
+        deep = analysis.Analysis(key, uci_to_move("e2e4"), 30, 6, (), None)
+        cache.put(deep)
+        shallow = deep._replace(best_move=uci_to_move("d2d4"), depth=2)
+        assert cache.put(shallow) == deep
+        cache.memory.clear()
+        assert cache.get(key) == deep
+
+    def test_lru_eviction(self):
+        cache = analysis.AnalysisCache(max_positions=16, memory_positions=4)
+        for key in range(1, 17):
+            cache.put(analysis.Analysis(key, None, 0, 1, (), None))
+        cache.get(1)
+        cache.put(analysis.Analysis(17, None, 0, 1, (), None))
+        assert cache.count <= 16
+        cache.memory.clear()
+        assert cache.get(1) is not None and cache.get(17) is not None
+        assert cache.get(2) is None
+
+
+class TestEvasions:
+    def brute_force(self, player):
+        legal = {}
+        for piece in player.pieces:
+            if piece.pos and (moves := piece.legal_moves_within(None)):
+                legal[piece] = moves
+        return legal
+
+    def test_not_in_check(self, new_game):
+        game, board, white, black = new_game
+        assert white.evasions is None
+
+    def test_block_or_capture(self):
+        game = Game.from_fen("4k3/8/8/8/1b6/P7/2P1PP2/1N1QK3 w - - 0 1")
+        white = game.whose_turn
+        assert white.evasions == {(1, 3), (2, 2), (3, 1)}
+        assert white.legal_moves_all == self.brute_force(white)
+        assert set(game.legal_moves) == {
+            uci_to_move(uci) for uci in ["a3b4", "c2c3", "b1c3", "b1d2", "d1d2", "e1f1"]
+        }
+
+    def test_double_check(self):
+        # only the king can move, even though the knight could be taken
+        game = Game.from_fen("4r1k1/8/8/8/8/3n4/3P1P2/3QK3 w - - 0 1")
+        white = game.whose_turn
+        assert white.evasions == set()
+        assert white.legal_moves_all == {white.king: [(5, 0)]}
+        assert white.legal_moves_all == self.brute_force(white)
+
+    def test_en_passant(self):
+        game = Game.from_fen("8/8/8/2k5/3Pp3/8/8/7K b - d3 0 1")
+        black = game.whose_turn
+        assert black.evasions == {(3, 3), (3, 2)}
+        assert uci_to_move("e4d3") in game.legal_moves
+
+    def test_agrees_with_brute_force(self):
+        checked = 0
+        moves = format_pgn("kasparov_topalov_1999.pgn").split("\n")[:-1]
+        for game in replay(moves):
+            for player in game.board.players.values():
+                if player.king.in_check:
+                    checked += 1
+                assert set(player.checkers) == {
+                    piece
+                    for piece in player.other_player.pieces
+                    if piece.pos and player.king.pos in piece.threatens
+                }
+                assert player.legal_moves_all == self.brute_force(player)
+        assert checked
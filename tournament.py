@@ -0,0 +1,323 @@
+"""Engine matches: plays games between two engine configurations from a suite of
+opening positions, spread over a pool of processes, writing each game to PGN as
+it finishes and measuring the Elo difference with an SPRT to decide whether a
+change is an improvement."""
+
+import argparse
+import importlib
+import math
+import sys
+from collections import Counter, namedtuple
+from multiprocessing import Pool
+
+from chess import STARTPOS, Game, position_key
+from engine import EnginePlayer, TranspositionTable
+from pgn import format_game, move_to_san
+
+# A configuration of the engine to play with. search names the Search class to use
+# as "module:Class", so that a modified search or evaluation can be played against
+# the original one. depth, movetime (seconds) and nodes limit every move.
+Engine = namedtuple(
+    "Engine",
+    ["name", "depth", "movetime", "nodes", "tt_size", "search"],
+    defaults=(None, None, None, 1 << 20, "engine:Search"),
+)
+# base clock and increment in seconds
+TimeControl = namedtuple("TimeControl", ["base", "increment"])
+
+# games still going after this many plies are adjudicated as draws
+MAX_PLIES = 300
+
+
+def parse_engine(spec):
+    """An Engine from a spec like "name:depth=3,nodes=20000,search=mymodule:Search" """
+    name, _, options = spec.partition(":")
+    fields = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        if key not in Engine._fields[1:]:
+            raise ValueError(f"unknown engine option {key}")
+        if key == "search":
+            fields[key] = value
+        else:
+            fields[key] = float(value) if key == "movetime" else int(value)
+    return Engine(name, **fields)
+
+
+def parse_time_control(text):
+    """A TimeControl from PGN style "base+increment" seconds, e.g. "10+0.1" """
+    base, _, increment = text.partition("+")
+    return TimeControl(float(base), float(increment or 0))
+
+
+def load_search(path):
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def draw_reason(game, seen, quiet_plies):
+    """Why the game's position is drawn by rule, or None"""
+    if seen[position_key(game.snapshot())] >= 3:
+        return "threefold repetition"
+    if quiet_plies >= 100:
+        return "fifty-move rule"
+    players = game.board.players.values()
+    if all(p.type == "king" for player in players for p in player.pieces if p.pos):
+        return "insufficient material"
+    return None
+
+
+def play(white, black, opening=STARTPOS, time_control=None, max_plies=MAX_PLIES):
+    """Play one game between two Engines from an opening FEN. Returns a dict of
+    the players, opening, SAN moves, result and termination."""
+    game = Game.from_fen(opening)
+    players = {}
+    for color, engine in (("white", white), ("black", black)):
+        players[color] = EnginePlayer(
+            clock=time_control.base if time_control else None,
+            increment=time_control.increment if time_control else 0,
+            movetime=engine.movetime,
+            nodes=engine.nodes,
+            depth=engine.depth,
+            tt=TranspositionTable(engine.tt_size),
+            search=load_search(engine.search),
+        )
+    seen = Counter([position_key(game.snapshot())])
+    moves, quiet_plies = [], 0
+    result = termination = None
+    while result is None:
+        color = game.whose_turn.color
+        winner = "0-1" if color == "white" else "1-0"
+        if status := game.game_over:
+            if status == "checkmate":
+                result, termination = winner, "checkmate"
+            else:
+                result, termination = "1/2-1/2", status
+            break
+        if reason := draw_reason(game, seen, quiet_plies):
+            result, termination = "1/2-1/2", reason
+            break
+        if len(moves) >= max_plies:
+            result, termination = "1/2-1/2", "adjudicated after max plies"
+            break
+        move = players[color].choose_move(game)
+        if players[color].flagged:
+            result, termination = winner, "time forfeit"
+            break
+        start_square, coord, _ = move
+        moves.append(move_to_san(game, move))
+        if game.board[start_square].type == "pawn" or game.board[coord] is not None:
+            quiet_plies = 0
+        else:
+            quiet_plies += 1
+        game.play_move(move)
+        seen[position_key(game.snapshot())] += 1
+    return {
+        "white": white.name,
+        "black": black.name,
+        "opening": opening,
+        "moves": moves,
+        "result": result,
+        "termination": termination,
+    }
+
+
+def _play_task(task):
+    index, white, black, opening, time_control, max_plies = task
+    return index, play(white, black, opening, time_control, max_plies)
+
+
+def pgn_text(game, index, time_control=None):
+    """PGN for a game returned by play(), numbered as round index + 1"""
+    headers = {
+        "Event": "Engine match",
+        "Site": "?",
+        "Round": str(index + 1),
+        "White": game["white"],
+        "Black": game["black"],
+        "Result": game["result"],
+        "SetUp": "1",
+        "FEN": game["opening"],
+        "Termination": game["termination"],
+    }
+    if time_control:
+        headers["TimeControl"] = f"{time_control.base:g}+{time_control.increment:g}"
+    first_turn = Game.from_fen(game["opening"]).turn
+    return format_game(headers, game["moves"], game["result"], first_turn)
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_difference(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+def score_variance(wins, draws, losses):
+    """Mean score per game and its variance"""
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (
+        wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score**2
+    ) / games
+    return score, variance
+
+
+def elo(wins, draws, losses):
+    """Elo difference implied by a score and its 95% error margin"""
+    games = wins + draws + losses
+    if not games:
+        return 0.0, math.inf
+    score, variance = score_variance(wins, draws, losses)
+    error = 1.96 * math.sqrt(variance / games)
+    margin = (elo_difference(score + error) - elo_difference(score - error)) / 2
+    return elo_difference(score), margin
+
+
+def sprt(wins, draws, losses, elo0, elo1, alpha=0.05, beta=0.05):
+    """Sequential probability ratio test of elo1 against elo0 (logistic Elo),
+    using the normal approximation of the score. Returns the log likelihood
+    ratio, its lower and upper bounds and "H0", "H1" or None while undecided."""
+    lower = math.log(beta / (1 - alpha))
+    upper = math.log((1 - beta) / alpha)
+    games = wins + draws + losses
+    if not games:
+        return 0.0, lower, upper, None
+    score, variance = score_variance(wins, draws, losses)
+    if variance == 0:
+        return 0.0, lower, upper, None
+    score0, score1 = expected_score(elo0), expected_score(elo1)
+    llr = games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+    decision = "H1" if llr >= upper else "H0" if llr <= lower else None
+    return llr, lower, upper, decision
+
+
+def match(
+    engine,
+    opponent,
+    games,
+    openings=(STARTPOS,),
+    time_control=None,
+    processes=None,
+    pgn=None,
+    hypothesis=None,
+    max_plies=MAX_PLIES,
+):
+    """Play games between engine and opponent, each opening twice with colors
+    swapped, over a pool of processes (os.cpu_count() by default, processes=1
+    to stay in-process). Games are appended to the open text file pgn as they
+    finish. With hypothesis, an (elo0, elo1) pair, the match stops early once
+    the SPRT decides. Returns a summary from engine's point of view."""
+    tasks = []
+    for index in range(games):
+        opening = openings[index // 2 % len(openings)]
+        white, black = (engine, opponent) if index % 2 == 0 else (opponent, engine)
+        tasks.append((index, white, black, opening, time_control, max_plies))
+    counts = Counter()
+    decision = None
+
+    def record(index, game):
+        nonlocal decision
+        if game["result"] == "1/2-1/2":
+            counts["draws"] += 1
+        elif (game["result"] == "1-0") == (index % 2 == 0):
+            counts["wins"] += 1
+        else:
+            counts["losses"] += 1
+        if pgn is not None:
+            pgn.write(pgn_text(game, index, time_control))
+            pgn.flush()
+        if hypothesis:
+            decision = sprt(
+                counts["wins"], counts["draws"], counts["losses"], *hypothesis
+            )[3]
+        return decision is not None
+
+    if processes == 1:
+        for task in tasks:
+            if record(*_play_task(task)):
+                break
+    else:
+        with Pool(processes) as pool:
+            for index, game in pool.imap_unordered(_play_task, tasks):
+                if record(index, game):
+                    break
+    wins, draws, losses = counts["wins"], counts["draws"], counts["losses"]
+    difference, margin = elo(wins, draws, losses)
+    summary = {
+        "games": wins + draws + losses,
+        "wins": wins,
+        "draws": draws,
+        "losses": losses,
+        "elo": difference,
+        "elo_margin": margin,
+    }
+    if hypothesis:
+        llr, lower, upper, decision = sprt(wins, draws, losses, *hypothesis)
+        summary["sprt"] = {
+            "llr": llr,
+            "lower": lower,
+            "upper": upper,
+            "result": decision,
+        }
+    return summary
+
+
+def read_openings(path):
+    """Opening FENs (or EPD lines) from a file, one per line"""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("engine", help='e.g. "new:depth=3,search=mymodule:Search"')
+    parser.add_argument("opponent", help='e.g. "base:depth=3"')
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--openings", help="file of opening FENs, one per line")
+    parser.add_argument("--tc", help='time control in seconds, e.g. "10+0.1"')
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--pgn", help="append finished games to this PGN file")
+    parser.add_argument(
+        "--sprt", type=float, nargs=2, metavar=("ELO0", "ELO1"), help="stop early"
+    )
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    args = parser.parse_args(argv)
+    openings = read_openings(args.openings) if args.openings else [STARTPOS]
+    time_control = parse_time_control(args.tc) if args.tc else None
+    pgn = open(args.pgn, "a") if args.pgn else None
+    try:
+        summary = match(
+            parse_engine(args.engine),
+            parse_engine(args.opponent),
+            args.games,
+            openings,
+            time_control,
+            args.processes,
+            pgn,
+            args.sprt,
+            args.max_plies,
+        )
+    finally:
+        if pgn is not None:
+            pgn.close()
+    print(
+        f"{summary['games']} games: +{summary['wins']} ={summary['draws']} "
+        f"-{summary['losses']}, Elo {summary['elo']:+.1f} +/- {summary['elo_margin']:.1f}"
+    )
+    if "sprt" in summary:
+        test = summary["sprt"]
+        print(
+            f"SPRT: LLR {test['llr']:.2f} ({test['lower']:.2f}, {test['upper']:.2f}) "
+            f"{test['result'] or 'undecided'}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
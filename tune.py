@@ -0,0 +1,328 @@
+"""Texel tuning of the evaluation: fits engine.PIECE_VALUES and
+engine.PIECE_SQUARE_TABLES to game results by minimising the squared error
+between each position's result and a sigmoid of its evaluation.
+
+Positions (EPD lines with a c9 result opcode, as written by epd.py) are turned
+into feature arrays once and saved, and every pass over them is then a few
+vectorised numpy operations, split between worker processes that memory-map
+the saved arrays. Requires numpy.
+
+    python tune.py positions-*.epd --epochs 500 --checkpoint weights.json"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from collections import namedtuple
+from multiprocessing import Pool
+from time import perf_counter
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed when actually tuning
+    np = None
+
+import engine
+from chess import Game
+from epd import read_epd
+
+PIECE_ORDER = list(engine.PIECE_VALUES)
+# weights are the piece values in PIECE_ORDER, then each piece's square table
+PARAMETERS = len(PIECE_ORDER) * 65
+MAX_PIECES = 32
+RESULTS = {"1-0": 1.0, "1/2-1/2": 0.5, "0-1": 0.0}
+
+# For each position, the square table index (piece * 64 + square) of up to
+# MAX_PIECES pieces and their signs, +1 for white and -1 for black (0 pads the
+# unused slots), and the result for white
+Dataset = namedtuple("Dataset", ["squares", "signs", "results"])
+
+# the dataset of this worker process
+_dataset = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("numpy is required for tuning")
+
+
+def initial_weights():
+    """The engine's current evaluation parameters as a weight vector"""
+    _require_numpy()
+    weights = [engine.PIECE_VALUES[piece] for piece in PIECE_ORDER]
+    for piece in PIECE_ORDER:
+        weights.extend(engine.PIECE_SQUARE_TABLES[piece])
+    return np.array(weights, dtype=np.float64)
+
+
+def weights_to_tables(weights):
+    """(piece values, square tables) dicts, laid out like the engine's, from a
+    weight vector, rounded to whole centipawns"""
+    values = {piece: round(weights[i]) for i, piece in enumerate(PIECE_ORDER)}
+    offset = len(PIECE_ORDER)
+    tables = {
+        piece: [round(w) for w in weights[offset + i * 64 : offset + i * 64 + 64]]
+        for i, piece in enumerate(PIECE_ORDER)
+    }
+    return values, tables
+
+
+def extract(positions, size):
+    """A Dataset of up to size positions from (fen, result) pairs, setting each
+    one up on a single Game"""
+    _require_numpy()
+    squares = np.zeros((size, MAX_PIECES), dtype=np.int16)
+    signs = np.zeros((size, MAX_PIECES), dtype=np.int8)
+    results = np.zeros(size, dtype=np.float32)
+    game = Game()
+    count = 0
+    for i, (fen, result) in zip(range(size), positions):
+        game.set_fen(fen)
+        slot = 0
+        for color, player in game.board.players.items():
+            for piece in player.pieces:
+                if piece.pos:
+                    # same square numbering as engine.evaluate
+                    x, y = piece.pos
+                    square = (7 - y) * 8 + x if color == "white" else y * 8 + x
+                    squares[i, slot] = PIECE_ORDER.index(piece.type) * 64 + square
+                    signs[i, slot] = 1 if color == "white" else -1
+                    slot += 1
+        results[i] = result
+        count += 1
+    return Dataset(squares[:count], signs[:count], results[:count])
+
+
+def read_positions(paths):
+    """(fen, result) for every EPD line with a c9 result in the files at paths"""
+    for path in paths:
+        for fen, opcodes in read_epd(path):
+            if opcodes.get("c9") in RESULTS:
+                yield fen, RESULTS[opcodes["c9"]]
+
+
+def save_dataset(dataset, directory):
+    os.makedirs(directory, exist_ok=True)
+    for name, array in dataset._asdict().items():
+        np.save(os.path.join(directory, name + ".npy"), array)
+
+
+def load_dataset(directory, mmap_mode=None):
+    _require_numpy()
+    return Dataset(
+        *(
+            np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+            for name in Dataset._fields
+        )
+    )
+
+
+def evaluate(weights, squares, signs):
+    """Evaluation of each position for white, as engine.evaluate would give it
+    with these weights"""
+    values = weights[: len(PIECE_ORDER)][squares // 64]
+    values += weights[len(PIECE_ORDER) :][squares]
+    return (values * signs).sum(axis=1)
+
+
+def sigmoid(scores, k):
+    """Expected result for white at each evaluation"""
+    return 1 / (1 + 10 ** (-k * scores / 400))
+
+
+def error_and_gradient(weights, k, dataset, start=0, stop=None):
+    """Sum of squared errors over dataset[start:stop], its gradient with
+    respect to the weights and the number of positions"""
+    squares = np.asarray(dataset.squares[start:stop])
+    signs = np.asarray(dataset.signs[start:stop])
+    results = np.asarray(dataset.results[start:stop])
+    expected = sigmoid(evaluate(weights, squares, signs), k)
+    difference = expected - results
+    slope = 2 * difference * expected * (1 - expected) * k * math.log(10) / 400
+    per_piece = (slope[:, None] * signs).ravel()
+    squares = squares.ravel()
+    pieces = len(PIECE_ORDER)
+    gradient = np.concatenate(
+        [
+            np.bincount(squares // 64, weights=per_piece, minlength=pieces),
+            np.bincount(squares, weights=per_piece, minlength=pieces * 64),
+        ]
+    )
+    return float(difference @ difference), gradient, len(results)
+
+
+def _load_worker_dataset(directory):
+    global _dataset
+    _dataset = load_dataset(directory, mmap_mode="r")
+
+
+def _worker_error_and_gradient(task):
+    weights, k, start, stop = task
+    return error_and_gradient(weights, k, _dataset, start, stop)
+
+
+class Tuner:
+    """Gradient descent (Adam) on the mean squared error of the dataset saved in
+    directory, spread over processes worker processes (os.cpu_count() by
+    default, processes=1 to stay in-process). The sigmoid's scale k is fitted to
+    the starting weights unless given. With a checkpoint path, the weights are
+    saved there every checkpoint_every epochs, and tuning resumes from it if it
+    already exists."""
+
+    def __init__(
+        self,
+        directory,
+        processes=None,
+        k=None,
+        learning_rate=1.0,
+        checkpoint=None,
+        checkpoint_every=10,
+    ):
+        _require_numpy()
+        self.dataset = load_dataset(directory, mmap_mode="r")
+        self.size = len(self.dataset.results)
+        self.processes = processes or os.cpu_count()
+        self.pool = None
+        if self.processes > 1:
+            self.pool = Pool(self.processes, _load_worker_dataset, (directory,))
+        self.learning_rate = learning_rate
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.weights = initial_weights()
+        self.moments = np.zeros(PARAMETERS), np.zeros(PARAMETERS)
+        self.epoch = 0
+        self.k = k
+        if checkpoint and os.path.exists(checkpoint):
+            self.load_checkpoint(checkpoint)
+        if self.k is None:
+            self.k = self.fit_k()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def error_and_gradient(self, weights, k):
+        """Mean squared error and its gradient over the whole dataset"""
+        if self.pool is None:
+            parts = [error_and_gradient(weights, k, self.dataset)]
+        else:
+            bounds = np.linspace(0, self.size, self.processes + 1).astype(int)
+            tasks = [(weights, k, a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+            parts = self.pool.map(_worker_error_and_gradient, tasks)
+        error = sum(part[0] for part in parts)
+        gradient = sum(part[1] for part in parts)
+        return error / self.size, gradient / self.size
+
+    def error(self, k=None):
+        return self.error_and_gradient(self.weights, k or self.k)[0]
+
+    def fit_k(self, low=0.01, high=5.0, tolerance=1e-4):
+        """The sigmoid scale minimising the error of the current weights, found by
+        golden section search"""
+        ratio = (math.sqrt(5) - 1) / 2
+        while high - low > tolerance:
+            a, b = high - ratio * (high - low), low + ratio * (high - low)
+            if self.error(a) < self.error(b):
+                high = b
+            else:
+                low = a
+        return (low + high) / 2
+
+    def step(self, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        """One Adam update from the gradient over the whole dataset, returning
+        the error before it"""
+        error, gradient = self.error_and_gradient(self.weights, self.k)
+        first, second = self.moments
+        first *= beta1
+        first += (1 - beta1) * gradient
+        second *= beta2
+        second += (1 - beta2) * gradient**2
+        self.epoch += 1
+        corrected_first = first / (1 - beta1**self.epoch)
+        corrected_second = second / (1 - beta2**self.epoch)
+        self.weights -= (
+            self.learning_rate * corrected_first / (np.sqrt(corrected_second) + epsilon)
+        )
+        return error
+
+    def run(self, epochs, report=None):
+        """Run epochs steps, calling report(epoch, error, seconds) after each.
+        Returns the final error."""
+        for _ in range(epochs):
+            start = perf_counter()
+            error = self.step()
+            if report:
+                report(self.epoch, error, perf_counter() - start)
+            if self.checkpoint and self.epoch % self.checkpoint_every == 0:
+                self.save_checkpoint(self.checkpoint)
+        if self.checkpoint:
+            self.save_checkpoint(self.checkpoint)
+        return self.error()
+
+    def save_checkpoint(self, path):
+        values, tables = weights_to_tables(self.weights)
+        state = {
+            "epoch": self.epoch,
+            "k": self.k,
+            "weights": self.weights.tolist(),
+            "moments": [moment.tolist() for moment in self.moments],
+            "piece_values": values,
+            "piece_square_tables": tables,
+        }
+        # write then rename, so an interrupted save never leaves a broken file
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def load_checkpoint(self, path):
+        with open(path) as f:
+            state = json.load(f)
+        self.weights = np.array(state["weights"], dtype=np.float64)
+        self.moments = tuple(np.array(moment) for moment in state["moments"])
+        self.epoch = state["epoch"]
+        self.k = self.k or state["k"]
+
+
+def apply(path):
+    """Use the weights in a checkpoint for engine.evaluate in this process"""
+    with open(path) as f:
+        state = json.load(f)
+    engine.PIECE_VALUES.update(state["piece_values"])
+    engine.PIECE_SQUARE_TABLES.update(state["piece_square_tables"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("epd", nargs="*", help="EPD files to extract features from")
+    parser.add_argument("--dataset", default="features", help="feature directory")
+    parser.add_argument("--size", type=int, help="positions to extract (default all)")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--learning-rate", type=float, default=1.0)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--k", type=float, help="sigmoid scale (default: fitted)")
+    parser.add_argument("--checkpoint", default="weights.json")
+    args = parser.parse_args(argv)
+    if args.epd:
+        size = args.size or sum(1 for _ in read_positions(args.epd))
+        save_dataset(extract(read_positions(args.epd), size), args.dataset)
+    tuner = Tuner(
+        args.dataset, args.processes, args.k, args.learning_rate, args.checkpoint
+    )
+    print(f"{tuner.size} positions, k = {tuner.k:.3f}, error {tuner.error():.6f}")
+    try:
+        error = tuner.run(
+            args.epochs,
+            lambda epoch, error, seconds: print(
+                f"epoch {epoch}: error {error:.6f} ({seconds:.2f}s)"
+            ),
+        )
+    finally:
+        tuner.close()
+    print(f"final error {error:.6f}, weights saved to {args.checkpoint}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""UCI front end, so chess GUIs and tournament managers can drive the engine over
+stdin and stdout: python uci.py"""
+
+import sys
+import threading
+
+from chess import STARTPOS, Game, move_to_uci, uci_to_move
+from engine import MATE, Search, TimeManager, TranspositionTable, is_mate_score
+
+GO_OPTIONS = [
+    "depth",
+    "movetime",
+    "nodes",
+    "wtime",
+    "btime",
+    "winc",
+    "binc",
+    "movestogo",
+]
+
+
+def format_score(score):
+    if is_mate_score(score):
+        plies = MATE - abs(score)
+        moves = (plies + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+
+class UciEngine:
+    def __init__(self, output=None):
+        self.output = output or sys.stdout
+        self.output_lock = threading.Lock()
+        self.game = Game()
+        self.base = STARTPOS
+        self.moves = []
+        self.hash_mb = 16
+        self.tt = TranspositionTable(self.hash_mb << 20)
+        self.multipv = 1
+        self.search = None
+        self.thread = None
+        self.stop_requested = threading.Event()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        """Process one command, returning False once the engine should quit"""
+        command, *args = line.split() or [""]
+        if command == "uci":
+            self.send("id name odin-chess")
+            self.send("id author strbytes")
+            self.send(
+                f"option name Hash type spin default {self.hash_mb} min 1 max 4096"
+            )
+            self.send("option name MultiPV type spin default 1 min 1 max 256")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(args)
+        elif command == "ucinewgame":
+            self.stop()
+            self.tt.clear()
+        elif command == "position":
+            self.stop()
+            self.set_position(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        return True
+
+    def set_option(self, args):
+        if "name" not in args or "value" not in args:
+            return
+        name = " ".join(args[args.index("name") + 1 : args.index("value")]).lower()
+        value = " ".join(args[args.index("value") + 1 :])
+        if name == "hash":
+            self.hash_mb = max(1, int(value))
+            self.tt = TranspositionTable(self.hash_mb << 20)
+        elif name == "multipv":
+            self.multipv = max(1, int(value))
+
+    def set_position(self, args):
+        """Set up a position command's position. When it continues the last
+        position given, only the new moves are played."""
+        moves = args[args.index("moves") + 1 :] if "moves" in args else []
+        if args[0] == "startpos":
+            base = STARTPOS
+        elif args[0] == "fen":
+            end = args.index("moves") if "moves" in args else len(args)
+            base = " ".join(args[1:end])
+        else:
+            return
+        if base != self.base or moves[: len(self.moves)] != self.moves:
+            self.game.set_fen(base)
+            self.base, self.moves = base, []
+        for move in moves[len(self.moves) :]:
+            self.game.play_move(uci_to_move(move))
+            self.moves.append(move)
+
+    def go(self, args):
+        options = {}
+        for name, value in zip(args, args[1:]):
+            if name in GO_OPTIONS:
+                options[name] = int(value)
+        infinite = "infinite" in args or "ponder" in args
+        white = self.game.turn % 2 == 0
+        clock = options.get("wtime" if white else "btime")
+        movetime = options.get("movetime")
+        manager = None
+        if not infinite and (clock is not None or movetime is not None):
+            manager = TimeManager(
+                clock=None if clock is None else clock / 1000,
+                increment=options.get("winc" if white else "binc", 0) / 1000,
+                moves_to_go=options.get("movestogo"),
+                movetime=None if movetime is None else movetime / 1000,
+            )
+        self.search = Search(
+            self.game,
+            depth=options.get("depth"),
+            nodes=options.get("nodes"),
+            multipv=self.multipv,
+            tt=self.tt,
+            time_manager=manager,
+        )
+        self.stop_requested.clear()
+        self.thread = threading.Thread(
+            target=self.think, args=(self.search, infinite), daemon=True
+        )
+        self.thread.start()
+
+    def think(self, search, infinite):
+        for info in search.iterate():
+            nps = int(info.nodes / info.seconds) if info.seconds else 0
+            for i, line in enumerate(info.lines, 1):
+                self.send(
+                    f"info depth {info.depth} multipv {i} score {format_score(line.score)}"
+                    f" nodes {info.nodes} nps {nps} time {int(info.seconds * 1000)}"
+                    f" pv {' '.join(move_to_uci(m) for m in line.pv)}"
+                )
+        # in infinite mode the best move may only be sent after stop
+        if infinite:
+            self.stop_requested.wait()
+        if search.time_manager is not None:
+            report = search.time_manager.report()
+            self.send(
+                f"info string time used {report['used'] * 1000:.0f} of "
+                f"{report['planned'] * 1000:.0f} ms planned, "
+                f"{report['maximum'] * 1000:.0f} ms maximum"
+            )
+        if search.info:
+            self.send(f"bestmove {move_to_uci(search.info.lines[0].move)}")
+        else:
+            self.send("bestmove 0000")
+
+    def stop(self):
+        """Stop any running search and wait for it to report its best move"""
+        if self.thread is not None:
+            self.search.stop()
+            self.stop_requested.set()
+            self.thread.join()
+            self.thread = None
+
+    def wait(self):
+        """Wait for a running search to finish on its own"""
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self, input=None):
+        for line in input or sys.stdin:
+            try:
+                if not self.handle(line.strip()):
+                    break
+            except (ValueError, IndexError) as e:
+                self.send(f"info string {e}")
+        self.stop()
+
+
+if __name__ == "__main__":
+    UciEngine().run()